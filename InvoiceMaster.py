@@ -2,6 +2,7 @@
 import sys
 import os
 import platform
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 
 # 确保 src 目录在 Python 路径中
@@ -13,6 +14,9 @@ from src.ui.main_window import MainWindow
 from src.ui.widgets import DynamicSplashScreen
 
 if __name__ == "__main__":
+    # 打包后的程序在多进程并行排版时需要此调用
+    multiprocessing.freeze_support()
+    
     # 初始化日志系统
     logger = LogManager.setup_logging()
     logger.info("=" * 60)
@@ -3,9 +3,14 @@ from paddleocr import PaddleOCR
 import base64
 import os
 import tempfile
-import re
 import fitz  # PyMuPDF
 import logging
+import queue
+import threading
+import time
+import uuid
+
+from invoice_parser import parse_invoice_smart
 
 # ================= 配置区域 =================
 os.environ['DISABLE_MODEL_SOURCE_CHECK'] = 'True'
@@ -13,6 +18,9 @@ logging.getLogger('ppocr').setLevel(logging.WARNING)
 
 app = Flask(__name__)
 
+# PaddleOCR 推理串行化锁
+ocr_lock = threading.Lock()
+
 # ================= 模型加载 =================
 print("-" * 30)
 print("正在初始化 PaddleOCR 模型...")
@@ -39,6 +47,73 @@ def health():
     return jsonify({'status': 'error'}), 500
 
 
+def recognize_image(img_data, file_type=None):
+    """对单张图片/PDF执行 OCR 并解析发票字段（同步接口与任务队列共用）"""
+    is_pdf = img_data[:4] == b'%PDF' or file_type == 'pdf'
+    suffix = '.pdf' if is_pdf else '.png'
+    
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(img_data)
+        temp_path = f.name
+    
+    img_path_to_ocr = temp_path
+
+    try:
+        if is_pdf:
+            doc = fitz.open(temp_path)
+            page = doc[0]
+            mat = fitz.Matrix(2.0, 2.0) 
+            pix = page.get_pixmap(matrix=mat)
+            img_path_to_ocr = temp_path.replace('.pdf', '.png')
+            pix.save(img_path_to_ocr)
+            doc.close()
+        
+        # 【修复】新版PaddleOCR不支持cls参数，直接调用
+        # 模型实例非线程安全，同步接口与任务线程串行访问
+        with ocr_lock:
+            result = ocr.ocr(img_path_to_ocr)
+        
+        texts = []
+        # 新版PaddleOCR可能返回None或空列表
+        if result is not None:
+            for page_result in result:
+                if page_result is not None:
+                    for line in page_result:
+                        if line and len(line) > 1 and line[1]:
+                            # line[1] 可能是 (text, confidence) 或直接是 text
+                            if isinstance(line[1], (tuple, list)):
+                                texts.append(str(line[1][0]))
+                            else:
+                                texts.append(str(line[1]))
+        
+        print(f"识别成功，行数: {len(texts)}")
+        
+        if not texts:
+            # 没有识别到文字，返回空结果
+            return {
+                'success': True,
+                'amount': 0,
+                'date': '',
+                'number': '',
+                'code': '',
+                'buyer': '',
+                'seller': '',
+                'raw_text': [],
+                'message': 'No text detected'
+            }
+        
+        full_text = '【' + '】【'.join(texts) + '】'
+        invoice_data = parse_invoice_smart(full_text, texts)
+        invoice_data['success'] = True
+        return invoice_data
+        
+    finally:
+        try:
+            if os.path.exists(temp_path): os.unlink(temp_path)
+            if is_pdf and os.path.exists(img_path_to_ocr): os.unlink(img_path_to_ocr)
+        except: pass
+
+
 @app.route('/ocr/invoice', methods=['POST'])
 def ocr_invoice():
     if not ocr:
@@ -54,68 +129,7 @@ def ocr_invoice():
         except:
             return jsonify({'error': 'Invalid Base64', 'success': False}), 400
         
-        is_pdf = img_data[:4] == b'%PDF' or data.get('type') == 'pdf'
-        suffix = '.pdf' if is_pdf else '.png'
-        
-        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
-            f.write(img_data)
-            temp_path = f.name
-        
-        img_path_to_ocr = temp_path
-
-        try:
-            if is_pdf:
-                doc = fitz.open(temp_path)
-                page = doc[0]
-                mat = fitz.Matrix(2.0, 2.0) 
-                pix = page.get_pixmap(matrix=mat)
-                img_path_to_ocr = temp_path.replace('.pdf', '.png')
-                pix.save(img_path_to_ocr)
-                doc.close()
-            
-            # 【修复】新版PaddleOCR不支持cls参数，直接调用
-            result = ocr.ocr(img_path_to_ocr)
-            
-            texts = []
-            # 新版PaddleOCR可能返回None或空列表
-            if result is not None:
-                for page_result in result:
-                    if page_result is not None:
-                        for line in page_result:
-                            if line and len(line) > 1 and line[1]:
-                                # line[1] 可能是 (text, confidence) 或直接是 text
-                                if isinstance(line[1], (tuple, list)):
-                                    texts.append(str(line[1][0]))
-                                else:
-                                    texts.append(str(line[1]))
-            
-            print(f"识别成功，行数: {len(texts)}")
-            
-            if not texts:
-                # 没有识别到文字，返回空结果
-                return jsonify({
-                    'success': True,
-                    'amount': 0,
-                    'date': '',
-                    'number': '',
-                    'code': '',
-                    'buyer': '',
-                    'seller': '',
-                    'raw_text': [],
-                    'message': 'No text detected'
-                })
-            
-            full_text = '【' + '】【'.join(texts) + '】'
-            invoice_data = parse_invoice_smart(full_text, texts)
-            invoice_data['success'] = True
-            
-            return jsonify(invoice_data)
-            
-        finally:
-            try:
-                if os.path.exists(temp_path): os.unlink(temp_path)
-                if is_pdf and os.path.exists(img_path_to_ocr): os.unlink(img_path_to_ocr)
-            except: pass
+        return jsonify(recognize_image(img_data, data.get('type')))
                 
     except Exception as e:
         import traceback
@@ -124,197 +138,135 @@ def ocr_invoice():
         return jsonify({'error': str(e), 'success': False}), 500
 
 
-def parse_invoice_smart(full_text, raw_list):
-    result = {
-        'code': '', 'number': '', 'date': '', 'amount': 0,
-        'buyer': '', 'seller': '', 'raw_text': raw_list
+# ================= 异步任务队列 =================
+# 大批量识别时客户端无需长时间占用连接：
+# POST /ocr/jobs 提交后立即返回 job_id，结果通过 GET /ocr/jobs/<id> 查询（支持 wait 长轮询）
+
+JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', '1'))
+JOB_TTL = int(os.environ.get('OCR_JOB_TTL', '3600'))   # 已完成任务保留时间（秒）
+JOB_MAX_WAIT = 60                                      # 长轮询最长等待（秒）
+
+jobs = {}                       # job_id -> job dict
+jobs_cond = threading.Condition()
+job_queue = queue.Queue()       # (job_id, item_index, img_data, file_type)
+
+
+def _job_view(job):
+    """任务对外展示格式"""
+    return {
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'total': len(job['results']),
+        'completed': job['completed'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at'],
+        'results': job['results'],
     }
-    
-    # 金额（优先获取价税合计/含税金额）
-    # [V3.6 修复] 增强金额识别，处理OCR将"价税合计"和金额分成不同行的情况
-    try:
-        # === 第一阶段：在完整文本中搜索（处理分行情况）===
-        # 将所有文本合并，用空格分隔（模拟连续文本）
-        merged_text = ' '.join(raw_list)
-        
-        # 第一优先级：明确的"价税合计"或"小写"后的金额（这是含税总金额）
-        # 增加更宽松的匹配模式，处理OCR分行情况
-        total_patterns = [
-            r'(?:价税合计|价税\s*合\s*计)[^0-9¥￥]*[¥￥]?\s*[:：]?\s*(\d+[,，]?\d*\.?\d*)',  # 价税合计格式
-            r'[（\(]小写[）\)]\s*[¥￥]\s*(\d+[,，]?\d*\.\d{2})',  # (小写) ¥22.50 格式（精确匹配）
-            r'小写[）\)]\s*[¥￥]\s*(\d+[,，]?\d*\.\d{2})',  # 小写) ¥22.50 格式
-            r'[（\(]\s*小写\s*[）\)]\s*[¥￥]\s*(\d+[,，]?\d*\.?\d*)',  # ( 小写 ) ¥22.50 格式
-            r'小写[^0-9¥￥]*[¥￥]\s*(\d+[,，]?\d*\.\d{2})',  # 小写...¥22.50 宽松格式
-            r'税\s*合\s*计[^0-9¥￥]*[¥￥]?\s*(\d+[,，]?\d*\.?\d*)',  # 仅"税合计"
-        ]
-        
-        for pattern in total_patterns:
-            total_regex = re.compile(pattern)
-            # 先在合并文本中搜索
-            match = total_regex.search(merged_text)
-            if match:
-                amount_str = match.group(1).replace(',', '').replace('，', '')
-                result['amount'] = float(amount_str)
-                break
-            # 再逐行搜索
-            if result['amount'] == 0:
-                for txt in raw_list:
-                    match = total_regex.search(txt)
-                    if match:
-                        amount_str = match.group(1).replace(',', '').replace('，', '')
-                        result['amount'] = float(amount_str)
-                        break
-                if result['amount'] > 0:
-                    break
-        
-        # === 第二阶段：处理相邻行的情况 ===
-        # OCR 有时会将 "价税合计" 和 "¥100.00" 识别为相邻的两行
-        if result['amount'] == 0:
-            for i, txt in enumerate(raw_list):
-                if '价税合计' in txt or '小写' in txt or '税合计' in txt:
-                    # 在当前行和下几行中查找金额
-                    for j in range(0, min(3, len(raw_list) - i)):
-                        amount_match = re.search(r'[¥￥]?\s*(\d+[,，]?\d*\.\d{2})', raw_list[i + j])
-                        if amount_match:
-                            amount_str = amount_match.group(1).replace(',', '').replace('，', '')
-                            result['amount'] = float(amount_str)
-                            break
-                    if result['amount'] > 0:
-                        break
-        
-        # 第三优先级：处理"合计金额 ¥100（含税/未含税）"格式
-        if result['amount'] == 0:
-            # 检查是否有"含税"和"未含税"标记
-            has_tax_inclusive = '含税' in full_text and '未含税' not in full_text
-            has_tax_exclusive = '未含税' in full_text or '不含税' in full_text
-            
-            combined_regex = re.compile(r'合计金额\s*[¥￥]?\s*(\d+[,，]?\d*\.?\d*)')
-            for txt in raw_list:
-                match = combined_regex.search(txt)
-                if match:
-                    amount_str = match.group(1).replace(',', '').replace('，', '')
-                    amount_val = float(amount_str)
-                    if has_tax_exclusive:
-                        # 这是未含税金额，存到额外字段，后续可能需要加税
-                        result['amount_without_tax'] = str(amount_val)
-                        # 仍然设置为主金额（如果没有其他来源）
-                        result['amount'] = amount_val
-                    else:
-                        result['amount'] = amount_val
-                    break
-        
-        # 第四优先级：标准 ¥ 符号后的金额（但要排除不含税金额）
-        if result['amount'] == 0:
-            # 收集所有 ¥ 后的金额
-            all_yen_amounts = []
-            standard_regex = re.compile(r'[¥￥]\s*[:：]?\s*(\d+[,，]?\d*\.?\d*)')
-            for txt in raw_list:
-                for match in standard_regex.finditer(txt):
-                    try:
-                        amount_str = match.group(1).replace(',', '').replace('，', '')
-                        val = float(amount_str)
-                        if val > 0.5:  # 排除太小的值
-                            all_yen_amounts.append(val)
-                    except: pass
-            
-            # 通常价税合计是最大的金额
-            if all_yen_amounts:
-                result['amount'] = max(all_yen_amounts)
-        
-        # 火车票/机票格式：票价: ¥9.00
-        if result['amount'] == 0:
-            ticket_regex = re.compile(r'票价[：:]\s*[¥￥]?\s*(\d+\.?\d*)')
-            for txt in raw_list:
-                match = ticket_regex.search(txt)
-                if match:
-                    result['amount'] = float(match.group(1))
-                    break
-        
-        # 财政票据格式：(小写) 6.80
-        if result['amount'] == 0:
-            fiscal_regex = re.compile(r'[（\(]小写[）\)]\s*(\d+\.?\d*)')
-            for txt in raw_list:
-                match = fiscal_regex.search(txt)
-                if match:
-                    result['amount'] = float(match.group(1))
-                    break
-        
-        # 最后回退：取所有金额中的最大值（通常价税合计最大）
-        if result['amount'] == 0:
-            all_nums = re.findall(r'(\d+\.\d{2})', full_text)
-            valid = [float(x) for x in all_nums if 1 < float(x) < 100000000]
-            if valid:
-                result['amount'] = max(valid)
-    except: pass
-
-    # 发票号码
-    try:
-        m20 = re.search(r'(\d{20})', full_text)
-        if m20:
-            result['number'] = m20.group(1)
-        else:
-            m8 = re.findall(r'(?<!\d)(\d{8})(?!\d)', full_text)
-            real = [c for c in m8 if not c.startswith('202')]
-            if real: result['number'] = real[0]
-            elif m8: result['number'] = m8[0]
-    except: pass
 
-    # 发票代码
-    try:
-        if len(result['number']) != 20:
-            codes = re.findall(r'(?<!\d)(\d{10}|\d{12})(?!\d)', full_text)
-            codes = [c for c in codes if c != result['number']]
-            if codes: result['code'] = codes[0]
-    except: pass
 
-    # 日期
-    try:
-        date_match = re.search(r'(\d{4})\D+(\d{1,2})\D+(\d{1,2})', full_text)
-        if date_match:
-            y, m, d = date_match.groups()
-            result['date'] = f"{y}-{int(m):02d}-{int(d):02d}"
-    except: pass
+def _purge_expired_jobs():
+    """清理过期任务（调用方需持有 jobs_cond）"""
+    now = time.time()
+    expired = [jid for jid, job in jobs.items()
+               if job['finished_at'] and now - job['finished_at'] > JOB_TTL]
+    for jid in expired:
+        del jobs[jid]
 
-    # 购买方
-    try:
-        # 标准格式
-        m = re.search(r'购\s*买\s*方.*?名\s*称[：:]\s*([^\n\r【】]{5,50})', full_text)
-        if m: 
-            result['buyer'] = m.group(1).strip()
-        else:
-            # 财政票据：交款人
-            m2 = re.search(r'交款人[：:]*\s*([^\n\r【】]{2,50})', full_text)
-            if m2: result['buyer'] = m2.group(1).strip()
-    except: pass
 
-    # 销售方
-    try:
-        m = re.search(r'销\s*售\s*方.*?名\s*称[：:]\s*([^\n\r【】]{5,50})', full_text)
-        if m: 
-            result['seller'] = m.group(1).strip()
+def _job_worker():
+    """后台识别线程：逐条消费队列"""
+    while True:
+        job_id, item_idx, img_data, file_type = job_queue.get()
+        try:
+            with jobs_cond:
+                job = jobs.get(job_id)
+                if job is None:
+                    continue
+                job['status'] = 'running'
+            try:
+                item_result = recognize_image(img_data, file_type)
+            except Exception as e:
+                print(f"Job {job_id}[{item_idx}] Error: {e}")
+                item_result = {'success': False, 'error': str(e)}
+            with jobs_cond:
+                job['results'][item_idx] = item_result
+                job['completed'] += 1
+                if job['completed'] >= len(job['results']):
+                    job['status'] = 'done'
+                    job['finished_at'] = time.time()
+                jobs_cond.notify_all()
+        finally:
+            job_queue.task_done()
+
+
+for _ in range(max(1, JOB_WORKERS)):
+    threading.Thread(target=_job_worker, daemon=True).start()
+
+
+@app.route('/ocr/jobs', methods=['POST'])
+def submit_ocr_job():
+    if not ocr:
+        return jsonify({'error': 'Model not loaded', 'success': False}), 500
+
+    data = request.json or {}
+    if 'images' in data:
+        entries = data['images']
+    elif 'image' in data:
+        entries = [data['image']]
+    else:
+        return jsonify({'error': 'No image provided', 'success': False}), 400
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'No image provided', 'success': False}), 400
+
+    # images 中每项可以是 Base64 字符串，或 {"image": ..., "type": "pdf"}
+    decoded = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            b64, file_type = entry.get('image', ''), entry.get('type')
         else:
-            # 财政票据：收款单位
-            m2 = re.search(r'收款单位[：:]*\s*([^\n\r【】]{2,50})', full_text)
-            if m2: result['seller'] = m2.group(1).strip()
-    except: pass
-    
-    # 发票类型识别
+            b64, file_type = entry, data.get('type')
+        try:
+            decoded.append((base64.b64decode(b64), file_type))
+        except:
+            return jsonify({'error': 'Invalid Base64', 'success': False}), 400
+
+    job_id = uuid.uuid4().hex
+    with jobs_cond:
+        _purge_expired_jobs()
+        jobs[job_id] = {
+            'id': job_id,
+            'status': 'queued',
+            'results': [None] * len(decoded),
+            'completed': 0,
+            'created_at': time.time(),
+            'finished_at': None,
+        }
+    for i, (img_data, file_type) in enumerate(decoded):
+        job_queue.put((job_id, i, img_data, file_type))
+
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'queued', 'total': len(decoded)}), 202
+
+
+@app.route('/ocr/jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    # wait=N：任务未完成时最多阻塞 N 秒（长轮询）
     try:
-        if '铁路' in full_text and '客票' in full_text:
-            result['invoice_type'] = '铁路电子客票'
-        elif '财政' in full_text and '票据' in full_text:
-            result['invoice_type'] = '财政电子票据'
-        elif '非税' in full_text:
-            result['invoice_type'] = '财政电子票据'
-        elif '专用发票' in full_text:
-            result['invoice_type'] = '增值税专用发票'
-        elif '普通发票' in full_text:
-            result['invoice_type'] = '增值税普通发票'
-        elif '电子发票' in full_text:
-            result['invoice_type'] = '增值税电子普通发票'
-    except: pass
-    
-    return result
+        wait = min(float(request.args.get('wait', 0)), JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0
+
+    deadline = time.time() + wait
+    with jobs_cond:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found', 'success': False}), 404
+        while job['status'] != 'done':
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            jobs_cond.wait(remaining)
+        return jsonify(_job_view(job))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+"""
+parse_invoice_smart 微基准测试
+
+用法:
+    python bench_parser.py [重复次数]
+
+读取 fixtures/ocr_lines.json 中的 OCR 行样本，先校验解析结果与 expected 一致，
+再统计每次解析的平均耗时。无需加载 PaddleOCR 模型。
+"""
+import json
+import os
+import sys
+import time
+
+from invoice_parser import parse_invoice_smart
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ocr_lines.json')
+
+
+def load_fixtures():
+    with open(FIXTURES, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check(fixtures):
+    """校验解析结果，返回失败数"""
+    failures = 0
+    for fx in fixtures:
+        lines = fx['lines']
+        result = parse_invoice_smart('【' + '】【'.join(lines) + '】', lines)
+        for key, want in fx.get('expected', {}).items():
+            got = result.get(key)
+            if got != want:
+                failures += 1
+                print(f"  ✗ {fx['name']}: {key} = {got!r}，期望 {want!r}")
+    return failures
+
+
+def bench(fixtures, repeat):
+    samples = [('【' + '】【'.join(fx['lines']) + '】', fx['lines']) for fx in fixtures]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for full_text, lines in samples:
+            parse_invoice_smart(full_text, lines)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(samples))
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    fixtures = load_fixtures()
+
+    print(f"样本数: {len(fixtures)}")
+    failures = check(fixtures)
+    print("结果校验: " + ("通过" if not failures else f"{failures} 项不一致"))
+
+    per_call = bench(fixtures, repeat)
+    print(f"平均耗时: {per_call * 1e6:.1f} µs/次  ({1 / per_call:,.0f} 次/秒)")
+    sys.exit(1 if failures else 0)
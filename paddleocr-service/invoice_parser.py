@@ -0,0 +1,201 @@
+"""
+发票文本解析模块
+将 PaddleOCR 识别出的文本行解析为发票字段
+
+所有正则在模块加载时预编译；金额候选在一次遍历 OCR 行的过程中按优先级收集，
+号码/代码/日期通过一次数字串切分得到，避免每次请求重复编译和多轮全文扫描。
+"""
+import re
+
+# ================= 预编译正则 =================
+
+# 第一优先级：明确的"价税合计"或"小写"后的金额（含税总金额），按顺序匹配合并文本
+# 每项为 (必须出现的关键字, 正则)，关键字不存在时跳过该正则
+TOTAL_PATTERNS = [
+    ('价税', re.compile(r'(?:价税合计|价税\s*合\s*计)[^0-9¥￥]*[¥￥]?\s*[:：]?\s*(\d+[,，]?\d*\.?\d*)')),  # 价税合计格式
+    ('小写', re.compile(r'[（\(]小写[）\)]\s*[¥￥]\s*(\d+[,，]?\d*\.\d{2})')),  # (小写) ¥22.50 格式（精确匹配）
+    ('小写', re.compile(r'小写[）\)]\s*[¥￥]\s*(\d+[,，]?\d*\.\d{2})')),  # 小写) ¥22.50 格式
+    ('小写', re.compile(r'[（\(]\s*小写\s*[）\)]\s*[¥￥]\s*(\d+[,，]?\d*\.?\d*)')),  # ( 小写 ) ¥22.50 格式
+    ('小写', re.compile(r'小写[^0-9¥￥]*[¥￥]\s*(\d+[,，]?\d*\.\d{2})')),  # 小写...¥22.50 宽松格式
+    ('计', re.compile(r'税\s*合\s*计[^0-9¥￥]*[¥￥]?\s*(\d+[,，]?\d*\.?\d*)')),  # 仅"税合计"
+]
+RE_ADJACENT_AMOUNT = re.compile(r'[¥￥]?\s*(\d+[,，]?\d*\.\d{2})')
+RE_COMBINED_AMOUNT = re.compile(r'合计金额\s*[¥￥]?\s*(\d+[,，]?\d*\.?\d*)')
+RE_YEN_AMOUNT = re.compile(r'[¥￥]\s*[:：]?\s*(\d+[,，]?\d*\.?\d*)')
+RE_TICKET_PRICE = re.compile(r'票价[：:]\s*[¥￥]?\s*(\d+\.?\d*)')
+RE_FISCAL_AMOUNT = re.compile(r'[（\(]小写[）\)]\s*(\d+\.?\d*)')
+RE_DECIMAL = re.compile(r'\d+\.\d{2}')
+RE_DIGITS = re.compile(r'\d+')
+RE_BUYER = re.compile(r'购\s*买\s*方.*?名\s*称[：:]\s*([^\n\r【】]{5,50})')
+RE_PAYER = re.compile(r'交款人[：:]*\s*([^\n\r【】]{2,50})')
+RE_SELLER = re.compile(r'销\s*售\s*方.*?名\s*称[：:]\s*([^\n\r【】]{5,50})')
+RE_PAYEE = re.compile(r'收款单位[：:]*\s*([^\n\r【】]{2,50})')
+
+# 相邻行金额的触发关键字（OCR 常把 "价税合计" 和 "¥100.00" 拆成两行）
+ADJACENT_KEYWORDS = ('价税合计', '小写', '税合计')
+ADJACENT_WINDOW = 3
+
+
+def _to_amount(s):
+    """去除千分位后转为浮点数"""
+    return float(s.replace(',', '').replace('，', ''))
+
+
+def _extract_amount(full_text, raw_list, result):
+    """按优先级提取价税合计金额"""
+    # === 第一阶段：在合并文本中按优先级搜索（处理分行情况）===
+    merged_text = ' '.join(raw_list)
+    for keyword, regex in TOTAL_PATTERNS:
+        if keyword not in merged_text:
+            continue
+        match = regex.search(merged_text)
+        if match:
+            result['amount'] = _to_amount(match.group(1))
+            break
+    if result['amount']:
+        return
+
+    # === 单次遍历 OCR 行，收集后续各优先级的候选 ===
+    keyword_lines = []      # 含"价税合计/小写/税合计"的行号
+    line_amounts = []       # 每行第一个两位小数金额（相邻行匹配用）
+    combined = None         # "合计金额 ¥100" 格式
+    max_yen = 0.0           # 所有 ¥ 后金额的最大值
+    ticket = None           # 火车票/机票：票价: ¥9.00
+    fiscal = None           # 财政票据：(小写) 6.80
+    for i, txt in enumerate(raw_list):
+        if any(k in txt for k in ADJACENT_KEYWORDS):
+            keyword_lines.append(i)
+        m = RE_ADJACENT_AMOUNT.search(txt) if '.' in txt else None
+        line_amounts.append(_to_amount(m.group(1)) if m else None)
+
+        if combined is None and '合计金额' in txt:
+            m = RE_COMBINED_AMOUNT.search(txt)
+            if m:
+                combined = _to_amount(m.group(1))
+        if '¥' in txt or '￥' in txt:
+            for m in RE_YEN_AMOUNT.finditer(txt):
+                val = _to_amount(m.group(1))
+                if val > 0.5 and val > max_yen:  # 排除太小的值
+                    max_yen = val
+        if ticket is None and '票价' in txt:
+            m = RE_TICKET_PRICE.search(txt)
+            if m:
+                ticket = float(m.group(1))
+        if fiscal is None and '小写' in txt:
+            m = RE_FISCAL_AMOUNT.search(txt)
+            if m:
+                fiscal = float(m.group(1))
+
+    # === 第二阶段：关键字所在行及其后两行中的第一个金额 ===
+    for i in keyword_lines:
+        for val in line_amounts[i:i + ADJACENT_WINDOW]:
+            if val is not None:
+                if val > 0:
+                    result['amount'] = val
+                    return
+                break
+
+    # 第三优先级：处理"合计金额 ¥100（含税/未含税）"格式
+    if combined is not None:
+        if '未含税' in full_text or '不含税' in full_text:
+            # 这是未含税金额，存到额外字段，仍然作为主金额（如果没有其他来源）
+            result['amount_without_tax'] = str(combined)
+        result['amount'] = combined
+        if combined:
+            return
+
+    # 第四优先级：标准 ¥ 符号后的金额，通常价税合计是最大的金额
+    if max_yen:
+        result['amount'] = max_yen
+        return
+
+    for candidate in (ticket, fiscal):
+        if candidate is not None:
+            result['amount'] = candidate
+            if candidate:
+                return
+
+    # 最后回退：取所有金额中的最大值（通常价税合计最大）
+    valid = [v for v in map(float, RE_DECIMAL.findall(full_text)) if 1 < v < 100000000]
+    if valid:
+        result['amount'] = max(valid)
+
+
+def _extract_numbers(full_text, result):
+    """一次切分数字串，得到发票号码、发票代码和开票日期"""
+    runs = RE_DIGITS.findall(full_text)
+
+    # 发票号码：20位全电发票号码优先，其次是独立的8位号码（排除以202开头的日期）
+    number = next((r[:20] for r in runs if len(r) >= 20), '')
+    if not number:
+        m8 = [r for r in runs if len(r) == 8]
+        real = [c for c in m8 if not c.startswith('202')]
+        number = real[0] if real else (m8[0] if m8 else '')
+    result['number'] = number
+
+    # 发票代码：独立的10位或12位数字
+    if len(number) != 20:
+        code = next((r for r in runs if len(r) in (10, 12) and r != number), '')
+        if code:
+            result['code'] = code
+
+    # 日期：年(≥4位数字串的末4位) + 月(1-2位数字串) + 日(下一数字串的前1-2位)
+    for k in range(len(runs) - 2):
+        if len(runs[k]) >= 4 and len(runs[k + 1]) <= 2:
+            y, m, d = runs[k][-4:], runs[k + 1], runs[k + 2][:2]
+            result['date'] = f"{y}-{int(m):02d}-{int(d):02d}"
+            break
+
+
+def _extract_parties(full_text, result):
+    """购买方 / 销售方（财政票据为交款人 / 收款单位）"""
+    m = RE_BUYER.search(full_text) if '买' in full_text else None
+    if not m and '交款人' in full_text:
+        m = RE_PAYER.search(full_text)
+    if m:
+        result['buyer'] = m.group(1).strip()
+
+    m = RE_SELLER.search(full_text) if '售' in full_text else None
+    if not m and '收款单位' in full_text:
+        m = RE_PAYEE.search(full_text)
+    if m:
+        result['seller'] = m.group(1).strip()
+
+
+def _detect_invoice_type(full_text):
+    """发票类型识别"""
+    if '铁路' in full_text and '客票' in full_text:
+        return '铁路电子客票'
+    if '财政' in full_text and '票据' in full_text:
+        return '财政电子票据'
+    if '非税' in full_text:
+        return '财政电子票据'
+    if '专用发票' in full_text:
+        return '增值税专用发票'
+    if '普通发票' in full_text:
+        return '增值税普通发票'
+    if '电子发票' in full_text:
+        return '增值税电子普通发票'
+    return None
+
+
+def parse_invoice_smart(full_text, raw_list):
+    result = {
+        'code': '', 'number': '', 'date': '', 'amount': 0,
+        'buyer': '', 'seller': '', 'raw_text': raw_list
+    }
+
+    try: _extract_amount(full_text, raw_list, result)
+    except: pass
+
+    try: _extract_numbers(full_text, result)
+    except: pass
+
+    try: _extract_parties(full_text, result)
+    except: pass
+
+    invoice_type = _detect_invoice_type(full_text)
+    if invoice_type:
+        result['invoice_type'] = invoice_type
+
+    return result
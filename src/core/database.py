@@ -5,12 +5,41 @@
 import os
 import sqlite3
 import json
+import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict, Optional
 
 
 class InvoiceDatabase:
-    """发票数据库管理类"""
+    """发票数据库管理类
+    
+    每个线程首次访问时打开一个长连接并一直复用（预编译语句缓存随连接保留），数据库使用 WAL 日志：
+    读不阻塞写，导入线程池、OCR 线程与界面线程可以同时访问，写操作由 SQLite 串行化，忙时最多等待 BUSY_TIMEOUT 秒。
+    """
+    
+    # 每个连接打开时设置：WAL 下 NORMAL 同步只在检查点时 fsync；页缓存 16MB（负数单位为 KB）；内存映射读 256MB
+    PRAGMAS = (
+        ("synchronous", "NORMAL"),
+        ("cache_size", -16000),
+        ("mmap_size", 256 * 1024 * 1024),
+        ("temp_store", "MEMORY"),
+    )
+    CACHED_STATEMENTS = 128  # 每个连接缓存的预编译语句数
+    BUSY_TIMEOUT = 10        # 其他连接写入时最多等待的秒数
+    SAVE_CHUNK = 5000        # save_many 每个事务的记录数
+    FTS_FIELDS = ("buyer", "seller", "invoice_type", "item_name", "remark", "invoice_number")  # 全文索引的字段
+    
+    # 按 file_path 插入或更新：已存在时更新除 file_path / created_at 以外的字段
+    _FIELDS = ("file_path", "file_name", "invoice_type", "date", "amount", "amount_without_tax", "tax_amount",
+               "buyer", "buyer_tax_id", "seller", "seller_tax_id", "invoice_number", "invoice_code",
+               "check_code", "item_name", "remark", "raw_data")
+    _UPSERT = (
+        f"INSERT INTO invoices ({', '.join(_FIELDS)}) VALUES ({', '.join('?' * len(_FIELDS))}) "
+        f"ON CONFLICT(file_path) DO UPDATE SET "
+        f"{', '.join(f'{k} = excluded.{k}' for k in _FIELDS[1:])}, updated_at = ?"
+    )
     
     def __init__(self, db_path: str = None):
         """
@@ -26,47 +55,131 @@ class InvoiceDatabase:
             db_path = os.path.join(app_dir, "invoices.db")
         
         self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = []       # 所有线程打开的连接，close() 时统一关闭
+        self._generation = 0   # close() 后递增，各线程据此重新打开连接
+        self.logger = logging.getLogger(__name__)
+        self.fts = False       # 全文索引是否可用（SQLite 需支持 FTS5 trigram 分词）
         self._init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """当前线程的连接（首次调用时打开）"""
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            conn = sqlite3.connect(self.db_path, timeout=self.BUSY_TIMEOUT,
+                                   cached_statements=self.CACHED_STATEMENTS, check_same_thread=False,
+                                   isolation_level=None)  # 自动提交，写事务由 _transaction() 显式开始
+            conn.row_factory = sqlite3.Row
+            for name, value in self.PRAGMAS:
+                conn.execute(f"PRAGMA {name} = {value}")
+            with self._lock:
+                self._conns.append(conn)
+                local.conn, local.generation = conn, self._generation
+        return local.conn
+    
+    @contextmanager
+    def _transaction(self):
+        """写事务：开始时即取得写锁（BEGIN IMMEDIATE，避免并发时读锁升级失败），正常结束时提交，出错时回滚"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    
+    def close(self):
+        """关闭所有线程的连接（之后再访问会重新打开）"""
+        with self._lock:
+            conns, self._conns = self._conns, []
+            self._generation += 1
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+    
     def _init_db(self):
         """初始化数据库表结构"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 创建发票表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_path TEXT UNIQUE,
-                file_name TEXT,
-                invoice_type TEXT,
-                date TEXT,
-                amount REAL DEFAULT 0,
-                amount_without_tax REAL DEFAULT 0,
-                tax_amount REAL DEFAULT 0,
-                buyer TEXT,
-                buyer_tax_id TEXT,
-                seller TEXT,
-                seller_tax_id TEXT,
-                invoice_number TEXT,
-                invoice_code TEXT,
-                check_code TEXT,
-                item_name TEXT,
-                remark TEXT,
-                raw_data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # 创建索引
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_date ON invoices(date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoice_type ON invoices(invoice_type)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_buyer ON invoices(buyer)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_seller ON invoices(seller)')
+        conn = self._connect()
+        # WAL 设置会保存在数据库文件中，对之后打开的连接都生效
+        conn.execute("PRAGMA journal_mode = WAL")
+        with self._transaction() as cursor:
+            # 创建发票表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS invoices (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_path TEXT UNIQUE,
+                    file_name TEXT,
+                    invoice_type TEXT,
+                    date TEXT,
+                    amount REAL DEFAULT 0,
+                    amount_without_tax REAL DEFAULT 0,
+                    tax_amount REAL DEFAULT 0,
+                    buyer TEXT,
+                    buyer_tax_id TEXT,
+                    seller TEXT,
+                    seller_tax_id TEXT,
+                    invoice_number TEXT,
+                    invoice_code TEXT,
+                    check_code TEXT,
+                    item_name TEXT,
+                    remark TEXT,
+                    raw_data TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            # 创建索引
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_date ON invoices(date)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoice_type ON invoices(invoice_type)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_buyer ON invoices(buyer)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_seller ON invoices(seller)')
+            
+            self.fts = self._create_fts(cursor)
+    
+    def _create_fts(self, cursor) -> bool:
+        """
+        创建全文索引 invoices_fts 及同步触发器
         
-        conn.commit()
-        conn.close()
+        FTS5 外部内容表（不重复保存文本），trigram 分词：任意 3 个字以上的子串都能走索引，中文不需要分词。
+        索引表新建时从已有记录重建。SQLite 不支持 FTS5 trigram（3.34 以前）时返回 False，搜索退回 LIKE。
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'invoices_fts'").fetchone()
+        cols = ", ".join(self.FTS_FIELDS)
+        new = ", ".join(f"new.{c}" for c in self.FTS_FIELDS)
+        old = ", ".join(f"old.{c}" for c in self.FTS_FIELDS)
+        try:
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5(
+                    {cols}, content='invoices', content_rowid='id', tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"SQLite 不支持 FTS5 trigram 全文索引，搜索使用 LIKE: {e}")
+            return False
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS invoices_fts_ai AFTER INSERT ON invoices BEGIN
+                INSERT INTO invoices_fts(rowid, {cols}) VALUES (new.id, {new});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS invoices_fts_ad AFTER DELETE ON invoices BEGIN
+                INSERT INTO invoices_fts(invoices_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS invoices_fts_au AFTER UPDATE OF {cols} ON invoices BEGIN
+                INSERT INTO invoices_fts(invoices_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+                INSERT INTO invoices_fts(rowid, {cols}) VALUES (new.id, {new});
+            END
+        """)
+        if not exists:
+            cursor.execute("INSERT INTO invoices_fts(invoices_fts) VALUES ('rebuild')")
+        return True
     
     def save_invoice(self, data: Dict) -> int:
         """
@@ -78,101 +191,58 @@ class InvoiceDatabase:
         Returns:
             发票记录 ID
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         file_path = data.get("file_path", "")
+        with self._transaction() as cursor:
+            cursor.execute(self._UPSERT, self._row(data, datetime.now().isoformat()))
+            return cursor.execute('SELECT id FROM invoices WHERE file_path = ?', (file_path,)).fetchone()[0]
+    
+    def save_many(self, items: List[Dict]) -> int:
+        """
+        批量保存或更新发票记录（按 file_path 去重）
         
-        # 检查是否已存在
-        cursor.execute('SELECT id FROM invoices WHERE file_path = ?', (file_path,))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # 更新现有记录
-            cursor.execute('''
-                UPDATE invoices SET
-                    file_name = ?,
-                    invoice_type = ?,
-                    date = ?,
-                    amount = ?,
-                    amount_without_tax = ?,
-                    tax_amount = ?,
-                    buyer = ?,
-                    buyer_tax_id = ?,
-                    seller = ?,
-                    seller_tax_id = ?,
-                    invoice_number = ?,
-                    invoice_code = ?,
-                    check_code = ?,
-                    item_name = ?,
-                    remark = ?,
-                    raw_data = ?,
-                    updated_at = ?
-                WHERE file_path = ?
-            ''', (
-                data.get("file_name", os.path.basename(file_path)),
-                data.get("invoice_type", ""),
-                data.get("date", ""),
-                float(data.get("amount", 0) or 0),
-                float(data.get("amount_without_tax", 0) or 0),
-                float(data.get("tax_amt", 0) or 0),
-                data.get("buyer", ""),
-                data.get("buyer_tax_id", ""),
-                data.get("seller", ""),
-                data.get("seller_tax_id", ""),
-                data.get("number", ""),
-                data.get("code", ""),
-                data.get("check_code", ""),
-                data.get("item_name", ""),
-                data.get("remark", ""),
-                json.dumps(data, ensure_ascii=False),
-                datetime.now().isoformat(),
-                file_path
-            ))
-            invoice_id = existing[0]
-        else:
-            # 插入新记录
-            cursor.execute('''
-                INSERT INTO invoices (
-                    file_path, file_name, invoice_type, date, amount,
-                    amount_without_tax, tax_amount, buyer, buyer_tax_id,
-                    seller, seller_tax_id, invoice_number, invoice_code,
-                    check_code, item_name, remark, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                file_path,
-                data.get("file_name", os.path.basename(file_path)),
-                data.get("invoice_type", ""),
-                data.get("date", ""),
-                float(data.get("amount", 0) or 0),
-                float(data.get("amount_without_tax", 0) or 0),
-                float(data.get("tax_amt", 0) or 0),
-                data.get("buyer", ""),
-                data.get("buyer_tax_id", ""),
-                data.get("seller", ""),
-                data.get("seller_tax_id", ""),
-                data.get("number", ""),
-                data.get("code", ""),
-                data.get("check_code", ""),
-                data.get("item_name", ""),
-                data.get("remark", ""),
-                json.dumps(data, ensure_ascii=False)
-            ))
-            invoice_id = cursor.lastrowid
+        每 SAVE_CHUNK 条一个事务，用 executemany 执行同一条 UPSERT 语句；
+        批量很大时分段提交，避免长时间占用写锁。
         
-        conn.commit()
-        conn.close()
-        return invoice_id
+        Args:
+            items: 发票数据字典列表
+            
+        Returns:
+            保存的记录数
+        """
+        now = datetime.now().isoformat()
+        for i in range(0, len(items), self.SAVE_CHUNK):
+            with self._transaction() as cursor:
+                cursor.executemany(self._UPSERT, (self._row(data, now) for data in items[i:i + self.SAVE_CHUNK]))
+        return len(items)
+    
+    @staticmethod
+    def _row(data: Dict, updated_at: str) -> tuple:
+        """发票数据字典 -> UPSERT 语句参数"""
+        file_path = data.get("file_path", "")
+        return (
+            file_path,
+            data.get("file_name", os.path.basename(file_path)),
+            data.get("invoice_type", ""),
+            data.get("date", ""),
+            float(data.get("amount", 0) or 0),
+            float(data.get("amount_without_tax", 0) or 0),
+            float(data.get("tax_amt", 0) or 0),
+            data.get("buyer", ""),
+            data.get("buyer_tax_id", ""),
+            data.get("seller", ""),
+            data.get("seller_tax_id", ""),
+            data.get("number", ""),
+            data.get("code", ""),
+            data.get("check_code", ""),
+            data.get("item_name", ""),
+            data.get("remark", ""),
+            json.dumps(data, ensure_ascii=False),
+            updated_at,
+        )
     
     def get_invoice_by_path(self, file_path: str) -> Optional[Dict]:
         """根据文件路径获取发票记录"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM invoices WHERE file_path = ?', (file_path,))
-        row = cursor.fetchone()
-        conn.close()
+        row = self._connect().execute('SELECT * FROM invoices WHERE file_path = ?', (file_path,)).fetchone()
         
         if row:
             return dict(row)
@@ -180,13 +250,7 @@ class InvoiceDatabase:
     
     def get_all_invoices(self, limit: int = 1000) -> List[Dict]:
         """获取所有发票记录"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM invoices ORDER BY date DESC LIMIT ?', (limit,))
-        rows = cursor.fetchall()
-        conn.close()
+        rows = self._connect().execute('SELECT * FROM invoices ORDER BY date DESC LIMIT ?', (limit,)).fetchall()
         
         return [dict(row) for row in rows]
     
@@ -199,10 +263,6 @@ class InvoiceDatabase:
                        min_amount: float = None,
                        max_amount: float = None) -> List[Dict]:
         """搜索发票"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         conditions = []
         params = []
         
@@ -212,15 +272,16 @@ class InvoiceDatabase:
         if end_date:
             conditions.append("date <= ?")
             params.append(end_date)
-        if invoice_type:
-            conditions.append("invoice_type LIKE ?")
-            params.append(f"%{invoice_type}%")
-        if buyer:
-            conditions.append("buyer LIKE ?")
-            params.append(f"%{buyer}%")
-        if seller:
-            conditions.append("seller LIKE ?")
-            params.append(f"%{seller}%")
+        # 包含匹配：3 个字以上走全文索引，更短的用 LIKE
+        for column, value in (("invoice_type", invoice_type), ("buyer", buyer), ("seller", seller)):
+            if not value:
+                continue
+            if self.fts and len(value) >= 3:
+                conditions.append("id IN (SELECT rowid FROM invoices_fts WHERE invoices_fts MATCH ?)")
+                params.append(f"{column} : {self._fts_phrase(value)}")
+            else:
+                conditions.append(f"{column} LIKE ?")
+                params.append(f"%{value}%")
         if min_amount is not None:
             conditions.append("amount >= ?")
             params.append(min_amount)
@@ -233,23 +294,58 @@ class InvoiceDatabase:
             query += " WHERE " + " AND ".join(conditions)
         query += " ORDER BY date DESC"
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+        rows = self._connect().execute(query, params).fetchall()
         
         return [dict(row) for row in rows]
     
-    def delete_invoice(self, file_path: str) -> bool:
-        """删除发票记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def full_text_search(self, text: str, limit: int = 200) -> List[Dict]:
+        """
+        全文搜索购买方、销售方、发票类型、项目名称、备注和发票号码
         
-        cursor.execute('DELETE FROM invoices WHERE file_path = ?', (file_path,))
-        deleted = cursor.rowcount > 0
+        空格分隔的关键词需同时出现（子串匹配，不区分英文大小写），结果按相关度（bm25）排序，
+        相关度相同时日期新的在前。3 个字以上的关键词走全文索引，更短的关键词用 LIKE 过滤。
         
-        conn.commit()
-        conn.close()
-        return deleted
+        Args:
+            text: 搜索文本
+            limit: 最多返回的记录数
+            
+        Returns:
+            发票记录列表，附加 rank 字段（越小越相关）
+        """
+        terms = text.split()
+        if not terms:
+            return []
+        indexed = [t for t in terms if len(t) >= 3] if self.fts else []
+        conditions, params = [], []
+        if indexed:
+            query = ("SELECT invoices.*, bm25(invoices_fts) AS rank FROM invoices_fts "
+                     "JOIN invoices ON invoices.id = invoices_fts.rowid")
+            conditions.append("invoices_fts MATCH ?")
+            params.append(" ".join(self._fts_phrase(t) for t in indexed))
+            order = "rank, invoices.date DESC"
+        else:
+            query = "SELECT invoices.*, 0 AS rank FROM invoices"
+            order = "invoices.date DESC"
+        for t in terms:
+            if t not in indexed:
+                conditions.append("(" + " OR ".join(f"invoices.{c} LIKE ?" for c in self.FTS_FIELDS) + ")")
+                params.extend([f"%{t}%"] * len(self.FTS_FIELDS))
+        query += " WHERE " + " AND ".join(conditions) + f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+        
+        rows = self._connect().execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def _fts_phrase(text: str) -> str:
+        """FTS5 查询中的字面短语（双引号转义，避免被解析为查询语法）"""
+        return '"' + text.replace('"', '""') + '"'
+    
+    def delete_invoice(self, file_path: str) -> bool:
+        """删除发票记录"""
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM invoices WHERE file_path = ?', (file_path,))
+            return cursor.rowcount > 0
     
     def get_statistics(self, year: int = None, month: int = None) -> Dict:
         """
@@ -262,8 +358,7 @@ class InvoiceDatabase:
         Returns:
             统计数据字典
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._connect().cursor()
         
         conditions = []
         params = []
@@ -322,8 +417,6 @@ class InvoiceDatabase:
         ''', params)
         by_month = cursor.fetchall()
         
-        conn.close()
-        
         return {
             "total_count": totals[0],
             "total_amount": totals[1],
@@ -334,23 +427,20 @@ class InvoiceDatabase:
     
     def clear_all(self) -> int:
         """清空所有记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM invoices')
-        deleted = cursor.rowcount
-        
-        conn.commit()
-        conn.close()
-        return deleted
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM invoices')
+            return cursor.rowcount
 
 
 # 全局数据库实例
 _db_instance = None
+_db_lock = threading.Lock()
 
 def get_db() -> InvoiceDatabase:
-    """获取数据库单例实例"""
+    """获取数据库单例实例（可在任意线程调用）"""
     global _db_instance
     if _db_instance is None:
-        _db_instance = InvoiceDatabase()
+        with _db_lock:
+            if _db_instance is None:
+                _db_instance = InvoiceDatabase()
     return _db_instance
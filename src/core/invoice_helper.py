@@ -4,8 +4,9 @@ import re
 import cv2
 import fitz
 import tempfile
-from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtGui import QPixmap
 from src.utils.icons import Icons
+from src.core.thumbnails import get_thumbnail_cache
 
 try:
     from pyzbar.pyzbar import decode as decode_qr
@@ -112,10 +113,9 @@ class InvoiceHelper:
             return None
     
     @staticmethod
-    def thumb(fp):
-        try: 
-            with fitz.open(fp) as doc:
-                return QPixmap.fromImage(QImage.fromData(doc.load_page(0).get_pixmap(matrix=fitz.Matrix(0.3,0.3)).tobytes("ppm")))
+    def thumb(fp, size=(180, 180)):
+        """首页缩略图（经磁盘缓存，同一内容只渲染一次）"""
+        try: return QPixmap.fromImage(get_thumbnail_cache().image(fp, size))
         except: return Icons.get("file", "#ccc").pixmap(100,100)
     
     @staticmethod
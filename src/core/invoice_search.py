@@ -0,0 +1,161 @@
+"""
+发票列表筛选
+内存索引：销售方/购买方名称按 1、2 字 n-gram 索引（在 InvoiceStore 的字典编码上，只索引不同的名称），
+发票号码与税号按有序键做前缀匹配；金额与日期范围直接在存储的列上筛选。随发票的增删改增量更新。
+"""
+import re
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+
+import numpy as np
+
+_AMOUNT_CMP = re.compile(r"^(>=|<=|>|<|＞|＜)¥?(\d+(?:\.\d+)?)$")
+_AMOUNT_RANGE = re.compile(r"^¥?(\d+(?:\.\d+)?)~¥?(\d+(?:\.\d+)?)$")
+_DATE = r"\d{4}-\d{1,2}(?:-\d{1,2})?"
+_DATE_RANGE = re.compile(rf"^({_DATE})?~({_DATE})?$")
+
+
+def _date_bounds(text, upper=False):
+    """2024-03 -> 2024-03-01 / 2024-03-31，2024-3-5 -> 2024-03-05；月份或日期无效时返回 None"""
+    parts = [int(p) for p in text.split("-")]
+    try:
+        if len(parts) == 3:
+            return date(*parts).isoformat()
+        y, m = parts
+        if not 1 <= m <= 12:
+            return None
+        if not upper:
+            return date(y, m, 1).isoformat()
+        return (date(y + m // 12, m % 12 + 1, 1) - timedelta(days=1)).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_query(text):
+    """解析筛选框文本，返回 (关键词列表, 条件字典)
+
+    以空格分隔，各条件同时满足：
+        >100、<=500、100~500     金额范围
+        2024-03、2024-01~2024-03、2024-03-05~   日期（月份或日期，范围两端可省略）
+        其他文字                 销售方/购买方名称包含，或发票号码/税号以其开头（月份、日期无效的日期也按文字匹配）
+    """
+    terms, cond = [], {}
+    for token in text.split():
+        m = _AMOUNT_CMP.match(token)
+        if m:
+            op, value = m.group(1).replace("＞", ">").replace("＜", "<"), float(m.group(2))
+            key = "min_amount" if op.startswith(">") else "max_amount"
+            if op in (">", "<"): value += 0.01 if op == ">" else -0.01
+            cond[key] = value
+            continue
+        m = _AMOUNT_RANGE.match(token)
+        if m:
+            cond["min_amount"], cond["max_amount"] = sorted((float(m.group(1)), float(m.group(2))))
+            continue
+        if re.fullmatch(_DATE, token):
+            start = end = token
+        else:
+            m = _DATE_RANGE.match(token)
+            start, end = m.groups() if m else (None, None)
+        if start or end:
+            bounds = {}
+            if start: bounds["start"] = _date_bounds(start)
+            if end: bounds["end"] = _date_bounds(end, upper=True)
+            if all(bounds.values()):
+                cond.update(bounds)
+                continue
+        terms.append(token.lower())
+    return terms, cond
+
+
+class InvoiceSearchIndex:
+    """发票存储的筛选索引
+
+    名称索引建在存储的字典编码上：查询时先补充索引新出现的名称，命中的编码再在 seller / buyer 列上向量化匹配。
+    号码与税号是逐张发票的键，保存在有序列表中，前缀查询用二分查找。
+    """
+
+    TEXT_FIELDS = ("number", "seller_tax_id", "buyer_tax_id")  # 前缀匹配的字段
+
+    def __init__(self, store):
+        self.store = store
+        self.clear()
+
+    def clear(self):
+        self._grams = {}       # n-gram -> {名称编码}
+        self._dictionary = None; self._indexed = 0  # 已索引的存储字典与名称数
+        self._keys = {}        # id(记录) -> 该记录的号码/税号
+        self._sorted = []      # 所有号码/税号（有序、去重）
+        self._postings = {}    # 号码/税号 -> {id(记录)}
+
+    # ---- 增量维护 ----
+    def _record_keys(self, rec):
+        ext = rec.get("ext") or {}
+        return tuple({str(v).upper() for v in (ext.get(f) for f in self.TEXT_FIELDS) if v})
+
+    def add(self, records):
+        new = []
+        for rec in records:
+            keys = self._keys[id(rec)] = self._record_keys(rec)
+            for key in keys:
+                ids = self._postings.get(key)
+                if ids is None:
+                    ids = self._postings[key] = set(); new.append(key)
+                ids.add(id(rec))
+        if len(new) == 1: insort(self._sorted, new[0])
+        elif new: self._sorted.extend(new); self._sorted.sort()  # 批量加入时一次排序
+
+    def remove(self, records):
+        for rec in records:
+            for key in self._keys.pop(id(rec), ()):
+                ids = self._postings[key]; ids.discard(id(rec))
+                if not ids:
+                    del self._postings[key]; del self._sorted[bisect_left(self._sorted, key)]
+
+    def update(self, records):
+        """发票识别结果变化后调用"""
+        self.remove(records); self.add(records)
+
+    def _index_names(self):
+        strings = self.store.dictionary
+        if strings is not self._dictionary:  # 存储被清空后字典重建
+            self._grams = {}; self._dictionary = strings; self._indexed = 0
+        for code in range(self._indexed, len(strings)):
+            name = strings[code].lower()
+            for n in (1, 2):
+                for i in range(len(name) - n + 1):
+                    self._grams.setdefault(name[i:i + n], set()).add(code)
+        self._indexed = len(strings)
+
+    # ---- 查询 ----
+    def name_codes(self, term):
+        """名称包含 term 的字典编码"""
+        self._index_names()
+        grams = [term[i:i + 2] for i in range(len(term) - 1)] or [term]
+        postings = sorted((self._grams.get(g, set()) for g in grams), key=len)
+        codes = set.intersection(*postings) if postings else set()
+        strings = self._dictionary
+        return [c for c in codes if term in strings[c].lower()]
+
+    def prefix_ids(self, prefix):
+        """号码或税号以 prefix 开头的记录"""
+        prefix = prefix.upper()
+        ids = set()
+        for i in range(bisect_left(self._sorted, prefix), len(self._sorted)):
+            key = self._sorted[i]
+            if not key.startswith(prefix): break
+            ids |= self._postings[key]
+        return ids
+
+    def mask(self, text, first=0):
+        """筛选框文本对应的行（布尔数组）；first > 0 时只判断第 first 行起的各行"""
+        terms, cond = parse_query(text)
+        m = self.store.mask(first=first, **cond)
+        for term in terms:
+            codes = self.name_codes(term)
+            hit = np.isin(self.store.column("seller")[first:], codes) | np.isin(self.store.column("buyer")[first:], codes)
+            ids = self.prefix_ids(term)
+            if ids:
+                hit |= np.fromiter((id(r) in ids for r in self.store[first:]), bool, len(m))
+            m &= hit
+        return m
@@ -0,0 +1,90 @@
+"""
+发票统计模块
+随发票的增删改增量维护汇总数据（数量、未识别数量、金额、税额、按类型/月份分组），界面直接读取
+"""
+IGNORED_TYPES = ("发票清单", "非发票凭证")  # 不计入统计的文档类型
+
+
+def is_ignored_type(inv_type):
+    """清单和非发票凭证不计入统计"""
+    return inv_type in IGNORED_TYPES or "非发票" in inv_type
+
+
+def to_cents(value):
+    """金额转为整数分（无法解析的字符串视为 0）"""
+    try:
+        return int(round(float(value or 0) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+
+class InvoiceAggregates:
+    """发票汇总数据
+
+    每张发票加入时记录其贡献，删除或修改时先减去记录的旧贡献，所以增删改都是 O(1)，
+    与已加载的发票数量无关。金额以整数分累加，避免浮点误差随增删累积。
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.unrecognized = 0
+        self.cents = 0
+        self.tax_cents = 0
+        self.by_type = {}   # 类型 -> [数量, 金额(分)]
+        self.by_month = {}  # 月份 -> [数量, 金额(分)]
+        self._entries = {}  # id(发票字典) -> 贡献（不计入统计的为 None）
+
+    @staticmethod
+    def contribution(d):
+        """计算发票的贡献 (金额分, 税额分, 类型, 月份, 是否未识别)，清单和非发票凭证返回 None"""
+        ext = d.get("ext", {})
+        inv_type = ext.get("invoice_type", "") or ""
+        if is_ignored_type(inv_type):
+            return None
+        amount = d.get("a", 0) or 0
+        date = d.get("d", "") or ""
+        return (to_cents(amount), to_cents(ext.get("tax_amt", 0)), inv_type or "未分类",
+                date[:7] if len(date) >= 7 else "未知", amount == 0 or not date)
+
+    def _apply(self, c, sign):
+        cents, tax_cents, inv_type, month, unrecognized = c
+        self.count += sign
+        self.unrecognized += sign * unrecognized
+        self.cents += sign * cents
+        self.tax_cents += sign * tax_cents
+        for buckets, key in ((self.by_type, inv_type), (self.by_month, month)):
+            bucket = buckets.setdefault(key, [0, 0])
+            bucket[0] += sign; bucket[1] += sign * cents
+            if bucket[0] == 0: del buckets[key]
+
+    def add(self, d):
+        c = self.contribution(d)
+        self._entries[id(d)] = c
+        if c is not None: self._apply(c, 1)
+
+    def remove(self, d):
+        c = self._entries.pop(id(d), None)
+        if c is not None: self._apply(c, -1)
+
+    def update(self, d):
+        """发票内容（金额、日期、OCR 结果）变化后调用"""
+        self.remove(d); self.add(d)
+
+    @property
+    def total_amount(self):
+        return self.cents / 100
+
+    @property
+    def total_tax(self):
+        return self.tax_cents / 100
+
+    def type_rows(self):
+        """按类型分组：[(类型, 数量, 金额)]，金额从大到小"""
+        return sorted(((k, n, c / 100) for k, (n, c) in self.by_type.items()), key=lambda x: x[2], reverse=True)
+
+    def month_rows(self):
+        """按月份分组：[(月份, 数量, 金额)]，月份从新到旧"""
+        return sorted(((k, n, c / 100) for k, (n, c) in self.by_month.items()), key=lambda x: x[0], reverse=True)
@@ -0,0 +1,268 @@
+"""
+会话发票存储
+每张发票是一个 __slots__ 记录：金额保存为整数分，ISO 日期保存为公历序数日，路径保存为字节串；
+类型与买卖双方名称驻留共享，其余识别字段按共享的字段表打包为 UTF-8 JSON。InvoiceStore 同时增量维护 NumPy 列（金额、日期、类型/销售方/购买方编码），
+界面、导出与统计在列上做向量化的筛选、求和与分组。
+"""
+import os
+import sys
+import json
+from datetime import date
+
+import numpy as np
+
+from .invoice_stats import is_ignored_type, to_cents
+
+COLUMN_FIELDS = ("invoice_type", "seller", "buyer")  # 单独保存（驻留共享）的识别字段，其余字段打包为 UTF-8 JSON
+_EPOCH = date(1970, 1, 1).toordinal()
+_key_tables = {}  # 识别结果字段表（同一组字段的发票共用一个元组）
+
+
+def _shared(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def parse_day(text):
+    """ISO 日期（YYYY-MM-DD）转为公历序数日，其他格式返回 0"""
+    if len(text) != 10:
+        return 0
+    try:
+        return date.fromisoformat(text).toordinal()
+    except ValueError:
+        return 0
+
+
+class InvoiceRecord:
+    """一张发票
+
+    按原来的字典键读写：p 路径、n 文件名、a 金额、d 日期、ext 识别结果、manually_edited、_pending_ocr。
+    ext 每次读取时解包出新字典，修改后需重新赋值 record["ext"] = ...；单个字段用 ext_value() 读取。
+    """
+    __slots__ = ("_path", "_name", "cents", "day", "_date", "ext_keys", "_ext", "inv_type", "seller", "buyer",
+                 "manually_edited", "pending_ocr")
+
+    def __init__(self, path, name=None, pending_ocr=False):
+        self._path = os.fsencode(path)
+        self._name = None if name is None or name == os.path.basename(path) else name
+        self.cents = 0; self.day = 0; self._date = None
+        self.ext_keys = (); self._ext = b"[]"
+        self.inv_type = self.seller = self.buyer = ""
+        self.manually_edited = False; self.pending_ocr = pending_ocr
+
+    @classmethod
+    def from_dict(cls, d):
+        rec = cls(d["p"], d.get("n"), d.get("_pending_ocr", False))
+        for key in ("a", "d", "ext", "manually_edited"):
+            if key in d: rec[key] = d[key]
+        return rec
+
+    @property
+    def path(self):
+        return os.fsdecode(self._path)
+
+    @property
+    def name(self):
+        return self._name or os.path.basename(self.path)
+
+    @property
+    def date_text(self):
+        return date.fromordinal(self.day).isoformat() if self.day else (self._date or "")
+
+    @property
+    def ext(self):
+        packed = iter(json.loads(self._ext))
+        columns = {"invoice_type": self.inv_type, "seller": self.seller, "buyer": self.buyer}
+        return {k: columns[k] if k in columns else next(packed) for k in self.ext_keys}
+
+    def ext_value(self, key, default=""):
+        """读取单个识别字段（类型与买卖双方名称不需要解包）"""
+        if key in COLUMN_FIELDS:
+            return getattr(self, "inv_type" if key == "invoice_type" else key) if key in self.ext_keys else default
+        return self.ext.get(key, default)
+
+    def set_ext(self, ext):
+        ext = ext or {}
+        keys = tuple(ext)
+        self.ext_keys = _key_tables.setdefault(keys, keys)
+        self.inv_type, self.seller, self.buyer = (_shared(ext.get(k, "")) for k in COLUMN_FIELDS)
+        # 无法序列化为 JSON 的值（Decimal、datetime 等）按字符串保存
+        self._ext = json.dumps([v for k, v in ext.items() if k not in COLUMN_FIELDS],
+                               ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+    def __getitem__(self, key):
+        if key == "p": return self.path
+        if key == "n": return self.name
+        if key == "a": return self.cents / 100
+        if key == "d": return self.date_text
+        if key == "ext": return self.ext
+        if key == "manually_edited": return self.manually_edited
+        if key == "_pending_ocr": return self.pending_ocr
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "a": self.cents = to_cents(value)
+        elif key == "d":
+            self.day = parse_day(value or "")
+            self._date = None if self.day or not value else value
+        elif key == "ext": self.set_ext(value)
+        elif key == "n": self._name = None if value == os.path.basename(self.path) else value
+        elif key == "manually_edited": self.manually_edited = bool(value)
+        elif key == "_pending_ocr": self.pending_ocr = bool(value)
+        else: raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in ("p", "n", "a", "d", "ext", "manually_edited", "_pending_ocr")
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class InvoiceStore:
+    """会话中的发票列表
+
+    按行号读取、追加、删除，与 list 用法一致；行内容修改后调用 changed(rows) 同步列。
+    列：cents（int64 分）、day（int32 序数日，0 为未知）、type / seller / buyer（int32 字典编码，0 为空）。
+    """
+    COLUMNS = {"cents": np.int64, "day": np.int32, "type": np.int32, "seller": np.int32, "buyer": np.int32}
+
+    def __init__(self, records=()):
+        self._rows = []
+        self._codes = {"": 0}; self._strings = [""]  # 字典编码
+        self._cols = {name: np.zeros(64, dtype) for name, dtype in self.COLUMNS.items()}
+        self.extend(records)
+
+    # ---- 列表接口 ----
+    def __len__(self): return len(self._rows)
+    def __iter__(self): return iter(self._rows)
+    def __getitem__(self, index): return self._rows[index]
+
+    def __delitem__(self, index):
+        n = len(self._rows)
+        if isinstance(index, slice):
+            first, stop, step = index.indices(n)
+        elif -n <= index < n:  # 与 list 一致：越界（含空存储）抛出 IndexError
+            first, stop, step = index % n, index % n + 1, 1
+        else:
+            raise IndexError("list assignment index out of range")
+        if step != 1: raise ValueError("只支持连续的行")
+        if stop <= first: return
+        del self._rows[first:stop]
+        for col in self._cols.values():
+            col[first:n - (stop - first)] = col[stop:n]
+
+    def append(self, record): self.extend([record])
+
+    def extend(self, records):
+        records = [r if isinstance(r, InvoiceRecord) else InvoiceRecord.from_dict(r) for r in records]
+        first = len(self._rows)
+        self._rows.extend(records)
+        self._reserve(len(self._rows))
+        self._encode(range(first, len(self._rows)))
+
+    def clear(self):
+        self._rows.clear()
+        self._codes = {"": 0}; self._strings = [""]
+
+    def changed(self, rows):
+        """行内容（金额、日期、识别结果）修改后同步列"""
+        self._encode(rows)
+
+    # ---- 列维护 ----
+    def _reserve(self, size):
+        cap = len(self._cols["cents"])
+        if size <= cap: return
+        while cap < size: cap *= 2
+        for name, col in self._cols.items():
+            grown = np.zeros(cap, col.dtype); grown[:len(col)] = col; self._cols[name] = grown
+
+    def _code(self, text):
+        code = self._codes.get(text)
+        if code is None:
+            code = self._codes[text] = len(self._strings); self._strings.append(text)
+        return code
+
+    def _encode(self, rows):
+        cents, day, types, sellers, buyers = (self._cols[k] for k in ("cents", "day", "type", "seller", "buyer"))
+        for r in rows:
+            rec = self._rows[r]
+            cents[r] = rec.cents; day[r] = rec.day
+            types[r] = self._code(str(rec.inv_type or "")); sellers[r] = self._code(str(rec.seller or ""))
+            buyers[r] = self._code(str(rec.buyer or ""))
+
+    def column(self, name):
+        """列的只读视图（长度为当前行数）"""
+        col = self._cols[name][:len(self._rows)]
+        col.flags.writeable = False
+        return col
+
+    @property
+    def dictionary(self):
+        """字典编码表：编码 -> 字符串（只追加，clear() 后换成新列表）"""
+        return self._strings
+
+    def codes(self, texts):
+        """字符串对应的编码（不存在的字符串不会匹配任何行）"""
+        return [self._codes.get(t, -1) for t in texts]
+
+    # ---- 向量化查询 ----
+    def mask(self, include_ignored=True, types=None, min_amount=None, max_amount=None, start=None, end=None, first=0):
+        """按条件筛选行，返回布尔数组（只计算第 first 行起的各行，长度为 len - first）
+
+        Args:
+            include_ignored: 是否包含清单和非发票凭证
+            types: 只保留这些发票类型
+            min_amount / max_amount: 金额范围（元，含边界）
+            start / end: 日期范围（date 或 ISO 字符串，含边界；日期未知的行不匹配）
+            first: 起始行号（追加行后只需判断新行）
+        """
+        m = np.ones(max(0, len(self._rows) - first), bool)
+        if not include_ignored:
+            ignored = [c for c, t in enumerate(self._strings) if is_ignored_type(t)]
+            if ignored: m &= ~np.isin(self.column("type")[first:], ignored)
+        if types is not None:
+            m &= np.isin(self.column("type")[first:], self.codes(types))
+        if min_amount is not None: m &= self.column("cents")[first:] >= to_cents(min_amount)
+        if max_amount is not None: m &= self.column("cents")[first:] <= to_cents(max_amount)
+        if start is not None or end is not None:
+            day = self.column("day")[first:]
+            m &= day > 0
+            if start is not None: m &= day >= self._ordinal(start)
+            if end is not None: m &= day <= self._ordinal(end)
+        return m
+
+    @staticmethod
+    def _ordinal(value):
+        return value.toordinal() if isinstance(value, date) else parse_day(value)
+
+    def rows(self, mask=None):
+        """满足条件的行号"""
+        return np.arange(len(self._rows)) if mask is None else np.flatnonzero(mask)
+
+    def records(self, mask=None):
+        return [self._rows[r] for r in self.rows(mask)]
+
+    def sum(self, mask=None):
+        """金额合计（元）"""
+        cents = self.column("cents")
+        return int(cents.sum() if mask is None else cents[mask].sum()) / 100
+
+    def group_by(self, key, mask=None):
+        """按 type / seller / buyer / month 分组，返回 [(分组, 数量, 金额)]，金额从大到小"""
+        cents = self.column("cents")
+        if key == "month":
+            day = self.column("day")
+            months = np.where(day > 0, ((day.astype(np.int64) - _EPOCH).astype("datetime64[D]")
+                                        .astype("datetime64[M]").astype(np.int64)), -1)
+            keys, labels = months, lambda m: "未知" if m < 0 else str(np.datetime64(int(m), "M"))
+        else:
+            keys, labels = self.column(key), lambda c: self._strings[c]
+        if mask is not None:
+            keys, cents = keys[mask], cents[mask]
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(uniq))
+        sums = np.bincount(inverse, weights=cents, minlength=len(uniq))
+        groups = [(labels(k), int(n), float(s) / 100) for k, n, s in zip(uniq, counts, sums)]
+        return sorted(groups, key=lambda g: g[2], reverse=True)
@@ -1,60 +1,313 @@
 
 import os
+import threading
 import fitz  # PyMuPDF
 import logging
+from collections import OrderedDict
+
+from .sheet_packer import pack_sheets
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
+class SourceDocCache:
+    """源文件文档 LRU 缓存
+
+    预览每次刷新都会对全部发票重新合并，缓存已打开的源文档可避免重复打开/解析文件。
+    只缓存文档，不缓存导入后的 XObject：同一文档对象在同一目标 PDF 中多次 show_pdf_page 时，
+    PyMuPDF 已按 (源文档, 页号) 复用导入的页面对象（如 compose_range 一次排多页）；
+    而排版页缓存中的每页是独立的单页 PDF，XObject 无法跨文档共享，各页自带一份副本，
+    输出时由 COMPACT_SAVE（garbage=4）合并重复对象。
+    文件 mtime/大小变化时自动重新打开，打开的文件句柄数不超过 max_open。
+    """
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        self.lock = threading.RLock()
+        self._docs = OrderedDict()  # path -> (stamp, doc)
+        self._sizes = {}  # path -> (stamp, (w, h))，不受 max_open 限制
+
+    @staticmethod
+    def _stamp(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _open(path):
+        if path.lower().endswith(IMAGE_EXTS):
+            # 图片转为单页 PDF，统一走 show_pdf_page（Form XObject）
+            with fitz.open(path) as img_doc:
+                return fitz.open("pdf", img_doc.convert_to_pdf())
+        return fitz.open(path)
+
+    def get(self, path):
+        """获取 path 对应的已打开文档（PDF 或由图片转换的 PDF）"""
+        with self.lock:
+            stamp = self._stamp(path)
+            entry = self._docs.get(path)
+            if entry is not None:
+                if entry[0] == stamp:
+                    self._docs.move_to_end(path)
+                    return entry[1]
+                self._close(self._docs.pop(path)[1])
+            doc = self._open(path)
+            self._docs[path] = (stamp, doc)
+            while len(self._docs) > self.max_open:
+                _, (_, old) = self._docs.popitem(last=False)
+                self._close(old)
+            return doc
+
+    def page_size(self, path):
+        """源文档首页尺寸 (w, h)，自动拼版规划时使用，无需保持文档打开"""
+        with self.lock:
+            stamp = self._stamp(path)
+            entry = self._sizes.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            rect = self.get(path)[0].rect
+            self._sizes[path] = (stamp, (rect.width, rect.height))
+            return rect.width, rect.height
+
+    def invalidate(self, path):
+        with self.lock:
+            self._sizes.pop(path, None)
+            entry = self._docs.pop(path, None)
+            if entry is not None: self._close(entry[1])
+
+    def clear(self):
+        with self.lock:
+            for _, doc in self._docs.values(): self._close(doc)
+            self._docs.clear(); self._sizes.clear()
+
+    def __len__(self): return len(self._docs)
+
+    @staticmethod
+    def _close(doc):
+        try: doc.close()
+        except Exception: pass
+
+class SheetCache:
+    """排版页缓存
+
+    以 (该页文件标识, 模式, 纸张, 方向, 裁剪线) 为键缓存已排好的单页 PDF，
+    增删发票时只重排内容变化的页；同一组页再次输出到同一路径时直接复用已生成的文件。
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self._sheets = OrderedDict()  # key -> pdf bytes
+        self._size = 0
+        self._outputs = {}  # out_path -> (job_key, 文件标识)
+
+    @staticmethod
+    def file_identity(path):
+        """文件标识：路径 + mtime + 大小，文件被修改后键随之变化"""
+        try:
+            st = os.stat(path)
+            return (path, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return (path, None, None)
+
+    def get(self, key, compose):
+        """返回 key 对应的单页 PDF 字节，未命中时调用 compose() 生成"""
+        with self.lock:
+            data = self._sheets.get(key)
+            if data is not None:
+                self._sheets.move_to_end(key)
+                return data
+            data = compose()
+            self._sheets[key] = data; self._size += len(data)
+            while self._size > self.max_bytes and len(self._sheets) > 1:
+                _, old = self._sheets.popitem(last=False); self._size -= len(old)
+            return data
+
+    def is_output_current(self, out_path, job_key):
+        """out_path 是否已是 job_key 对应的输出且未被改动"""
+        with self.lock:
+            entry = self._outputs.get(out_path)
+        return entry is not None and entry == (job_key, self.file_identity(out_path))
+
+    def record_output(self, out_path, job_key):
+        with self.lock:
+            self._outputs[out_path] = (job_key, self.file_identity(out_path))
+
+    def clear(self):
+        with self.lock:
+            self._sheets.clear(); self._size = 0; self._outputs.clear()
+
+    def __len__(self): return len(self._sheets)
+
+    def __contains__(self, key):
+        with self.lock: return key in self._sheets
 
 class PDFEngine:
     SIZES = {"A4":(595,842), "A5":(420,595), "B5":(499,709)}
+    PADDING = 40
+    # 自动拼版（mode="auto"）：纸张边距、发票间距（裁剪空间）、为少用纸允许的最小缩放比例
+    PACK_MARGIN = 20
+    PACK_GAP = 16
+    PACK_MIN_SCALE = 0.4
+    source_cache = SourceDocCache()
+    sheet_cache = SheetCache()
+    # 压缩保存参数：清理无引用对象并合并重复对象/流（跨发票的相同字体、图片），压缩所有流
+    COMPACT_SAVE = dict(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True)
+
+    @staticmethod
+    def grid_shape(mode):
+        """网格排版模式 "列x行"（如 "1x2"、"3x2"）-> (列数, 行数)，其他模式返回 None"""
+        try: cols, rows = (int(v) for v in mode.lower().split("x"))
+        except (AttributeError, ValueError): return None
+        return (cols, rows) if cols > 0 and rows > 0 else None
+
+    @staticmethod
+    def layout_cells(mode, PW, PH):
+        """网格排版模式对应的单元格 (x, y, w, h) 列表，按行从左到右排列"""
+        shape = PDFEngine.grid_shape(mode)
+        if not shape: return []
+        cols, rows = shape; cw, ch = PW/cols, PH/rows
+        return [(c*cw, r*ch, cw, ch) for r in range(rows) for c in range(cols)]
+
+    @staticmethod
+    def cell_padding(mode, cw, ch):
+        """单元格内边距：1x1/1x2/2x2 固定 PADDING，更密的网格按单元格大小缩小"""
+        if max(PDFEngine.grid_shape(mode) or (1, 1)) <= 2: return PDFEngine.PADDING
+        return min(PDFEngine.PADDING, min(cw, ch) * 0.12)
+
+    @staticmethod
+    def draw_sheet(pg, chunk, mode, orient="V", cutline=True, cache=None):
+        """在页面 pg 上放置 chunk 中的发票 [(文件, (x0, y0, x1, y1)), ...]，并绘制裁剪线"""
+        cache = cache or PDFEngine.source_cache
+        PW, PH = pg.rect.width, pg.rect.height
+        rotate_angle = -90 if orient == "H" else 0
+        for f, rect in chunk:
+            try:
+                with cache.lock:
+                    pg.show_pdf_page(fitz.Rect(rect), cache.get(f), 0, keep_proportion=True, rotate=rotate_angle)
+            except Exception as e:
+                logger = logging.getLogger(__name__)
+                logger.error(f"处理文件失败 {os.path.basename(f)}: {str(e)}")
+        if cutline:
+            s = pg.new_shape(); s.draw_rect(fitz.Rect(0,0,0,0))
+            shape = PDFEngine.grid_shape(mode)
+            if shape:
+                cols, rows = shape
+                for c in range(1, cols): s.draw_line(fitz.Point(PW*c/cols, 0), fitz.Point(PW*c/cols, PH))
+                for r in range(1, rows): s.draw_line(fitz.Point(0, PH*r/rows), fitz.Point(PW, PH*r/rows))
+            else:
+                # 自动拼版：沿每张发票外侧间距的中线画裁剪框
+                half = PDFEngine.PACK_GAP / 2
+                for _, (x0, y0, x1, y1) in chunk: s.draw_rect(fitz.Rect(x0 - half, y0 - half, x1 + half, y1 + half))
+            s.finish(color=(0,0,0), width=0.5, dashes=[4,4], stroke_opacity=0.6); s.commit(overlay=True)
+
+    @staticmethod
+    def plan_sheets(files, mode="1x1", paper="A4", orient="V", cutline=True):
+        """将文件按排版模式分页，返回 [(sheet_key, chunk), ...]
+
+        chunk 为该页的 [(文件, (x0, y0, x1, y1)), ...]。mode 为 "列x行" 网格或 "auto"（自动拼版）；
+        规划只取决于文件内容与排版参数，预览与打印输出一致。
+        """
+        if not files: return [(("blank", paper), [])]
+        PW, PH = PDFEngine.SIZES.get(paper, (595,842))
+        if mode == "auto":
+            return PDFEngine._plan_packed(files, paper, orient, cutline, PW, PH)
+        cells = PDFEngine.layout_cells(mode, PW, PH) or PDFEngine.layout_cells("1x1", PW, PH)
+        rects = []
+        for x, y, w, h in cells:
+            pad = PDFEngine.cell_padding(mode, w, h)
+            rects.append((x + pad, y + pad, x + w - pad, y + h - pad))
+        sheets = []
+        for i in range(0, len(files), len(cells)):
+            chunk = list(zip(files[i:i+len(cells)], rects))
+            ids = tuple(SheetCache.file_identity(f) for f, _ in chunk)
+            sheets.append(((ids, mode, paper, orient, bool(cutline)), chunk))
+        return sheets
+
+    @staticmethod
+    def _plan_packed(files, paper, orient, cutline, PW, PH):
+        """自动拼版：按各发票页面尺寸装箱，页键包含各发票的位置"""
+        sizes = []
+        for f in files:
+            try:
+                w, h = PDFEngine.source_cache.page_size(f)
+                sizes.append((h, w) if orient == "H" else (w, h))  # 横向时发票旋转 90 度放置
+            except Exception as e:
+                logging.getLogger(__name__).error(f"读取页面尺寸失败 {os.path.basename(f)}: {str(e)}")
+                sizes.append(None)
+        packed = pack_sheets(sizes, PW, PH, PDFEngine.PACK_MARGIN, PDFEngine.PACK_GAP, PDFEngine.PACK_MIN_SCALE)
+        sheets = []
+        for placed in packed:
+            chunk = [(files[i], rect) for i, rect in placed]
+            ids = tuple((SheetCache.file_identity(f), rect) for f, rect in chunk)
+            sheets.append(((ids, "auto", paper, orient, bool(cutline)), chunk))
+        return sheets
+
+    @staticmethod
+    def sheet_bytes(key, chunk, mode="1x1", paper="A4", orient="V", cutline=True, cache=None):
+        """获取单页排版结果（PDF 字节），优先取自 sheet_cache"""
+        def compose():
+            PW, PH = PDFEngine.SIZES.get(paper, (595,842))
+            with fitz.open() as doc:
+                pg = doc.new_page(width=PW, height=PH)
+                if chunk: PDFEngine.draw_sheet(pg, chunk, mode, orient, cutline, cache)
+                return doc.tobytes()
+        return PDFEngine.sheet_cache.get(key, compose)
+
+    @staticmethod
+    def open_sheet(key, chunk, mode="1x1", paper="A4", orient="V", cutline=True, cache=None):
+        """以单页文档形式打开排版结果，调用方负责关闭"""
+        return fitz.open("pdf", PDFEngine.sheet_bytes(key, chunk, mode, paper, orient, cutline, cache))
+
+    @staticmethod
+    def compose_range(chunks, mode="1x1", paper="A4", orient="V", cutline=True, out_path=None):
+        """将一段连续的排版页排好并保存为分段 PDF（供多进程并行排版在子进程中调用）"""
+        PW, PH = PDFEngine.SIZES.get(paper, (595,842))
+        with fitz.open() as doc:
+            for chunk in chunks:
+                PDFEngine.draw_sheet(doc.new_page(width=PW, height=PH), chunk, mode, orient, cutline)
+            doc.save(out_path)
+        return out_path
+
+    @staticmethod
+    def compact_doc(doc, image_dpi=0):
+        """压缩前处理：字体子集化，可选将图片降采样到打印机 DPI"""
+        logger = logging.getLogger(__name__)
+        try: doc.subset_fonts()
+        except Exception as e: logger.warning(f"字体子集化失败: {e}")
+        if image_dpi:
+            if hasattr(doc, "rewrite_images"):
+                try: doc.rewrite_images(dpi_threshold=image_dpi + image_dpi // 10, dpi_target=image_dpi)
+                except Exception as e: logger.warning(f"图片降采样失败: {e}")
+            else:
+                logger.warning("当前 PyMuPDF 版本不支持图片降采样，已跳过")
+
+    @staticmethod
+    def compact_file(path, image_dpi=0):
+        """就地压缩已生成的 PDF，返回 (压缩前字节数, 压缩后字节数)"""
+        before = os.path.getsize(path)
+        tmp_path = path + ".compact"
+        with fitz.open(path) as doc:
+            PDFEngine.compact_doc(doc, image_dpi)
+            doc.save(tmp_path, **PDFEngine.COMPACT_SAVE)
+        after = os.path.getsize(tmp_path)
+        if after < before:
+            os.replace(tmp_path, path)
+        else:
+            os.remove(tmp_path); after = before
+        logging.getLogger(__name__).info(
+            f"压缩打印文件: {os.path.basename(path)} {before/1048576:.2f} MB -> {after/1048576:.2f} MB")
+        return before, after
+
     @staticmethod
-    def merge(files, mode="1x1", paper="A4", orient="V", cutline=True, out_path=None):
-        doc = fitz.open(); bw, bh = PDFEngine.SIZES.get(paper, (595,842))
-        
-        # [V3.3.0] 永远纵向
-        PW, PH = (bw, bh) 
-        
-        cells = []
-        if mode == "1x1":
-            cells = [(0, 0, PW, PH)] 
-        elif mode == "1x2":
-            cells = [(0, 0, PW, PH/2), (0, PH/2, PW, PH/2)]
-        elif mode == "2x2":
-            mw, mh = PW/2, PH/2
-            cells = [(0, 0, mw, mh), (mw, 0, mw, mh), (0, mh, mw, mh), (mw, mh, mw, mh)]
-            
-        if not files: doc.new_page(width=PW, height=PH)
-        PADDING = 40
-        chunk_size = len(cells)
+    def merge(files, mode="1x1", paper="A4", orient="V", cutline=True, out_path=None, cache=None, compact=True, image_dpi=0):
+        # [V3.3.0] 永远纵向；每页取自排版页缓存，只有内容变化的页才重新排版
+        doc = fitz.open()
         try:
-            for i in range(0, len(files), chunk_size):
-                chunk = files[i:i+chunk_size]; pg = doc.new_page(width=PW, height=PH)
-                for j, f in enumerate(chunk):
-                    if j >= len(cells): break
-                    try:
-                        cx, cy, cw, ch = cells[j]
-                        rotate_angle = -90 if orient == "H" else 0
-                        target_rect = fitz.Rect(cx + PADDING, cy + PADDING, cx + cw - PADDING, cy + ch - PADDING)
-                        
-                        # 检查文件类型
-                        if f.lower().endswith(('.jpg', '.jpeg', '.png')):
-                            # 图片文件:直接插入图片
-                            pg.insert_image(target_rect, filename=f, keep_proportion=True, rotate=rotate_angle)
-                        else:
-                            # PDF文件:使用 show_pdf_page
-                            with fitz.open(f) as src_doc:
-                                pg.show_pdf_page(target_rect, src_doc, 0, keep_proportion=True, rotate=rotate_angle)
-                    except Exception as e:
-                        logger = logging.getLogger(__name__)
-                        logger.error(f"处理文件失败 {os.path.basename(f)}: {str(e)}")
-                        pass
-                if cutline:
-                    s = pg.new_shape(); s.draw_rect(fitz.Rect(0,0,0,0)) 
-                    if mode == "1x2":
-                        s.draw_line(fitz.Point(0, PH/2), fitz.Point(PW, PH/2)) 
-                    elif mode == "2x2":
-                        s.draw_line(fitz.Point(PW/2, 0), fitz.Point(PW/2, PH)) 
-                        s.draw_line(fitz.Point(0, PH/2), fitz.Point(PW, PH/2)) 
-                    s.finish(color=(0,0,0), width=0.5, dashes=[4,4], stroke_opacity=0.6); s.commit(overlay=True)
-            if out_path: doc.save(out_path)
+            for key, chunk in PDFEngine.plan_sheets(files, mode, paper, orient, cutline):
+                with PDFEngine.open_sheet(key, chunk, mode, paper, orient, cutline, cache) as sheet:
+                    doc.insert_pdf(sheet)
+            if out_path:
+                if compact:
+                    PDFEngine.compact_doc(doc, image_dpi); doc.save(out_path, **PDFEngine.COMPACT_SAVE)
+                else:
+                    doc.save(out_path)
             return doc if not out_path else None
         finally:
             if out_path: doc.close()
@@ -1,52 +1,112 @@
 
 import os
+import re
+import shutil
+import platform
+import subprocess
 import fitz  # PyMuPDF
 import logging
-from PyQt6.QtGui import QPainter, QImage, QPageLayout, QTransform
+from PyQt6.QtGui import QPainter, QImage, QPageLayout
 from PyQt6.QtPrintSupport import QPrinter
 from PyQt6.QtCore import Qt
 
 class PrinterEngine:
+    # 光栅打印分辨率：打印机设为该 DPI，页面按打印区域像素尺寸只渲染一次，逐像素绘制不再缩放
+    RASTER_DPI = 300
+    _direct_support = {}  # 打印机名 -> 是否可直接接收 PDF
+    # 打印色彩模式：彩色 RGB、8 位灰度、1 位黑白（阈值 / 抖动）；黑白激光打印机用灰度或黑白可大幅减少打印数据
+    COLOR_MODES = {"rgb": "彩色", "gray": "灰度", "mono": "黑白（阈值）", "dither": "黑白（抖动）"}
+
+    @staticmethod
+    def supports_direct_pdf(printer_name):
+        """打印机能否直接接收 PDF：CUPS 队列（非 raw 队列）由驱动/过滤器自行处理矢量 PDF"""
+        if not printer_name or platform.system() == "Windows" or not shutil.which("lp"):
+            return False
+        if printer_name not in PrinterEngine._direct_support:
+            supported = False
+            try:
+                out = subprocess.run(["lpoptions", "-p", printer_name], capture_output=True, text=True, timeout=5)
+                model = re.search(r"printer-make-and-model='([^']*)'", out.stdout)
+                supported = out.returncode == 0 and not (model and "raw" in model.group(1).lower())
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.getLogger(__name__).warning(f"查询打印机失败 {printer_name}: {str(e)}")
+            PrinterEngine._direct_support[printer_name] = supported
+        return PrinterEngine._direct_support[printer_name]
+
+    @staticmethod
+    def submit_pdf(pdf_path, printer_name, copies=1, color_mode="rgb"):
+        """通过 CUPS lp 直接提交 PDF（矢量打印），返回 (成功, 信息)"""
+        logger = logging.getLogger(__name__)
+        cmd = ["lp", "-d", printer_name, "-n", str(copies), "-o", "fit-to-page"]
+        if color_mode != "rgb": cmd += ["-o", "print-color-mode=monochrome"]
+        cmd += ["-t", os.path.basename(pdf_path), pdf_path]
+        try:
+            out = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        except (OSError, subprocess.SubprocessError) as e:
+            return False, str(e)
+        if out.returncode != 0:
+            return False, out.stderr.strip() or f"lp 退出码 {out.returncode}"
+        logger.info(f"PDF 已直接提交到打印队列 {printer_name}: {out.stdout.strip()}, "
+                    f"大小 {os.path.getsize(pdf_path)/1048576:.2f} MB")
+        return True, "发送成功"
+
+    @staticmethod
+    def setup_raster(printer, copies=1):
+        """光栅打印的打印机设置"""
+        printer.setCopyCount(copies); printer.setResolution(PrinterEngine.RASTER_DPI); printer.setFullPage(True)
+        # 永远纵向
+        printer.setPageOrientation(QPageLayout.Orientation.Portrait)
+
+    @staticmethod
+    def paint_rect(printer):
+        """打印区域（设备像素）"""
+        try: return printer.pageLayout().paintRectPixels(printer.resolution())
+        except Exception: return printer.pageRect(QPrinter.Unit.DevicePixel)
+
+    @staticmethod
+    def render_page(page, rect, force_rotate=False, color_mode="rgb"):
+        """按打印区域像素尺寸渲染页面（只渲染一次，不再缩放），返回 (图像, x, y)，图像在 rect 中居中
+
+        非彩色模式直接以灰度色彩空间渲染；黑白模式再由灰度图转为 1 位图像。
+        """
+        pw, ph = (page.rect.height, page.rect.width) if force_rotate else (page.rect.width, page.rect.height)
+        zoom = min(rect.width() / pw, rect.height() / ph)
+        matrix = fitz.Matrix(zoom, zoom)
+        if force_rotate: matrix.prerotate(90)
+        if color_mode == "rgb":
+            pix = page.get_pixmap(matrix=matrix, alpha=False)
+            img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
+        else:
+            pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+            img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_Grayscale8)
+            if color_mode in ("mono", "dither"):
+                dither = Qt.ImageConversionFlag.DiffuseDither if color_mode == "dither" else Qt.ImageConversionFlag.ThresholdDither
+                img = img.convertToFormat(QImage.Format.Format_Mono, Qt.ImageConversionFlag.MonoOnly | dither)
+        x = int(rect.x() + (rect.width() - img.width()) / 2)
+        y = int(rect.y() + (rect.height() - img.height()) / 2)
+        return img, x, y
+
     @staticmethod
-    def print_pdf(pdf_path, printer, copies=1, force_rotate=False):
+    def print_pdf(pdf_path, printer, copies=1, force_rotate=False, direct=True, color_mode="rgb"):
         logger = logging.getLogger(__name__)
-        logger.info(f"开始打印: {os.path.basename(pdf_path)}, 份数: {copies}, DPI: 600")
+        name = printer.printerName()
+        if direct and not force_rotate and PrinterEngine.supports_direct_pdf(name):
+            ok, msg = PrinterEngine.submit_pdf(pdf_path, name, copies, color_mode)
+            if ok: return ok, msg
+            logger.warning(f"直接提交 PDF 失败，改用光栅打印: {msg}")
+        logger.info(f"开始打印: {os.path.basename(pdf_path)}, 份数: {copies}, DPI: {PrinterEngine.RASTER_DPI}")
         try:
-            # 【V5.0】提高打印质量: DPI 600, 渲染4.0倍
-            printer.setCopyCount(copies); printer.setResolution(600); printer.setFullPage(True)
+            PrinterEngine.setup_raster(printer, copies)
             with fitz.open(pdf_path) as doc:
                 painter = QPainter()
                 if not painter.begin(printer):
                     logger.error("无法启动打印任务")
                     return False, "无法启动打印任务"
+                rect = PrinterEngine.paint_rect(printer)
                 for i, page in enumerate(doc):
                     if i > 0: printer.newPage()
-                    # 【V5.0】提高渲染质量: 4.0倍缩放,保持PDF原始高分辨率
-                    pix = page.get_pixmap(matrix=fitz.Matrix(4.0, 4.0), alpha=False)
-                    img = QImage.fromData(pix.tobytes("ppm"))
-                    
-                    # 永远纵向
-                    printer.setPageOrientation(QPageLayout.Orientation.Portrait)
-                    
-                    if force_rotate:
-                         transform = QTransform()
-                         transform.rotate(90)
-                         img = img.transformed(transform)
-                    
-                    page_rect = printer.pageRect(QPrinter.Unit.DevicePixel)
-                    
-                    # [V3.5.0] 移除 0.96 缩放，全尺寸绘制
-                    try: safe_rect = printer.pageLayout().paintRectPixels(printer.resolution())
-                    except: safe_rect = page_rect
-
-                    target_w = int(safe_rect.width()); target_h = int(safe_rect.height())
-                    # 【V5.0】使用 SmoothTransformation 获得最佳质量
-                    scaled_img = img.scaled(target_w, target_h, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                    
-                    x = int(safe_rect.x() + (safe_rect.width() - scaled_img.width()) / 2)
-                    y = int(safe_rect.y() + (safe_rect.height() - scaled_img.height()) / 2)
-                    
-                    painter.drawImage(x, y, scaled_img)
+                    img, x, y = PrinterEngine.render_page(page, rect, force_rotate, color_mode)
+                    painter.drawImage(x, y, img)
                 painter.end()
             logger.info(f"打印任务发送成功: {os.path.basename(pdf_path)}")
             return True, "发送成功"
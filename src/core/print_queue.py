@@ -0,0 +1,417 @@
+"""
+打印队列模块
+多个打印任务排队执行：每个任务有独立的排版设置与打印机，任务持久化到 SQLite，重启后恢复；
+当前任务打印的同时为下一个任务排版，失败任务可重试，保留带耗时的历史记录
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+from PyQt6.QtCore import QObject, QSettings, pyqtSignal
+
+from .workers import PdfWorker, PrintWorker
+
+# 任务状态
+QUEUED = "queued"        # 等待排版
+LAYOUT = "layout"        # 排版中
+READY = "ready"          # 排版完成，等待打印
+PRINTING = "printing"    # 打印中
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+STATUS_NAMES = {QUEUED: "排队中", LAYOUT: "排版中", READY: "待打印", PRINTING: "打印中",
+                DONE: "已完成", FAILED: "失败", CANCELLED: "已取消"}
+ACTIVE = (LAYOUT, READY, PRINTING)  # 已开始、尚未结束的任务
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# 列名 -> 是否以 JSON 存储
+_COLUMNS = {
+    "name": False, "files": True, "printer": False, "mode": False, "paper": False, "orient": False,
+    "cutline": False, "copies": False, "force_rotate": False, "color_mode": False,
+    "status": False, "outputs": True, "printed": False, "attempts": False, "error": False,
+    "size_before": False, "size_after": False, "created_at": False,
+    "layout_started": False, "layout_finished": False, "print_started": False, "print_finished": False,
+}
+
+_DEFAULTS = {"mode": "1x1", "paper": "A4", "orient": "V", "cutline": True, "copies": 1, "force_rotate": False,
+             "color_mode": "rgb", "printed": 0, "attempts": 0}
+
+
+class PrintQueueStore:
+    """打印任务持久化存储"""
+
+    def __init__(self, db_path: str = None):
+        """
+        Args:
+            db_path: 数据库文件路径，默认为用户目录下的 .invoicemaster/print_queue.db
+        """
+        if db_path is None:
+            app_dir = os.path.expanduser("~/.invoicemaster")
+            os.makedirs(app_dir, exist_ok=True)
+            db_path = os.path.join(app_dir, "print_queue.db")
+        self.db_path = db_path
+        self._init_db()
+
+    def _init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS print_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                files TEXT,
+                printer TEXT,
+                mode TEXT,
+                paper TEXT,
+                orient TEXT,
+                cutline INTEGER,
+                copies INTEGER DEFAULT 1,
+                force_rotate INTEGER DEFAULT 0,
+                color_mode TEXT DEFAULT 'rgb',
+                status TEXT,
+                outputs TEXT DEFAULT '[]',
+                printed INTEGER DEFAULT 0,
+                attempts INTEGER DEFAULT 0,
+                error TEXT,
+                size_before INTEGER,
+                size_after INTEGER,
+                created_at REAL,
+                layout_started REAL,
+                layout_finished REAL,
+                print_started REAL,
+                print_finished REAL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def _to_row(job: Dict) -> Dict:
+        job = {**_DEFAULTS, **{k: v for k, v in job.items() if v is not None}}
+        return {k: json.dumps(job.get(k) or [], ensure_ascii=False) if is_json else job.get(k)
+                for k, is_json in _COLUMNS.items()}
+
+    @staticmethod
+    def _from_row(row) -> Dict:
+        job = dict(row)
+        for k, is_json in _COLUMNS.items():
+            if is_json: job[k] = json.loads(job[k] or "[]")
+        job["cutline"] = bool(job["cutline"]); job["force_rotate"] = bool(job["force_rotate"])
+        return job
+
+    def add(self, job: Dict) -> int:
+        row = self._to_row(job)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.execute(f"INSERT INTO print_jobs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                              list(row.values()))
+        job_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return job_id
+
+    def update(self, job: Dict):
+        row = self._to_row(job)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"UPDATE print_jobs SET {', '.join(k + ' = ?' for k in row)} WHERE id = ?",
+                     list(row.values()) + [job["id"]])
+        conn.commit()
+        conn.close()
+
+    def get_all(self) -> List[Dict]:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM print_jobs ORDER BY id").fetchall()
+        conn.close()
+        return [self._from_row(r) for r in rows]
+
+    def delete(self, job_ids: List[int]):
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany("DELETE FROM print_jobs WHERE id = ?", [(i,) for i in job_ids])
+        conn.commit()
+        conn.close()
+
+
+class PrintQueueManager(QObject):
+    """打印队列调度
+
+    一个排版槽、一个打印槽：排版槽按提交顺序为排队中的任务生成打印文件，
+    打印槽按提交顺序打印已就绪的文件（分卷任务的分卷生成一个打印一个），
+    因此当前任务打印时下一个任务已在排版。
+    """
+
+    job_changed = pyqtSignal(int)  # job_id
+    job_progress = pyqtSignal(int, str, int, int)  # job_id, 阶段("layout"/"print"), current, total
+    job_failed = pyqtSignal(int, str)  # job_id, error_message
+    queue_idle = pyqtSignal()  # 没有待处理的任务
+
+    def __init__(self, store: PrintQueueStore = None, printer_factory=None, output_dir: str = None, parent=None):
+        """
+        Args:
+            printer_factory: printer_factory(打印机名) -> QPrinter，打印机不可用时抛出异常
+            output_dir: 打印文件目录，默认为用户目录下的 .invoicemaster/print_jobs
+        """
+        super().__init__(parent)
+        self.store = store or PrintQueueStore()
+        self.printer_factory = printer_factory
+        self.output_dir = output_dir or os.path.expanduser("~/.invoicemaster/print_jobs")
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.logger = logging.getLogger(__name__)
+        self.pdf_worker = None
+        self.print_worker = None
+        self._layout_job = None  # 正在排版的任务 id
+        self._print_job = None  # 正在打印的任务 id
+        self._busy = False  # 自上次空闲以来是否执行过任务
+        self._stopping = False  # shutdown() 后不再调度新任务
+        self._jobs = {job["id"]: job for job in self.store.get_all()}
+        self._recover()
+
+    def _recover(self):
+        """上次退出时未完成的任务：排版中的重新排队；已开始打印的标记失败，由用户决定是否重试（避免重复打印）"""
+        for job in self._jobs.values():
+            if job["status"] == LAYOUT or (job["status"] == READY and not job["printed"]):
+                self._remove_outputs(job)
+                job["status"] = QUEUED; job["outputs"] = []
+            elif job["status"] in (READY, PRINTING):
+                job["status"] = FAILED; job["error"] = "程序退出时任务被中断"
+            else:
+                continue
+            self.store.update(job)
+
+    # ================= 公共接口 =================
+
+    def submit(self, files, printer, mode="1x1", paper="A4", orient="V", cutline=True,
+               copies=1, force_rotate=False, color_mode="rgb", name=None) -> int:
+        """提交打印任务，返回任务 id"""
+        job = {
+            "name": name or f"{len(files)} 张发票", "files": list(files), "printer": printer,
+            "mode": mode, "paper": paper, "orient": orient, "cutline": bool(cutline),
+            "copies": copies, "force_rotate": bool(force_rotate), "color_mode": color_mode,
+            "status": QUEUED, "outputs": [], "printed": 0, "attempts": 1, "created_at": time.time(),
+        }
+        job["id"] = self.store.add(job)
+        self._jobs[job["id"]] = job
+        self.logger.info(f"打印任务 #{job['id']} 已加入队列: {job['name']} -> {printer}")
+        self.job_changed.emit(job["id"])
+        self._schedule()
+        return job["id"]
+
+    def resume(self):
+        """继续执行上次退出时排队中的任务"""
+        self._schedule()
+
+    def jobs(self) -> List[Dict]:
+        return [dict(self._jobs[i]) for i in sorted(self._jobs)]
+
+    def get(self, job_id) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def pending_count(self) -> int:
+        """未结束的任务数"""
+        return sum(1 for job in self._jobs.values() if job["status"] not in FINISHED)
+
+    def retry(self, job_id) -> bool:
+        """重新执行失败或已取消的任务"""
+        job = self._jobs.get(job_id)
+        if not job or job["status"] not in (FAILED, CANCELLED):
+            return False
+        self._remove_outputs(job)
+        job.update(status=QUEUED, outputs=[], printed=0, error=None, attempts=(job["attempts"] or 0) + 1,
+                   layout_started=None, layout_finished=None, print_started=None, print_finished=None)
+        self._save(job)
+        self._schedule()
+        return True
+
+    def can_cancel(self, job_id) -> bool:
+        """尚未开始打印的任务可以取消"""
+        job = self._jobs.get(job_id)
+        return bool(job) and job["status"] in (QUEUED, LAYOUT, READY) and not job["printed"] and job_id != self._print_job
+
+    def cancel(self, job_id) -> bool:
+        if not self.can_cancel(job_id):
+            return False
+        job = self._jobs[job_id]
+        if job_id == self._layout_job and self.pdf_worker:
+            self.pdf_worker.cancel()
+            self.pdf_worker.wait()  # 已排入事件队列的信号仍可能送达，由 _layout_job 检查忽略
+            self.pdf_worker.deleteLater()
+            self.pdf_worker = None; self._layout_job = None
+        job["status"] = CANCELLED
+        self._remove_outputs(job)
+        self._save(job)
+        self._schedule()
+        return True
+
+    def remove(self, job_ids) -> int:
+        """从历史记录中删除已结束的任务"""
+        ids = [i for i in job_ids if i in self._jobs and self._jobs[i]["status"] in FINISHED]
+        for i in ids:
+            self._remove_outputs(self._jobs.pop(i))
+        self.store.delete(ids)
+        for i in ids: self.job_changed.emit(i)
+        return len(ids)
+
+    def clear_history(self) -> int:
+        return self.remove([i for i, job in self._jobs.items() if job["status"] in (DONE, CANCELLED)])
+
+    def shutdown(self):
+        """退出前停止排版与打印（打印在当前页发送完毕后停止），并立即保存打印中任务的最终状态
+        
+        排版中、待打印的任务在下次启动时重新排队；打印中的任务记为完成，或记为失败并注明已发送的页数。
+        """
+        self._stopping = True
+        if self.pdf_worker:
+            self.pdf_worker.cancel(); self.pdf_worker.wait()
+        if self.print_worker:
+            worker, job_id = self.print_worker, self._print_job
+            worker.cancel(); worker.wait()
+            # 线程的 finished 信号排在事件队列中，退出时不会再被处理：直接按结果更新任务
+            self._on_print_finished(job_id, *(worker.result or (False, "程序退出时任务被中断")))
+            job = self._jobs.get(job_id)
+            if job and job["status"] in ACTIVE:  # 分卷任务还有未打印的分卷
+                self._fail(job, f"程序退出时任务被中断，已打印 {job['printed']} 个分卷")
+
+    # ================= 调度 =================
+
+    def _save(self, job):
+        self.store.update(job)
+        self.job_changed.emit(job["id"])
+
+    def _remove_outputs(self, job):
+        for path in job.get("outputs") or []:
+            try: os.remove(path)
+            except OSError: pass
+
+    def _schedule(self):
+        if self._stopping:
+            return
+        if self.pdf_worker is None:
+            job = next((self._jobs[i] for i in sorted(self._jobs) if self._jobs[i]["status"] == QUEUED), None)
+            if job: self._start_layout(job)
+        if self.print_worker is None:
+            self._start_next_print()
+        if self.pdf_worker is None and self.print_worker is None and not self.pending_count() and self._busy:
+            self._busy = False
+            self.queue_idle.emit()
+
+    def _start_layout(self, job):
+        missing = [f for f in job["files"] if not os.path.exists(f)]
+        if missing:
+            self._fail(job, f"文件不存在: {os.path.basename(missing[0])} 等 {len(missing)} 个")
+            return self._schedule()
+
+        s = QSettings("MySoft", "InvoiceMaster")
+        out_path = os.path.join(self.output_dir, f"job_{job['id']}.pdf")
+        self.pdf_worker = PdfWorker(
+            job["files"], job["mode"], job["paper"], job["orient"], job["cutline"], out_path, self,
+            split_pages=int(s.value("print_split_pages", 0) or 0),
+            split_bytes=int(s.value("print_split_mb", 0) or 0) * 1024 * 1024,
+            compact=s.value("print_compact", True, type=bool),
+            image_dpi=int(s.value("print_image_dpi", 0) or 0),
+            processes=int(s.value("print_processes", 0) or 0) or (os.cpu_count() or 1))
+        self._layout_job = job["id"]
+        job_id = job["id"]
+        self.pdf_worker.progress.connect(lambda cur, total: self.job_progress.emit(job_id, "layout", cur, total))
+        self.pdf_worker.part_ready.connect(lambda path: self._on_part_ready(job_id, path))
+        self.pdf_worker.finished.connect(lambda path: self._on_layout_finished(job_id, path))
+        self.pdf_worker.error.connect(lambda msg: self._on_layout_error(job_id, msg))
+        self._busy = True
+        job.update(status=LAYOUT, outputs=[], printed=0, layout_started=time.time())
+        self._save(job)
+        self.pdf_worker.start()
+
+    def _on_part_ready(self, job_id, path):
+        job = self._jobs.get(job_id)
+        if not job or job["status"] not in ACTIVE:
+            return
+        job["outputs"].append(path)
+        self._save(job)
+        if self.print_worker is None:
+            self._start_next_print()
+
+    def _on_layout_finished(self, job_id, out_path):
+        if job_id != self._layout_job:  # 任务已取消或失败，排版线程的信号晚到
+            return
+        worker, self.pdf_worker, self._layout_job = self.pdf_worker, None, None
+        worker.wait(); worker.deleteLater()  # 信号在 run() 返回前发出，线程结束后才能释放
+        job = self._jobs.get(job_id)
+        if job and job["status"] in ACTIVE:
+            if not worker.parts:
+                job["outputs"] = [out_path]
+            if worker.size_report:
+                job["size_before"] = sum(r[1] for r in worker.size_report)
+                job["size_after"] = sum(r[2] for r in worker.size_report)
+            job["layout_finished"] = time.time()
+            if job["status"] == LAYOUT: job["status"] = READY
+            self._finish_if_printed(job)
+            self._save(job)
+        self._schedule()
+
+    def _on_layout_error(self, job_id, msg):
+        if job_id != self._layout_job:
+            return
+        self.pdf_worker.wait(); self.pdf_worker.deleteLater()
+        self.pdf_worker, self._layout_job = None, None
+        job = self._jobs.get(job_id)
+        if job: self._fail(job, f"排版失败: {msg}")
+        self._schedule()
+
+    def _start_next_print(self):
+        """打印最早开始的任务的下一个就绪文件；该任务没有就绪文件时等待，保证任务按顺序打印"""
+        job = next((self._jobs[i] for i in sorted(self._jobs) if self._jobs[i]["status"] in ACTIVE), None)
+        if not job or job["printed"] >= len(job["outputs"]):
+            return
+        try:
+            printer = self.printer_factory(job["printer"])
+        except Exception as e:
+            self._fail(job, f"打印机不可用: {str(e)}")
+            return self._schedule()
+
+        s = QSettings("MySoft", "InvoiceMaster")
+        job_id = job["id"]
+        self.print_worker = PrintWorker(
+            job["outputs"][job["printed"]], printer, job["copies"], job["force_rotate"], self,
+            direct=s.value("print_direct", True, type=bool),
+            prefetch=int(s.value("print_prefetch", 2) or 2), color_mode=job["color_mode"])
+        self.print_worker.progress.connect(lambda cur, total: self.job_progress.emit(job_id, "print", cur, total))
+        self.print_worker.finished.connect(lambda ok, msg: self._on_print_finished(job_id, ok, msg))
+        self._print_job = job_id
+        job["status"] = PRINTING
+        if not job.get("print_started"): job["print_started"] = time.time()
+        self._save(job)
+        self.print_worker.start()
+
+    def _on_print_finished(self, job_id, success, msg):
+        if job_id != self._print_job:  # 已在 shutdown() 中处理
+            return
+        self.print_worker, self._print_job = None, None
+        job = self._jobs.get(job_id)
+        if job:
+            if success:
+                job["printed"] += 1
+                self._finish_if_printed(job)
+                self._save(job)
+            else:
+                if job_id == self._layout_job and self.pdf_worker:
+                    self.pdf_worker.cancel(); self.pdf_worker.wait(); self.pdf_worker.deleteLater()
+                    self.pdf_worker, self._layout_job = None, None
+                self._fail(job, f"打印失败: {msg}")
+        self._schedule()
+
+    def _finish_if_printed(self, job):
+        """排版已结束且全部文件已打印：任务完成，删除打印文件"""
+        if job["layout_finished"] and job["printed"] >= len(job["outputs"]) and job["outputs"]:
+            job["status"] = DONE
+            job["print_finished"] = time.time()
+            self._remove_outputs(job)
+            self.logger.info(f"打印任务 #{job['id']} 完成: 排版 {job['layout_finished'] - job['layout_started']:.1f}s, "
+                             f"打印 {job['print_finished'] - job['print_started']:.1f}s")
+
+    def _fail(self, job, msg):
+        self.logger.error(f"打印任务 #{job['id']} 失败: {msg}")
+        job["status"] = FAILED; job["error"] = msg
+        self._save(job)
+        self.job_failed.emit(job["id"], msg)
@@ -0,0 +1,111 @@
+"""
+自动拼版模块
+按每张发票页面的实际尺寸，用 MaxRects 二维装箱算法把发票排到尽量少的纸张上
+结果只取决于输入尺寸，同一组发票的预览与打印输出完全一致
+"""
+
+from functools import lru_cache
+
+EPS = 1e-6
+SEARCH_STEPS = 8  # 二分查找统一缩放比例的次数
+
+
+class MaxRectsBin:
+    """单张纸的空闲矩形集合（MaxRects），按"最靠上、再靠左"的规则放置"""
+
+    def __init__(self, width, height):
+        self.free = [(0.0, 0.0, width, height)]
+
+    def find(self, w, h):
+        """返回可放置 w x h 的左上角坐标 (x, y)，放不下返回 None"""
+        best = None
+        for fx, fy, fw, fh in self.free:
+            if w <= fw + EPS and h <= fh + EPS:
+                score = (fy + h, fx)
+                if best is None or score < best[0]:
+                    best = (score, fx, fy)
+        return None if best is None else best[1:]
+
+    def place(self, x, y, w, h):
+        """占用矩形 (x, y, w, h)，拆分与之相交的空闲矩形"""
+        split = []
+        for fx, fy, fw, fh in self.free:
+            if x >= fx + fw - EPS or x + w <= fx + EPS or y >= fy + fh - EPS or y + h <= fy + EPS:
+                split.append((fx, fy, fw, fh))
+                continue
+            if x > fx + EPS: split.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw - EPS: split.append((x + w, fy, fx + fw - x - w, fh))
+            if y > fy + EPS: split.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh - EPS: split.append((fx, y + h, fw, fy + fh - y - h))
+        # 去掉被其他空闲矩形完全包含的矩形（相同矩形只保留第一个）
+        self.free = [r for i, r in enumerate(split)
+                     if not any(j != i and _contains(o, r) and (o != r or j < i) for j, o in enumerate(split))]
+
+
+def _contains(outer, inner):
+    ox, oy, ow, oh = outer
+    ix, iy, iw, ih = inner
+    return ix >= ox - EPS and iy >= oy - EPS and ix + iw <= ox + ow + EPS and iy + ih <= oy + oh + EPS
+
+
+def _pack(sizes, scale, CW, CH, margin, gap, lookback):
+    """以统一缩放比例 scale 按顺序装箱（超出可用区域的发票再单独等比缩小）"""
+    sheets, bins = [], []
+    for index, (w, h) in enumerate(sizes):
+        s = min(scale, CW / w, CH / h)
+        sw, sh = w * s, h * s
+        placed = None
+        for n in range(max(0, len(bins) - lookback), len(bins)):
+            pos = bins[n].find(sw + gap, sh + gap)
+            if pos is not None:
+                placed = (n, pos)
+                break
+        if placed is None:
+            bins.append(MaxRectsBin(CW + gap, CH + gap)); sheets.append([])
+            placed = (len(bins) - 1, (0.0, 0.0))
+        n, (x, y) = placed
+        bins[n].place(x, y, sw + gap, sh + gap)
+        sheets[n].append((index, (margin + x, margin + y, margin + x + sw, margin + y + sh)))
+    return sheets
+
+
+@lru_cache(maxsize=32)
+def _pack_min_sheets(sizes, CW, CH, margin, gap, min_scale, lookback):
+    """找出用纸最少时可取的最大统一缩放比例，并返回该比例下的装箱结果"""
+    best = _pack(sizes, min_scale, CW, CH, margin, gap, lookback)
+    full = _pack(sizes, 1.0, CW, CH, margin, gap, lookback)
+    if len(full) <= len(best):
+        return full
+    lo, hi = min_scale, 1.0
+    for _ in range(SEARCH_STEPS):
+        mid = (lo + hi) / 2
+        sheets = _pack(sizes, mid, CW, CH, margin, gap, lookback)
+        if len(sheets) <= len(best):
+            lo, best = mid, sheets
+        else:
+            hi = mid
+    return best
+
+
+def pack_sheets(sizes, sheet_w, sheet_h, margin=20, gap=16, min_scale=0.4, lookback=4):
+    """按顺序把发票装入尽量少的纸张
+
+    先以 min_scale 装箱得到最少纸张数，再二分查找不增加纸张数的最大统一缩放比例
+    （不超过原始尺寸），在省纸的前提下让发票尽量大。每张发票放进最近 lookback 张纸中
+    第一个放得下的位置，放不下才新开一张纸。
+
+    Args:
+        sizes: 每张发票在纸面上的原始尺寸 [(w, h), ...]，None 表示尺寸未知，按占满整页处理
+        sheet_w, sheet_h: 纸张尺寸（pt）
+        margin: 纸张四周留白
+        gap: 发票之间的间距（留作裁剪空间）
+        min_scale: 为减少用纸允许缩小到的最小比例
+        lookback: 回填时考虑的最近纸张数
+
+    Returns:
+        [[(发票序号, (x0, y0, x1, y1)), ...], ...]，每个元素为一张纸
+    """
+    CW, CH = sheet_w - 2 * margin, sheet_h - 2 * margin
+    sizes = tuple((float(size[0]), float(size[1])) if size and size[0] > 0 and size[1] > 0 else (CW, CH)
+                  for size in sizes)
+    return _pack_min_sheets(sizes, CW, CH, margin, gap, min_scale, lookback)
@@ -0,0 +1,203 @@
+"""
+缩略图模块
+发票首页缩略图在后台线程池中渲染，按 (文件内容哈希, 尺寸) 缓存到磁盘，超出字节预算时按最近使用淘汰
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+from PyQt6.QtCore import QObject, QBuffer, QIODevice, pyqtSignal
+from PyQt6.QtGui import QImage
+
+
+class ThumbnailCache:
+    """磁盘缩略图缓存
+
+    文件名为 内容哈希_宽x高.png，同一内容的文件改名/移动后仍命中；读取时更新文件 mtime，
+    淘汰时按 mtime 从旧到新删除，直到总大小不超过 max_bytes。
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = 64 * 1024 * 1024, hash_items: int = 512):
+        """
+        Args:
+            cache_dir: 缓存目录，默认为用户目录下的 .invoicemaster/thumbnails
+            max_bytes: 磁盘缓存上限
+            hash_items: 内存中记住的文件内容哈希数（按最近使用淘汰）
+        """
+        self.cache_dir = cache_dir or os.path.expanduser("~/.invoicemaster/thumbnails")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.hash_items = hash_items
+        self._hashes = OrderedDict()  # (路径, mtime, 大小) -> 内容哈希
+        self._total = sum(e.stat().st_size for e in os.scandir(self.cache_dir) if e.name.endswith(".png"))
+        self.logger = logging.getLogger(__name__)
+
+    def content_hash(self, path):
+        """文件内容哈希（按路径 + mtime + 大小记忆，文件未变时不重复计算）"""
+        st = os.stat(path)
+        stamp = (path, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            digest = self._hashes.get(stamp)
+            if digest is not None:
+                self._hashes.move_to_end(stamp)
+        if digest is None:
+            h = hashlib.sha1()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            digest = h.hexdigest()
+            with self.lock:
+                self._hashes[stamp] = digest
+                while len(self._hashes) > self.hash_items:
+                    self._hashes.popitem(last=False)
+        return digest
+
+    def _file(self, digest, size):
+        return os.path.join(self.cache_dir, f"{digest}_{size[0]}x{size[1]}.png")
+
+    def get(self, path, size):
+        """读取缓存的缩略图，未命中返回 None"""
+        cache_file = self._file(self.content_hash(path), size)
+        img = QImage(cache_file)
+        if img.isNull():
+            return None
+        try: os.utime(cache_file)
+        except OSError: pass
+        return img
+
+    def put(self, path, size, img):
+        cache_file = self._file(self.content_hash(path), size)
+        buf = QBuffer(); buf.open(QIODevice.OpenModeFlag.WriteOnly)
+        img.save(buf, "PNG")
+        data = bytes(buf.data())
+        tmp = cache_file + f".{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        with self.lock:
+            try: self._total -= os.path.getsize(cache_file)
+            except OSError: pass
+            os.replace(tmp, cache_file)
+            self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """按最近使用时间淘汰，直到低于预算的 90%（避免每次写入都扫描目录）"""
+        entries = sorted((e.stat().st_mtime_ns, e.path, e.stat().st_size)
+                         for e in os.scandir(self.cache_dir) if e.name.endswith(".png"))
+        self._total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path); self._total -= size
+            except OSError: pass
+
+    def image(self, path, size):
+        """取缩略图：先查缓存，未命中则渲染并写入缓存"""
+        img = self.get(path, size)
+        if img is None:
+            img = self.render(path, size)
+            self.put(path, size, img)
+        return img
+
+    @staticmethod
+    def render(path, size):
+        """渲染首页缩略图，等比缩放到 size 以内"""
+        with fitz.open(path) as doc:
+            page = doc.load_page(0)
+            zoom = min(size[0] / page.rect.width, size[1] / page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888).copy()
+
+    def clear(self):
+        with self.lock:
+            for e in os.scandir(self.cache_dir):
+                if e.name.endswith(".png"):
+                    try: os.remove(e.path)
+                    except OSError: pass
+            self._total = 0
+
+
+class ThumbnailService(QObject):
+    """后台缩略图服务
+
+    request() 立即返回内存中已有的缩略图，否则交给线程池（读磁盘缓存或渲染），完成后发出 thumbnail_ready。
+    列表在绘制行时请求，渲染失败的文件记录下来，避免每次重绘都重新提交。
+    内存 LRU 按 (路径, mtime, 大小) 索引，文件被原地替换后会重新加载。
+    """
+
+    thumbnail_ready = pyqtSignal(str, QImage)  # 文件路径, 缩略图
+    _loaded = pyqtSignal(object, QImage)  # 后台加载完成: (路径, mtime, 大小), 缩略图
+
+    def __init__(self, cache: ThumbnailCache = None, size=(80, 80), workers=2, memory_items=512, parent=None):
+        super().__init__(parent)
+        self.cache = cache or get_thumbnail_cache()
+        self.cache.hash_items = max(self.cache.hash_items, memory_items)
+        self.size = size
+        self.memory_items = memory_items
+        self._memory = OrderedDict()  # (路径, mtime, 大小) -> 缩略图
+        self._pending = set()
+        self._failed = set()  # 渲染失败的文件版本不再重复请求
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+        self.logger = logging.getLogger(__name__)
+        self._loaded.connect(self._store)
+
+    @staticmethod
+    def stamp(path):
+        """缩略图的版本标识 (路径, mtime, 大小)：文件被替换后随之改变"""
+        try:
+            st = os.stat(path)
+            return path, st.st_mtime_ns, st.st_size
+        except OSError:
+            return path, None, None
+
+    def request(self, path):
+        """请求缩略图：内存命中时直接返回，否则后台加载并返回 None"""
+        stamp = self.stamp(path)
+        img = self._memory.get(stamp)
+        if img is not None:
+            self._memory.move_to_end(stamp)
+            return img
+        if stamp not in self._pending and stamp not in self._failed:
+            self._pending.add(stamp)
+            self._pool.submit(self._load, stamp)
+        return None
+
+    def _load(self, stamp):
+        path = stamp[0]
+        try:
+            img = self.cache.image(path, self.size)
+        except Exception as e:
+            self.logger.warning(f"缩略图生成失败 {os.path.basename(path)}: {str(e)}")
+            img = QImage()
+        self._loaded.emit(stamp, img)
+
+    def _store(self, stamp, img):
+        """界面线程中收到缩略图：放入内存 LRU，再通知界面"""
+        self._pending.discard(stamp)
+        if img.isNull():
+            self._failed.add(stamp)
+        else:
+            self._memory[stamp] = img
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        self.thumbnail_ready.emit(stamp[0], img)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+_cache_instance = None
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """获取磁盘缩略图缓存单例"""
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = ThumbnailCache()
+    return _cache_instance
@@ -5,15 +5,22 @@
 import os
 import base64
 import logging
+import multiprocessing
 import time
+import queue
+import shutil
+import tempfile
+import threading
 import requests
 import fitz  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor, wait
 
 from PyQt6.QtCore import QThread, pyqtSignal, QSettings
-from PyQt6.QtGui import QImage, QPainter, QPageLayout, QTransform
+from PyQt6.QtGui import QPainter, QImage, QTransform
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtPrintSupport import QPrinter
-from PyQt6.QtCore import Qt
+
+from .pdf_engine import PDFEngine
+from .print_engine import PrinterEngine
 
 
 class OcrWorker(QThread):
@@ -25,6 +32,8 @@ class OcrWorker(QThread):
     error = pyqtSignal(int, str)  # index, error_message
     finished_all = pyqtSignal()  # 全部完成
     
+    PRIVATE_OCR_JOB_TIMEOUT = 600  # 私有OCR任务最长等待（秒）
+    
     def __init__(self, files_with_index, ak, sk, parent=None):
         """
         初始化 OCR Worker
@@ -173,14 +182,16 @@ class OcrWorker(QThread):
             with open(fp, 'rb') as f:
                 b = base64.b64encode(f.read()).decode()
         
-        # 调用私有 OCR API
-        url = f"{private_ocr_url}/ocr/invoice"
-        resp = requests.post(url, json={"image": b}, timeout=30)
-        
-        if resp.status_code != 200:
-            raise Exception(f"私有OCR返回错误: {resp.status_code}")
-        
-        data = resp.json()
+        # 调用私有 OCR API（优先异步任务接口，旧版服务回退到同步接口）
+        data = self._call_private_ocr_job(b, private_ocr_url)
+        if data is None:
+            url = f"{private_ocr_url}/ocr/invoice"
+            resp = requests.post(url, json={"image": b}, timeout=30)
+            
+            if resp.status_code != 200:
+                raise Exception(f"私有OCR返回错误: {resp.status_code}")
+            
+            data = resp.json()
         if not data.get("success"):
             raise Exception(f"私有OCR识别失败: {data.get('error', '未知错误')}")
         
@@ -204,6 +215,31 @@ class OcrWorker(QThread):
             "machine_code": data.get("machine_code", ""),
         }
     
+    def _call_private_ocr_job(self, b, private_ocr_url):
+        """通过 /ocr/jobs 提交识别任务并长轮询结果
+        
+        Returns:
+            单张识别结果字典；服务端不支持任务接口时返回 None
+        """
+        resp = requests.post(f"{private_ocr_url}/ocr/jobs", json={"image": b}, timeout=30)
+        if resp.status_code in (404, 405):
+            return None
+        if resp.status_code not in (200, 202):
+            raise Exception(f"私有OCR返回错误: {resp.status_code}")
+        
+        job_id = resp.json().get("job_id")
+        deadline = time.time() + self.PRIVATE_OCR_JOB_TIMEOUT
+        while time.time() < deadline:
+            if self._is_cancelled:
+                raise Exception("已取消")
+            resp = requests.get(f"{private_ocr_url}/ocr/jobs/{job_id}", params={"wait": 20}, timeout=30)
+            if resp.status_code != 200:
+                raise Exception(f"私有OCR返回错误: {resp.status_code}")
+            job = resp.json()
+            if job.get("status") == "done":
+                return (job.get("results") or [{}])[0] or {}
+        raise Exception("私有OCR任务超时")
+    
     def _call_baidu_ocr(self, fp):
         """调用百度云 OCR 服务"""
         if not self.ak:
@@ -279,10 +315,25 @@ class PdfWorker(QThread):
     progress = pyqtSignal(int, int)  # current, total
     finished = pyqtSignal(str)  # output_path
     error = pyqtSignal(str)  # error_message
+    part_ready = pyqtSignal(str)  # 分卷模式下，已完成的分卷文件路径
     
     SIZES = {"A4": (595, 842), "A5": (420, 595), "B5": (499, 709)}
     
-    def __init__(self, files, mode="1x1", paper="A4", orient="V", cutline=True, out_path=None, parent=None):
+    STREAM_THRESHOLD = 200  # 超过该页数时流式写盘
+    FLUSH_PAGES = 50  # 流式模式下每累计多少页写盘一次
+    PARALLEL_MIN_SHEETS = 200  # 待排版页数达到该值时才启用多进程（子进程启动约需 1 秒）
+    RANGES_PER_PROCESS = 4  # 每个进程分到的分段数（分段越多进度越细、负载越均衡）
+    
+    def __init__(self, files, mode="1x1", paper="A4", orient="V", cutline=True, out_path=None, parent=None,
+                 split_pages=0, split_bytes=0, compact=True, image_dpi=0, processes=1):
+        """
+        Args:
+            processes: 并行排版的进程数（1 表示在本线程内逐页排版）
+            split_pages: 每个分卷的最大页数（0 表示不按页数分卷）
+            split_bytes: 每个分卷的最大字节数（0 表示不按大小分卷）
+            compact: 保存后压缩打印文件（去重字体/图片、压缩流、清理无引用对象）
+            image_dpi: 压缩时将图片降采样到该 DPI（0 表示不降采样）
+        """
         super().__init__(parent)
         self.files = files
         self.mode = mode
@@ -290,6 +341,13 @@ class PdfWorker(QThread):
         self.orient = orient
         self.cutline = cutline
         self.out_path = out_path or os.path.expanduser("~/Desktop/Print_Job.pdf")
+        self.split_pages = split_pages
+        self.split_bytes = split_bytes
+        self.parts = []  # 分卷模式下生成的文件列表
+        self.compact = compact
+        self.image_dpi = image_dpi
+        self.size_report = []  # [(文件路径, 压缩前字节数, 压缩后字节数), ...]
+        self.processes = max(1, int(processes or 1))
         self._is_cancelled = False
         self.logger = logging.getLogger(__name__)
         
@@ -298,65 +356,37 @@ class PdfWorker(QThread):
         
     def run(self):
         try:
-            doc = fitz.open()
-            bw, bh = self.SIZES.get(self.paper, (595, 842))
-            PW, PH = (bw, bh)
-            PADDING = 40
+            sheets = PDFEngine.plan_sheets(self.files, self.mode, self.paper, self.orient, self.cutline)
+            # 输出设置不同（压缩、图片降采样、分卷）时生成的文件也不同，不能复用
+            job_key = (tuple(key for key, _ in sheets), self.compact, self.image_dpi, self.split_pages, self.split_bytes)
             
-            cells = []
-            if self.mode == "1x1":
-                cells = [(0, 0, PW, PH)]
-            elif self.mode == "1x2":
-                cells = [(0, 0, PW, PH/2), (0, PH/2, PW, PH/2)]
-            elif self.mode == "2x2":
-                mw, mh = PW/2, PH/2
-                cells = [(0, 0, mw, mh), (mw, 0, mw, mh), (0, mh, mw, mh), (mw, mh, mw, mh)]
+            # 同一组排版页已输出到该路径且文件未被改动：无需重新合并
+            if PDFEngine.sheet_cache.is_output_current(self.out_path, job_key):
+                self.logger.info(f"复用已生成的打印文件: {os.path.basename(self.out_path)}")
+                self.progress.emit(len(sheets), len(sheets))
+                self.finished.emit(self.out_path)
+                return
             
-            if not self.files:
-                doc.new_page(width=PW, height=PH)
+            if self.split_pages or self.split_bytes or len(sheets) > self.STREAM_THRESHOLD:
+                self._run_streaming(sheets, job_key)
+                return
             
-            chunk_size = len(cells)
-            total_chunks = (len(self.files) + chunk_size - 1) // chunk_size
+            doc = fitz.open()
             
-            for i in range(0, len(self.files), chunk_size):
+            for src, pno in self._iter_pages(sheets):
                 if self._is_cancelled:
                     doc.close()
                     return
-                    
-                chunk = self.files[i:i+chunk_size]
-                pg = doc.new_page(width=PW, height=PH)
-                
-                self.progress.emit(i // chunk_size + 1, total_chunks)
-                
-                for j, f in enumerate(chunk):
-                    if j >= len(cells):
-                        break
-                    try:
-                        cx, cy, cw, ch = cells[j]
-                        rotate_angle = -90 if self.orient == "H" else 0
-                        target_rect = fitz.Rect(cx + PADDING, cy + PADDING, cx + cw - PADDING, cy + ch - PADDING)
-                        
-                        if f.lower().endswith(('.jpg', '.jpeg', '.png')):
-                            pg.insert_image(target_rect, filename=f, keep_proportion=True, rotate=rotate_angle)
-                        else:
-                            with fitz.open(f) as src_doc:
-                                pg.show_pdf_page(target_rect, src_doc, 0, keep_proportion=True, rotate=rotate_angle)
-                    except Exception as e:
-                        self.logger.error(f"处理文件失败 {os.path.basename(f)}: {str(e)}")
-                
-                if self.cutline:
-                    s = pg.new_shape()
-                    s.draw_rect(fitz.Rect(0, 0, 0, 0))
-                    if self.mode == "1x2":
-                        s.draw_line(fitz.Point(0, PH/2), fitz.Point(PW, PH/2))
-                    elif self.mode == "2x2":
-                        s.draw_line(fitz.Point(PW/2, 0), fitz.Point(PW/2, PH))
-                        s.draw_line(fitz.Point(0, PH/2), fitz.Point(PW, PH/2))
-                    s.finish(color=(0, 0, 0), width=0.5, dashes=[4, 4], stroke_opacity=0.6)
-                    s.commit(overlay=True)
+                doc.insert_pdf(src, from_page=pno, to_page=pno)
+            
+            if self._is_cancelled:  # 并行排版中取消时生成器提前结束，不能当作完成写盘
+                doc.close()
+                return
             
             doc.save(self.out_path)
             doc.close()
+            self._compact(self.out_path)
+            PDFEngine.sheet_cache.record_output(self.out_path, job_key)
             self.finished.emit(self.out_path)
             
         except Exception as e:
@@ -364,77 +394,454 @@ class PdfWorker(QThread):
             self.error.emit(str(e))
 
 
+    def _iter_pages(self, sheets):
+        """按顺序逐页产出 (源文档, 页号)，并发出排版进度
+        
+        排版页优先取自 PDFEngine 缓存（预览中已排好的页直接复用）；
+        未缓存的页达到 PARALLEL_MIN_SHEETS 且 processes > 1 时，分段交给多个进程并行排版。
+        """
+        pending = sum(1 for key, _ in sheets if key not in PDFEngine.sheet_cache)
+        if self.processes > 1 and pending >= self.PARALLEL_MIN_SHEETS:
+            yield from self._iter_pages_parallel(sheets, pending)
+            return
+        for n, (key, chunk) in enumerate(sheets):
+            self.progress.emit(n + 1, len(sheets))
+            with PDFEngine.open_sheet(key, chunk, self.mode, self.paper, self.orient, self.cutline) as sheet:
+                yield sheet, 0
+    
+    def _iter_pages_parallel(self, sheets, pending):
+        """多进程并行排版：连续的未缓存页按段提交给进程池，各段生成分段 PDF 后按顺序拼接"""
+        total = len(sheets)
+        range_size = max(1, -(-pending // (self.processes * self.RANGES_PER_PROCESS)))
+        tmp_dir = tempfile.mkdtemp(prefix="invoice_layout_")
+        
+        # 按输出顺序排列：缓存页 ("sheet", key, chunk)；连续的未缓存页合并为一段 ("range", future, 页数)
+        plan, batch = [], []
+        # spawn 启动子进程：避免在多线程进程中 fork 时继承被其他线程持有的锁
+        pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        
+        last = [-1]
+        
+        def report():
+            """发出进度：已完成页数 = 缓存页 + 已排好的分段页数"""
+            current = total - pending + sum(n for kind, f, n in plan if kind == "range" and f.done())
+            if current != last[0]:
+                last[0] = current
+                self.progress.emit(current, total)
+        
+        def submit():
+            path = os.path.join(tmp_dir, f"range_{len(plan):04d}.pdf")
+            future = pool.submit(PDFEngine.compose_range, list(batch), self.mode, self.paper,
+                                 self.orient, self.cutline, path)
+            plan.append(("range", future, len(batch)))
+            batch.clear()
+        
+        try:
+            for key, chunk in sheets:
+                if key in PDFEngine.sheet_cache:
+                    if batch: submit()
+                    plan.append(("sheet", key, chunk))
+                else:
+                    batch.append(chunk)
+                    if len(batch) >= range_size: submit()
+            if batch: submit()
+            self.logger.info(f"并行排版: {pending} 页, {self.processes} 进程, 每段 {range_size} 页")
+            report()
+            
+            for kind, a, b in plan:
+                if kind == "sheet":
+                    with PDFEngine.open_sheet(a, b, self.mode, self.paper, self.orient, self.cutline) as sheet:
+                        yield sheet, 0
+                    continue
+                while not wait([a], timeout=0.2).done:
+                    if self._is_cancelled:
+                        return
+                    report()
+                report()
+                with fitz.open(a.result()) as part:
+                    for pno in range(len(part)):
+                        yield part, pno
+        finally:
+            for kind, a, _ in plan:
+                if kind == "range": a.cancel()
+            pool.shutdown(wait=True)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    def _compact(self, path):
+        """压缩已生成的打印文件并记录前后大小"""
+        if not self.compact:
+            return
+        try:
+            before, after = PDFEngine.compact_file(path, self.image_dpi)
+            self.size_report.append((path, before, after))
+        except Exception as e:
+            self.logger.warning(f"压缩打印文件失败 {os.path.basename(path)}: {str(e)}")
+    
+    def _compact_buffer(self, buf):
+        """压缩一批待写盘的页，返回 (压缩后的文档, 压缩前字节数)；失败时返回原文档"""
+        before = len(buf.tobytes())
+        try:
+            PDFEngine.compact_doc(buf, self.image_dpi)
+            compacted = fitz.open("pdf", buf.tobytes(**PDFEngine.COMPACT_SAVE))
+        except Exception as e:
+            self.logger.warning(f"压缩打印页失败: {str(e)}")
+            return buf, before
+        buf.close()
+        return compacted, before
+    
+    def _part_path(self, index):
+        """分卷文件路径：Print_Job.pdf -> Print_Job_001.pdf"""
+        base, ext = os.path.splitext(self.out_path)
+        return f"{base}_{index:03d}{ext}"
+    
+    def _run_streaming(self, sheets, job_key):
+        """流式合并：每累计 FLUSH_PAGES 页增量写盘一次，内存中只保留未写盘的页
+        
+        设置了分卷时，每个分卷达到页数/大小上限后立即关闭并发出 part_ready，
+        可在其余分卷生成的同时送往打印机。取消或出错时删除未完成的分卷文件。
+        
+        压缩：分卷大小有上限，分卷完成后整体压缩；不分卷时输出文件可能非常大，
+        改为每批页写盘前压缩，避免把整个文件重新读入内存。
+        """
+        split = bool(self.split_pages or self.split_bytes)
+        buf = fitz.open()
+        part_path = None
+        part_pages = 0
+        raw_bytes = 0  # 不分卷时各批页压缩前的字节数
+        
+        def flush():
+            nonlocal buf, part_path, part_pages, raw_bytes
+            if len(buf) == 0:
+                return
+            if self.compact and not split:
+                buf, before = self._compact_buffer(buf)
+                raw_bytes += before
+            if part_path is None:
+                part_path = self._part_path(len(self.parts) + 1) if split else self.out_path
+                buf.save(part_path)
+            else:
+                # 每次增量写盘都重新打开：同一个打开的文档连续 saveIncr 时，MuPDF 仍按打开时的文件长度追加，
+                # 第二次写入会覆盖第一次的增量段，文件需要修复才能打开
+                with fitz.open(part_path) as out:
+                    out.insert_pdf(buf)
+                    out.saveIncr()
+            part_pages += len(buf)
+            buf.close()
+            buf = fitz.open()
+        
+        def close_part():
+            nonlocal part_path, part_pages
+            if part_path is None:
+                return
+            self.logger.info(f"分卷完成: {os.path.basename(part_path)}, {part_pages} 页")
+            if split:
+                self._compact(part_path)
+                self.parts.append(part_path)
+                self.part_ready.emit(part_path)
+            elif self.compact:
+                self.size_report.append((part_path, raw_bytes, os.path.getsize(part_path)))
+            part_path = None
+            part_pages = 0
+        
+        try:
+            for src, pno in self._iter_pages(sheets):
+                if self._is_cancelled:
+                    break
+                
+                buf.insert_pdf(src, from_page=pno, to_page=pno)
+                
+                pending = part_pages + len(buf)
+                if len(buf) >= self.FLUSH_PAGES or (self.split_pages and pending >= self.split_pages):
+                    flush()
+                if part_path and ((self.split_pages and part_pages >= self.split_pages) or
+                                  (self.split_bytes and os.path.getsize(part_path) >= self.split_bytes)):
+                    close_part()
+            
+            if not self._is_cancelled:
+                flush()
+                close_part()
+        finally:
+            buf.close()
+            if part_path is not None:  # 取消或出错：删除未完成的分卷
+                try: os.remove(part_path)
+                except OSError: pass
+        
+        if self._is_cancelled:
+            return
+        if not split:
+            PDFEngine.sheet_cache.record_output(self.out_path, job_key)
+        self.finished.emit(self.parts[0] if split else self.out_path)
+
+
+class PreviewWorker(QThread):
+    """排版预览异步渲染线程
+
+    每次刷新预览带一个递增的代号（generation），界面只接收最新一代的结果；
+    新一代开始时取消旧线程。线程排好版后等待界面请求（request），只渲染请求的页（通常是可见页），
+    每渲染完一页即发出一页；新的请求替换尚未处理的旧请求，快速滚动时不渲染已滚过的页。
+    """
+    
+    planned = pyqtSignal(int, list)  # generation, [sheet_key, ...]
+    sheet_ready = pyqtSignal(int, int, QImage)  # generation, 页序号, 预览图
+    error = pyqtSignal(int, str)  # generation, error_message
+    
+    def __init__(self, generation, files, mode="1x1", paper="A4", orient="V", cutline=True, scale=2.0, parent=None):
+        """
+        Args:
+            scale: 渲染倍率
+        """
+        super().__init__(parent)
+        self.generation = generation
+        self.files = files
+        self.mode = mode
+        self.paper = paper
+        self.orient = orient
+        self.cutline = cutline
+        self.scale = scale
+        self._wanted = []  # 待渲染的页序号
+        self._cond = threading.Condition()
+        self._is_cancelled = False
+        self.logger = logging.getLogger(__name__)
+    
+    def cancel(self):
+        with self._cond:
+            self._is_cancelled = True
+            self._cond.notify()
+    
+    def request(self, indices):
+        """请求渲染指定页（替换尚未处理的请求）"""
+        with self._cond:
+            self._wanted = list(indices)
+            self._cond.notify()
+    
+    def run(self):
+        try:
+            sheets = PDFEngine.plan_sheets(self.files, self.mode, self.paper, self.orient, self.cutline)
+            if self._is_cancelled: return
+            self.planned.emit(self.generation, [key for key, _ in sheets])
+            while True:
+                with self._cond:
+                    while not self._wanted and not self._is_cancelled:
+                        self._cond.wait()
+                    if self._is_cancelled: return
+                    index = self._wanted.pop(0)
+                if 0 <= index < len(sheets):
+                    self.sheet_ready.emit(self.generation, index, self.render_sheet(*sheets[index]))
+        except Exception as e:
+            self.logger.error(f"预览渲染失败: {str(e)}", exc_info=True)
+            self.error.emit(self.generation, str(e))
+    
+    def render_sheet(self, key, chunk):
+        with PDFEngine.open_sheet(key, chunk, self.mode, self.paper, self.orient, self.cutline) as sheet:
+            pix = sheet[0].get_pixmap(matrix=fitz.Matrix(self.scale, self.scale))
+            img = QImage.fromData(pix.tobytes("ppm"))
+        if self.orient == "H":
+            # 横向排版逆时针旋转 90 度显示
+            transform = QTransform()
+            transform.rotate(-90)
+            img = img.transformed(transform)
+        return img
+
+
+class TileWorker(QThread):
+    """单张预览分块渲染线程
+
+    按请求从 PDF 中只渲染可见区域的图块（get_pixmap(clip=...)），放大后依然清晰，
+    渲染量只取决于可见区域而与页面大小无关。新的请求替换尚未处理的旧请求；没有请求时线程退出。
+    """
+    
+    tile_ready = pyqtSignal(object, QImage, int, int)  # 图块键 (doc_id, 缩放档, tx, ty), 图块, 像素原点 x, y
+    
+    TILE = 512  # 图块边长（像素）
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._wanted = []  # 待渲染的图块键
+        self._current = None  # 正在渲染的图块键
+        self._pdf = {}  # doc_id -> PDF 字节（只保留最新的文档）
+        self._running = False
+        self._is_cancelled = False
+        self.logger = logging.getLogger(__name__)
+    
+    def set_document(self, doc_id, pdf_bytes):
+        with self._lock:
+            self._pdf = {doc_id: pdf_bytes}; self._wanted = []
+    
+    def request(self, keys):
+        """请求渲染图块（替换尚未处理的请求），线程未运行时启动"""
+        with self._lock:
+            self._wanted = [k for k in keys if k != self._current]
+            if not self._wanted or self._running or self._is_cancelled: return
+            self._running = True
+        self.wait()  # 上一轮刚退出时等待其结束
+        self.start()
+    
+    def cancel(self):
+        with self._lock:
+            self._is_cancelled = True; self._wanted = []
+    
+    def run(self):
+        doc, doc_id = None, None
+        try:
+            while True:
+                with self._lock:
+                    if not self._wanted or self._is_cancelled:
+                        self._running = False; self._current = None
+                        return
+                    key = self._current = self._wanted.pop(0)
+                    data = self._pdf.get(key[0])
+                if data is None: continue
+                if doc_id != key[0]:
+                    if doc: doc.close()
+                    doc, doc_id = fitz.open("pdf", data), key[0]
+                img, x, y = self.render_tile(doc[0], *key[1:])
+                self.tile_ready.emit(key, img, x, y)
+        except Exception as e:
+            self.logger.error(f"图块渲染失败: {str(e)}", exc_info=True)
+            with self._lock:
+                self._running = False; self._current = None
+        finally:
+            if doc: doc.close()
+    
+    @classmethod
+    def render_tile(cls, page, zoom, tx, ty):
+        """以 zoom 倍率渲染第 (tx, ty) 个图块，返回 (图块, 像素原点 x, y)"""
+        T = cls.TILE
+        clip = fitz.Rect(tx * T / zoom, ty * T / zoom, (tx + 1) * T / zoom, (ty + 1) * T / zoom) & page.rect
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+        img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888).copy()
+        return img, pix.x, pix.y
+
+
 class PrintWorker(QThread):
     """打印异步处理线程"""
     
     progress = pyqtSignal(int, int)  # current_page, total_pages
     finished = pyqtSignal(bool, str)  # success, message
     
-    def __init__(self, pdf_path, printer, copies=1, force_rotate=False, parent=None):
+    def __init__(self, pdf_path, printer, copies=1, force_rotate=False, parent=None, direct=True, prefetch=2,
+                 color_mode="rgb"):
+        """
+        Args:
+            color_mode: 色彩模式，见 PrinterEngine.COLOR_MODES
+            direct: 打印机支持时直接提交 PDF（CUPS 矢量打印），否则按打印区域分辨率光栅化
+            prefetch: 光栅打印时最多提前渲染的页数（限制内存占用）
+        """
         super().__init__(parent)
         self.pdf_path = pdf_path
         self.printer = printer
         self.copies = copies
         self.force_rotate = force_rotate
+        self.direct = direct
+        self.prefetch = max(1, int(prefetch or 1))
+        self.color_mode = color_mode if color_mode in PrinterEngine.COLOR_MODES else "rgb"
+        self.pages_sent = 0  # 已绘制并提交的页数
+        self.result = None   # 结束时的 (success, message)，与 finished 信号一致，可在 wait() 后直接读取
+        self._is_cancelled = False
         self.logger = logging.getLogger(__name__)
+    
+    def cancel(self):
+        """在两页之间停止：已绘制的页照常提交给打印机，结果为失败并注明已发送的页数"""
+        self._is_cancelled = True
+    
+    def _finish(self, success, message):
+        self.result = (success, message)
+        self.finished.emit(success, message)
         
     def run(self):
         try:
-            self.logger.info(f"开始打印: {os.path.basename(self.pdf_path)}, 份数: {self.copies}")
+            self.logger.info(f"开始打印: {os.path.basename(self.pdf_path)}, 份数: {self.copies}, 色彩: {self.color_mode}")
             
-            self.printer.setCopyCount(self.copies)
-            self.printer.setResolution(600)
-            self.printer.setFullPage(True)
+            # 强力纠偏需要逐页旋转，只能走光栅打印
+            name = self.printer.printerName()
+            if self.direct and not self.force_rotate and PrinterEngine.supports_direct_pdf(name):
+                ok, msg = PrinterEngine.submit_pdf(self.pdf_path, name, self.copies, self.color_mode)
+                if ok:
+                    with fitz.open(self.pdf_path) as doc:
+                        self.pages_sent = len(doc)
+                        self.progress.emit(len(doc), len(doc))
+                    self._finish(True, msg)
+                    return
+                self.logger.warning(f"直接提交 PDF 失败，改用光栅打印: {msg}")
+            
+            PrinterEngine.setup_raster(self.printer, self.copies)
+            
+            painter = QPainter()
+            if not painter.begin(self.printer):
+                self._finish(False, "无法启动打印任务")
+                return
             
             with fitz.open(self.pdf_path) as doc:
                 total_pages = len(doc)
-                painter = QPainter()
-                
-                if not painter.begin(self.printer):
-                    self.finished.emit(False, "无法启动打印任务")
-                    return
-                
-                for i, page in enumerate(doc):
-                    self.progress.emit(i + 1, total_pages)
+            
+            # 渲染线程提前渲染页面放入有界队列，本线程同时绘制并换页，CPU 与打印管线并行
+            rect = PrinterEngine.paint_rect(self.printer)
+            pages = queue.Queue(maxsize=self.prefetch)
+            stop = threading.Event()
+            renderer = threading.Thread(target=self._render_ahead, args=(rect, pages, stop), daemon=True)
+            renderer.start()
+            try:
+                while not self._is_cancelled:
+                    t0 = time.perf_counter()
+                    item = pages.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    i, total_pages, img, x, y, render_ms = item
+                    wait_ms = (time.perf_counter() - t0) * 1000
                     
+                    self.progress.emit(i + 1, total_pages)
+                    t0 = time.perf_counter()
                     if i > 0:
                         self.printer.newPage()
-                    
-                    pix = page.get_pixmap(matrix=fitz.Matrix(4.0, 4.0), alpha=False)
-                    img = QImage.fromData(pix.tobytes("ppm"))
-                    
-                    self.printer.setPageOrientation(QPageLayout.Orientation.Portrait)
-                    
-                    if self.force_rotate:
-                        transform = QTransform()
-                        transform.rotate(90)
-                        img = img.transformed(transform)
-                    
-                    page_rect = self.printer.pageRect(QPrinter.Unit.DevicePixel)
-                    
-                    try:
-                        safe_rect = self.printer.pageLayout().paintRectPixels(self.printer.resolution())
-                    except Exception:
-                        safe_rect = page_rect
-                    
-                    target_w = int(safe_rect.width())
-                    target_h = int(safe_rect.height())
-                    scaled_img = img.scaled(
-                        target_w, target_h,
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                    
-                    x = int(safe_rect.x() + (safe_rect.width() - scaled_img.width()) / 2)
-                    y = int(safe_rect.y() + (safe_rect.height() - scaled_img.height()) / 2)
-                    
-                    painter.drawImage(x, y, scaled_img)
-                
+                    painter.drawImage(x, y, img)
+                    self.pages_sent = i + 1
+                    del item, img
+                    self.logger.info(f"打印第 {i + 1}/{total_pages} 页: 渲染 {render_ms:.0f} ms, "
+                                     f"等待 {wait_ms:.0f} ms, 绘制 {(time.perf_counter() - t0) * 1000:.0f} ms")
+            except Exception:
+                self.printer.abort()  # 不提交只打印了一部分的任务
+                raise
+            finally:
+                stop.set()
+                renderer.join()
+                if self._is_cancelled and not self.pages_sent:
+                    self.printer.abort()  # 还没有绘制任何页：不提交空白任务
                 painter.end()
             
+            if self._is_cancelled and self.pages_sent < total_pages:
+                self.logger.warning(f"打印被中断: {os.path.basename(self.pdf_path)}, 已发送 {self.pages_sent}/{total_pages} 页")
+                self._finish(False, f"打印被中断，已发送 {self.pages_sent}/{total_pages} 页")
+                return
             self.logger.info(f"打印任务发送成功: {os.path.basename(self.pdf_path)}")
-            self.finished.emit(True, "发送成功")
+            self._finish(True, "发送成功")
             
         except Exception as e:
             self.logger.error(f"打印失败: {str(e)}", exc_info=True)
-            self.finished.emit(False, str(e))
+            self._finish(False, str(e))
+    
+    def _render_ahead(self, rect, pages, stop):
+        """渲染线程：按顺序渲染页面放入 pages 队列（队列满时等待），结束时放入 None，出错时放入异常"""
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.2)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        try:
+            with fitz.open(self.pdf_path) as doc:
+                total_pages = len(doc)
+                for i, page in enumerate(doc):
+                    t0 = time.perf_counter()
+                    img, x, y = PrinterEngine.render_page(page, rect, self.force_rotate, self.color_mode)
+                    if not put((i, total_pages, img, x, y, (time.perf_counter() - t0) * 1000)):
+                        return
+                    del img
+            put(None)
+        except Exception as e:
+            put(e)
@@ -52,27 +52,6 @@ class ThemeManager:
             font-size: 13px;
             spacing: 8px;
         }
-        QWidget#ItemRow {
-            background: transparent;
-            border-radius: 10px;
-        }
-        QLabel#ItemTitle {
-            font-weight: 600;
-            font-size: 13px;
-            color: #1E293B;
-        }
-        QLabel#ItemDetail {
-            color: #64748B;
-            font-size: 12px;
-        }
-        QPushButton#RowDelBtn {
-            background: transparent;
-            border: none;
-            border-radius: 6px;
-        }
-        QPushButton#RowDelBtn:hover {
-            background-color: #FEE2E2;
-        }
         
         QToolButton#LayoutCard {
             background-color: white;
@@ -166,26 +145,26 @@ class ThemeManager:
         border: 1.5px solid #E2E8F0;
         border-radius: 8px;
     }
-    QListWidget {
+    QListView {
         background-color: white;
         border: 1px solid #E2E8F0;
         border-radius: 12px;
         outline: none;
         padding: 6px;
     }
-    QListWidget::item {
+    QListView::item {
         border-bottom: 1px solid #F1F5F9;
         border-radius: 8px;
         margin: 3px 2px;
         padding: 2px;
     }
-    QListWidget::item:selected {
+    QListView::item:selected {
         background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
             stop:0 #DBEAFE, stop:1 #EFF6FF);
         border-left: 4px solid #2563EB;
         color: #1E293B;
     }
-    QListWidget::item:hover {
+    QListView::item:hover {
         background-color: #F8FAFC;
         border-left: 3px solid #60A5FA;
     }
@@ -264,25 +243,25 @@ class ThemeManager:
     QPushButton#DangerBtn {
         color: #EF4444;
     }
-    QListWidget {
+    QListView {
         background-color: #1E293B;
         border: 1px solid #334155;
         border-radius: 12px;
         outline: none;
         padding: 6px;
     }
-    QListWidget::item {
+    QListView::item {
         border-bottom: 1px solid #334155;
         border-radius: 8px;
         margin: 3px 2px;
     }
-    QListWidget::item:selected {
+    QListView::item:selected {
         background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
             stop:0 #1E40AF, stop:1 #1E3A8A);
         border-left: 4px solid #3B82F6;
         color: white;
     }
-    QListWidget::item:hover {
+    QListView::item:hover {
         background-color: #334155;
         border-left: 3px solid #60A5FA;
     }
@@ -302,12 +281,6 @@ class ThemeManager:
     QCheckBox {
         color: #E2E8F0;
     }
-    QLabel#ItemTitle {
-        color: #F1F5F9;
-    }
-    QLabel#ItemDetail {
-        color: #94A3B8;
-    }
     QToolButton#LayoutCard {
         background-color: #1E293B;
         border: 2px solid #475569;
@@ -1,25 +1,28 @@
 
 import os
 import sys
-import gc
 import logging
 import platform
-import fitz  # PyMuPDF
+from collections import OrderedDict
 import pandas as pd
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                           QLabel, QPushButton, QListWidget, QListWidgetItem, 
+                           QLabel, QPushButton, 
                            QStackedWidget, QComboBox, QCheckBox, QRadioButton,
                            QButtonGroup, QToolButton, QFileDialog, QMessageBox,
                            QInputDialog, QSpinBox, QApplication, QAbstractItemView,
-                           QMenu)
+                           QMenu, QLineEdit)
 from PyQt6.QtCore import Qt, QSize, QTimer
-from PyQt6.QtGui import QIcon, QImage, QAction, QTransform
+from PyQt6.QtGui import QIcon, QAction
 from PyQt6.QtPrintSupport import QPrinter, QPrinterInfo, QPrintDialog
 from PyQt6.QtCore import QSettings
 
 from src.core.invoice_helper import InvoiceHelper
 from src.core.pdf_engine import PDFEngine
-from src.core.workers import OcrWorker, PdfWorker, PrintWorker
+from src.core.print_engine import PrinterEngine
+from src.core.workers import OcrWorker, PdfWorker, PreviewWorker
+from src.core.print_queue import PrintQueueManager, DONE
+from src.core.thumbnails import ThumbnailService
+from src.core.invoice_store import InvoiceStore, InvoiceRecord
 from src.core.license_manager import LicenseManager
 from src.core.database import get_db
 from src.themes.theme_manager import ThemeManager
@@ -32,15 +35,23 @@ from src.utils.config import UI_CONFIG
 from src.ui.dialogs import ProgressDialog, AboutDialog, ActivationDialog
 from src.ui.settings_dialog import SettingsDlg
 from src.ui.statistics_dialog import StatisticsDialog
-from src.ui.widgets import Card, DragArea, InvoiceItemWidget
+from src.ui.print_queue_dialog import PrintQueueDialog
+from src.ui.widgets import Card, DragArea, InvoiceListModel, InvoiceItemDelegate, InvoiceListView
 from src.ui.preview import AdvancedPreviewArea, SingleDocViewer
 
 class MainWindow(QMainWindow):
+    PREVIEW_CACHE_BYTES = 256 * 1024 * 1024  # 全分辨率预览图缓存上限
+    OCR_BATCH_MS = 100  # OCR 结果与进度合并刷新间隔
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle(f"{APP_NAME} {APP_VERSION}")
-        self.resize(1350, 850); self.data = []; self.theme_c = "#555"
+        self.resize(1350, 850); self.data = InvoiceStore(); self.theme_c = "#555"
         self.temp_files = [] 
+        self._sheet_images = OrderedDict(); self._sheet_images_bytes = 0  # (排版页键, 渲染倍率) -> 预览图（LRU）
+        self._preview_gen = 0; self._preview_keys = []; self._preview_scale = None  # 预览代号：只显示最新一次刷新的结果
+        self._preview_worker = None; self._preview_aspect = None
+        self._preview_workers = set()  # 运行中的预览线程（含已取消、正在退出的）
         self.preview_timer = QTimer(); self.preview_timer.setSingleShot(True); self.preview_timer.timeout.connect(self.generate_realtime_preview)
         self.current_printer = QPrinter(QPrinter.PrinterMode.HighResolution)
         self.right_panel = None; self.settings_card = None
@@ -49,9 +60,15 @@ class MainWindow(QMainWindow):
         # 异步工作线程引用
         self.ocr_worker = None
         self.pdf_worker = None
-        self.print_worker = None
         self.progress_dialog = None
         
+        # OCR 结果先缓存，定时批量应用到列表、数据库和统计
+        self._ocr_results = []; self._ocr_progress = None
+        self.ocr_timer = QTimer(); self.ocr_timer.setSingleShot(True); self.ocr_timer.timeout.connect(self._flush_ocr_results)
+        
+        # 打印队列：任务持久化，当前任务打印时为下一个任务排版
+        self.print_queue = PrintQueueManager(printer_factory=self._printer_for, parent=self)
+        
         self.init_ui()
         ThemeManager.apply(QApplication.instance())
         self.change_theme("Light")
@@ -66,10 +83,23 @@ class MainWindow(QMainWindow):
             try: os.remove(f)
             except: pass
         
+        # 停止预览渲染
+        for w in list(self._preview_workers): w.cancel(); w.wait()
+        self.single_viewer.shutdown()
+        self.thumbnails.shutdown()
+        
+        # 停止打印队列，未完成的任务下次启动时恢复
+        self.print_queue.shutdown()
+        
+        # 关闭缓存的源文档句柄，释放排版页缓存
+        PDFEngine.source_cache.clear()
+        PDFEngine.sheet_cache.clear()
+        
         # [V3.6] 清除数据库缓存，避免上一次数据带入下一次
         try:
             from src.core.database import get_db
             deleted = get_db().clear_all()
+            get_db().close()
             logger.info(f"关闭时清除数据库缓存: {deleted} 条记录")
         except Exception as e:
             logger.warning(f"清除数据库缓存失败: {e}")
@@ -92,9 +122,24 @@ class MainWindow(QMainWindow):
         list_title.setStyleSheet("color: #64748B; font-size: 12px; font-weight: 600; margin-top: 8px;")
         lv.addWidget(list_title)
         
-        self.list = QListWidget(); self.list.setIconSize(QSize(40,50)); self.list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        # 筛选框：内存索引，随输入即时过滤列表
+        self.filter_edit = QLineEdit(); self.filter_edit.setClearButtonEnabled(True); self.filter_edit.setMinimumHeight(32)
+        self.filter_edit.setPlaceholderText("筛选：名称/发票号/税号  >100  2024-03")
+        self.filter_edit.setToolTip("空格分隔多个条件，同时满足\n名称包含、发票号码或税号以输入开头\n金额：>100、<=500、100~500\n日期：2024-03、2024-01~2024-03、2024-03-05~")
+        self.filter_edit.textChanged.connect(lambda text: self.list_model.set_filter(text))
+        lv.addWidget(self.filter_edit)
+        
+        # 发票列表：模型直接引用发票存储 self.data，行由委托绘制（不再为每行创建控件）
+        # 缩略图后台生成并缓存到磁盘，行被绘制（滚动到可见）时才加载
+        self.thumbnails = ThumbnailService(parent=self); self.thumbnails.thumbnail_ready.connect(lambda *a: self.list.viewport().update())
+        self.list_model = InvoiceListModel(self.data, self); self.list_delegate = InvoiceItemDelegate(self.thumbnails, self)
+        self.list = InvoiceListView(); self.list.setModel(self.list_model); self.list.setItemDelegate(self.list_delegate)
+        self.list.setUniformItemSizes(True); self.list.setMouseTracking(True); self.list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu); self.list.customContextMenuRequested.connect(self.ctx_menu)
-        self.list.itemDoubleClicked.connect(self.edit_item); self.list.itemClicked.connect(self.show_single_doc)
+        # 视图行号经模型换算为发票存储中的行号（筛选时两者不同）
+        src = self.list_model.source_row
+        self.list.doubleClicked.connect(lambda idx: self.edit_item(src(idx.row()))); self.list.clicked.connect(lambda idx: self.show_single_doc(src(idx.row())))
+        self.list_delegate.delete_requested.connect(lambda row: self.delete_specific_item(src(row))); self.list_delegate.edit_requested.connect(lambda row: self.edit_item(src(row)))
         
         tb = QHBoxLayout(); tb.setSpacing(10)
         self.btn_set = QPushButton("设置")
@@ -163,7 +208,7 @@ class MainWindow(QMainWindow):
                 background: #059669;
             }}
         """)
-        self.btn_stats.clicked.connect(lambda: StatisticsDialog(self, self.data).exec())
+        self.btn_stats.clicked.connect(lambda: StatisticsDialog(self, self.list_model.stats, self.data).exec())
         
         tb.addWidget(self.btn_set); tb.addWidget(self.btn_stats); tb.addStretch(); tb.addWidget(self.btn_del)
         
@@ -174,7 +219,7 @@ class MainWindow(QMainWindow):
         # MIDDLE
         mid = QWidget(); mv = QVBoxLayout(mid); mv.setContentsMargins(0,0,0,0); mv.setSpacing(0)
         self.stack = QStackedWidget()
-        self.word_preview = AdvancedPreviewArea() 
+        self.word_preview = AdvancedPreviewArea(); self.word_preview.pages_needed.connect(self._on_preview_pages_needed)
         self.single_viewer = SingleDocViewer() 
         self.stack.addWidget(self.word_preview); self.stack.addWidget(self.single_viewer)
         mv.addWidget(self.stack)
@@ -202,6 +247,12 @@ class MainWindow(QMainWindow):
         self.btn_prop.clicked.connect(self.open_printer_props)
         self.btn_prop.setEnabled(False)
         r_pr.addWidget(self.cb_pr, 1); r_pr.addWidget(self.btn_prop); self.settings_layout.addLayout(r_pr)
+        
+        # 色彩模式按打印机分别记忆（黑白激光打印机选灰度/黑白可大幅减少打印数据）
+        r_col = QHBoxLayout(); self.cb_color = QComboBox()
+        for mode, label in PrinterEngine.COLOR_MODES.items(): self.cb_color.addItem(label, mode)
+        self.cb_color.setEnabled(False); self.cb_color.currentIndexChanged.connect(self.on_color_mode_changed)
+        r_col.addWidget(QLabel("色彩:")); r_col.addWidget(self.cb_color, 1); self.settings_layout.addLayout(r_col)
 
         r_cp = QHBoxLayout(); self.sp_cpy = QSpinBox(); self.sp_cpy.setRange(1,99); self.sp_cpy.setSuffix(" 份")
         self.cb_pap = QComboBox(); self.cb_pap.addItems(["A4", "A5", "B5"]); self.cb_pap.currentTextChanged.connect(self.show_layout_preview)
@@ -213,9 +264,14 @@ class MainWindow(QMainWindow):
         self.b2 = QToolButton(); self.b2.setObjectName("LayoutCard"); self.b2.setFixedSize(85, 85); self.b2.setIconSize(QSize(72,72))
         self.b4 = QToolButton(); self.b4.setObjectName("LayoutCard"); self.b4.setFixedSize(85, 85); self.b4.setIconSize(QSize(72,72))
         self.b1.setCheckable(True); self.b2.setCheckable(True); self.b4.setCheckable(True)
-        grp=QButtonGroup(self); grp.addButton(self.b1); grp.addButton(self.b2); grp.addButton(self.b4); self.b1.setChecked(True)
-        grp.buttonClicked.connect(self.show_layout_preview)
+        self.grp_layout=QButtonGroup(self); self.grp_layout.addButton(self.b1); self.grp_layout.addButton(self.b2); self.grp_layout.addButton(self.b4); self.b1.setChecked(True)
+        self.grp_layout.buttonClicked.connect(self.on_layout_card_clicked)
         rm.addWidget(self.b1); rm.addWidget(self.b2); rm.addWidget(self.b4); self.settings_layout.addLayout(rm)
+        
+        # 更多排版：自动拼版（按发票实际尺寸装箱，省纸）与更密的网格
+        self.cb_more = QComboBox(); self.cb_more.addItem("更多排版…", None); self.cb_more.addItem("🧩 自动拼版（省纸）", "auto")
+        for g in ["3x2", "2x3", "3x3", "2x4", "4x4"]: self.cb_more.addItem(f"▦ {g} 网格", g)
+        self.cb_more.currentIndexChanged.connect(self.on_more_layout_changed); self.settings_layout.addWidget(self.cb_more)
 
         r_dir = QHBoxLayout()
         self.rd_p = QRadioButton("纵向"); self.rd_l = QRadioButton("横向"); self.rd_l.setChecked(True)
@@ -239,6 +295,16 @@ class MainWindow(QMainWindow):
         self.btn_go = QPushButton(" 开始打印"); self.btn_go.setObjectName("PrimaryBtn"); self.btn_go.setIcon(Icons.get("print", "white")); self.btn_go.setMinimumHeight(50)
         self.btn_go.clicked.connect(self.run); rv.addWidget(self.btn_go)
         
+        r_q = QHBoxLayout(); self.lbl_queue = QLabel(); self.lbl_queue.setStyleSheet("color:#64748B; font-size:12px;")
+        btn_queue = QPushButton("打印队列"); btn_queue.clicked.connect(lambda: PrintQueueDialog(self, self.print_queue).exec())
+        r_q.addWidget(self.lbl_queue, 1); r_q.addWidget(btn_queue); rv.addLayout(r_q)
+        self.print_queue.job_changed.connect(self._update_queue_status)
+        self.print_queue.job_progress.connect(self._on_queue_progress)
+        self.print_queue.job_failed.connect(self._on_queue_failed)
+        self.print_queue.queue_idle.connect(self._on_queue_idle)
+        self._update_queue_status()
+        self.print_queue.resume()
+        
         btn_about = QPushButton(" 关于本软件"); btn_about.clicked.connect(lambda: AboutDialog(self).exec())
         rv.addWidget(btn_about); rv.addStretch()
 
@@ -247,6 +313,7 @@ class MainWindow(QMainWindow):
 
     def change_theme(self, mode):
         self.theme_c = ThemeManager.apply(QApplication.instance(), mode)
+        self.list_delegate.set_theme(mode); self.list.viewport().update()
         self.drag.upd(self.theme_c)
         self.btn_set.setIcon(Icons.get("settings", self.theme_c))
         self.btn_del.setIcon(Icons.get("trash", "#d73a49")) 
@@ -280,6 +347,10 @@ class MainWindow(QMainWindow):
 
     def _save_d_to_db(self, d):
         """辅助方法：将UI数据字典转换为数据库格式并保存"""
+        get_db().save_invoice(self._db_record(d))
+
+    def _db_record(self, d):
+        """UI数据字典转换为数据库记录"""
         # 基础数据来自 ext (OCR/解析结果)
         info = d.get("ext", {}).copy()
         
@@ -288,51 +359,48 @@ class MainWindow(QMainWindow):
         info["file_name"] = d.get("n")
         info["amount"] = d.get("a", 0.0)
         info["date"] = d.get("d", "")
-        
-        # 保存到数据库
-        get_db().save_invoice(info)
+        return info
 
-    def delete_specific_item(self, item):
-        row = self.list.row(item); self.list.takeItem(row); 
-        d = self.data.pop(row)
+    def delete_specific_item(self, row):
+        d, = self.list_model.remove_rows([row])
         get_db().delete_invoice(d['p'])
         self.calc(); self.show_layout_preview()
     
-    def show_single_doc(self, item):
-        row = self.list.row(item)
+    def show_single_doc(self, row):
         if row < len(self.data):
             f = self.data[row]['p']
             o = "H" if self.rd_l.isChecked() else "V"
             paper = self.cb_pap.currentText().replace("纸张: ", "") if "纸张: " in self.cb_pap.currentText() else self.cb_pap.currentText()
-            doc = PDFEngine.merge([f], "1x1", paper, o, self.chk_cut.isChecked(), out_path=None)
-            if doc:
-                # 使用平台自适应的渲染分辨率
-                scale = UI_CONFIG.get("preview_render_scale", 4.0)
-                pix = doc[0].get_pixmap(matrix=fitz.Matrix(scale, scale))
-                img = QImage.fromData(pix.tobytes("ppm"))
-                
-                # [V3.4.0] 单张预览也需要反向旋转修复 (与排版预览逻辑保持一致)
-                if o == "H":
-                    transform = QTransform()
-                    transform.rotate(-90) # 修正: 逆时针90度
-                    img = img.transformed(transform)
-                    
-                self.single_viewer.set_image(img) 
-                doc.close() 
+            (key, chunk), = PDFEngine.plan_sheets([f], "1x1", paper, o, self.chk_cut.isChecked())
+            # [V3.4.0] 单张预览也需要反向旋转修复 (与排版预览逻辑保持一致)；缩放时按可见区域从 PDF 重新渲染
+            self.single_viewer.set_pdf(PDFEngine.sheet_bytes(key, chunk, "1x1", paper, o, self.chk_cut.isChecked()),
+                                       rotate=90 if o == "H" else 0)
             self.stack.setCurrentIndex(1)
 
     def show_layout_preview(self): self.stack.setCurrentIndex(0); self.trigger_refresh()
-    def edit_item(self, item):
-        row = self.list.row(item)
+    def layout_mode(self):
+        """当前排版模式：更多排版中的选项优先，否则取排版卡片"""
+        if self.cb_more.currentData(): return self.cb_more.currentData()
+        m="1x1"; m="1x2" if self.b2.isChecked() else m; m="2x2" if self.b4.isChecked() else m
+        return m
+    def on_layout_card_clicked(self, btn):
+        self.cb_more.blockSignals(True); self.cb_more.setCurrentIndex(0); self.cb_more.blockSignals(False)
+        self.show_layout_preview()
+    def on_more_layout_changed(self, idx):
+        # 选中更多排版时取消排版卡片的选中状态（按钮组互斥时无法全部取消）
+        self.grp_layout.setExclusive(False)
+        for btn in self.grp_layout.buttons(): btn.setChecked(False)
+        self.grp_layout.setExclusive(True)
+        if idx == 0: self.b1.setChecked(True)
+        self.show_layout_preview()
+    def edit_item(self, row):
         old_val = self.data[row].get('a', 0)
         val, ok = QInputDialog.getDouble(self, "修正金额", "请输入正确金额:", old_val, 0.00, 1000000, 2)
         if ok:
             self.data[row]['a'] = val
             self.data[row]['manually_edited'] = True
             self._save_d_to_db(self.data[row])
-            widget = self.list.itemWidget(item)
-            if widget:
-                widget.update_display(self.data[row])
+            self.list_model.row_changed(row)
             self.calc()
     
     def on_printer_changed(self, idx):
@@ -344,6 +412,22 @@ class MainWindow(QMainWindow):
             p_name = self.cb_pr.currentText().replace("🖨️ ", "")
             self.current_printer = QPrinter(QPrinterInfo.printerInfo(p_name), QPrinter.PrinterMode.HighResolution)
             self.btn_go.setText(f" 打印到: {p_name[:8]}...")
+        mode = self._printer_color_mode() if idx else "rgb"
+        self.cb_color.blockSignals(True); self.cb_color.setCurrentIndex(max(0, self.cb_color.findData(mode))); self.cb_color.blockSignals(False)
+        self.cb_color.setEnabled(idx != 0)
+    
+    def _color_mode_key(self):
+        # QSettings 键中不能含 / 和 \（Windows 网络打印机名形如 \\server\name）
+        p_name = self.cb_pr.currentText().replace("🖨️ ", "")
+        return "print_color_mode/" + p_name.replace("/", "_").replace("\\", "_")
+    
+    def _printer_color_mode(self):
+        """当前打印机记忆的色彩模式"""
+        return QSettings("MySoft", "InvoiceMaster").value(self._color_mode_key(), "rgb")
+    
+    def on_color_mode_changed(self, idx):
+        if self.cb_pr.currentIndex() == 0: return
+        QSettings("MySoft", "InvoiceMaster").setValue(self._color_mode_key(), self.cb_color.currentData())
 
     def open_printer_props(self):
         dlg = QPrintDialog(self.current_printer, self)
@@ -351,27 +435,68 @@ class MainWindow(QMainWindow):
 
     def trigger_refresh(self): self.preview_timer.start(200)
     def generate_realtime_preview(self):
-        m="1x1"; m="1x2" if self.b2.isChecked() else m; m="2x2" if self.b4.isChecked() else m
+        """在后台线程生成排版预览；设置再次变化时旧的渲染作废"""
+        m=self.layout_mode()
         o="H" if self.rd_l.isChecked() else "V"; 
+        paper = self.cb_pap.currentText().replace("纸张: ", "") if "纸张: " in self.cb_pap.currentText() else self.cb_pap.currentText()
+        cut = self.chk_cut.isChecked()
+        scale = self._preview_render_scale(paper, o)
         
-        rotate_preview = (o == "H")
-
-        if hasattr(self, 'current_doc') and self.current_doc: self.current_doc.close(); self.current_doc = None
-        gc.collect()
+        self._preview_gen += 1
+        for w in self._preview_workers: w.cancel()
+        worker = PreviewWorker(self._preview_gen, [x['p'] for x in self.data], m, paper, o, cut, scale, self)
+        worker.planned.connect(self._on_preview_planned)
+        worker.sheet_ready.connect(self._on_preview_sheet)
+        worker.error.connect(self._on_preview_error)
+        worker.finished.connect(lambda: self._preview_workers.discard(worker) or worker.deleteLater())
+        self._preview_scale = scale
+        # 横向排版逆时针旋转 90 度显示
+        PW, PH = PDFEngine.SIZES.get(paper, (595, 842))
+        self._preview_aspect = PW / PH if o == "H" else PH / PW
+        self._preview_workers.add(worker)
+        worker.start()
+    
+    def _preview_render_scale(self, paper, orient):
+        """按预览区显示宽度 × 像素比计算渲染倍率（分档），不再渲染随即被缩小丢弃的像素"""
+        PW, PH = PDFEngine.SIZES.get(paper, (595, 842))
+        display_w = PH if orient == "H" else PW  # 横向排版旋转显示
+        return min(self.word_preview.render_width() / display_w, UI_CONFIG.get("preview_render_scale", 4.0))
+    
+    def _on_preview_planned(self, gen, keys):
+        if gen != self._preview_gen: return
+        self._preview_keys = keys; self._preview_worker = self.sender()  # 排版完成后才接收新一代的渲染请求
+        self.word_preview.set_page_count(len(keys), self._preview_aspect)
+    
+    def _on_preview_pages_needed(self, indices):
+        """预览区请求可见页：按页内容键复用已渲染的预览图，其余交给预览线程渲染"""
+        if self._preview_keys and self._on_preview_resized(): return
+        missing = []
+        for i in indices:
+            img = self._sheet_images.get((self._preview_keys[i], self._preview_scale)) if i < len(self._preview_keys) else None
+            if img is None: missing.append(i)
+            else: self._sheet_images.move_to_end((self._preview_keys[i], self._preview_scale)); self.word_preview.set_page(i, img)
+        if missing and self._preview_worker: self._preview_worker.request(missing)
+    
+    def _on_preview_resized(self):
+        """显示宽度跨过渲染分档：按新倍率重新生成预览"""
         paper = self.cb_pap.currentText().replace("纸张: ", "") if "纸张: " in self.cb_pap.currentText() else self.cb_pap.currentText()
-        self.current_doc = PDFEngine.merge([x['p'] for x in self.data], m, paper, o, self.chk_cut.isChecked(), out_path=None)
-        page_imgs = []
-        if self.current_doc:
-            for page in self.current_doc: 
-                # 使用平台自适应的渲染分辨率
-                scale = UI_CONFIG.get("preview_render_scale", 4.0)
-                pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale)); img = QImage.fromData(pix.tobytes("ppm"))
-                if rotate_preview:
-                    transform = QTransform()
-                    transform.rotate(-90) 
-                    img = img.transformed(transform)
-                page_imgs.append(img)
-        self.word_preview.show_pages(page_imgs)
+        if abs(self._preview_render_scale(paper, "H" if self.rd_l.isChecked() else "V") - self._preview_scale) < 1e-6:
+            return False
+        self.trigger_refresh()
+        return True
+    
+    def _on_preview_sheet(self, gen, index, img):
+        """逐页显示：每渲染完一页立即更新预览"""
+        if gen != self._preview_gen: return
+        key = (self._preview_keys[index], self._preview_scale)
+        if key in self._sheet_images: self._sheet_images_bytes -= self._sheet_images.pop(key).sizeInBytes()
+        self._sheet_images[key] = img; self._sheet_images_bytes += img.sizeInBytes()
+        while self._sheet_images_bytes > self.PREVIEW_CACHE_BYTES and len(self._sheet_images) > 1:
+            _, old = self._sheet_images.popitem(last=False); self._sheet_images_bytes -= old.sizeInBytes()
+        self.word_preview.set_page(index, img)
+    
+    def _on_preview_error(self, gen, msg):
+        if gen == self._preview_gen: logging.getLogger(__name__).warning(f"预览失败: {msg}")
 
     def add_files(self, fs):
         """添加文件并异步执行 OCR 识别"""
@@ -393,6 +518,8 @@ class MainWindow(QMainWindow):
             
             added_count = 0
             total_files = len(fs)
+            added = []  # 导入结束后一次加入列表（筛选中只需判断一批新行）
+            records = []  # 导入结束后一次批量写入数据库
             
             for i, f in enumerate(fs):
                 try:
@@ -411,7 +538,7 @@ class MainWindow(QMainWindow):
                     # 更新导入进度
                     import_progress.update_progress(i + 1, total_files, basename)
                     
-                    d = {"p": f, "n": basename, "d": "", "a": 0.0, "ext": {}, "_pending_ocr": True}
+                    d = InvoiceRecord(f, basename, pending_ocr=True)
                     
                     # 本地解析完整发票信息
                     # 本地解析完整发票信息
@@ -446,11 +573,6 @@ class MainWindow(QMainWindow):
                         else:
                             logger.info(f"⚠️ 本地解析失败: {os.path.basename(f)}，将使用OCR")
                     
-                    item = QListWidgetItem(self.list)
-                    item.setSizeHint(QSize(250, 60))
-                    widget = InvoiceItemWidget(d, item, self.delete_specific_item)
-                    self.list.setItemWidget(item, widget)
-                    
                     
                     # [V3.5] 财务严谨性过滤：虽然导入清单/凭证，但不计入统计
                     # 之前的版本是直接跳过(continue)，现在改为导入但标记类型
@@ -460,21 +582,23 @@ class MainWindow(QMainWindow):
                          # 可以在这里做一些额外的UI标记，目前仅依靠 calc() 排除统计
                          pass
                     
-                    self.data.append(d)
-                    widget.update_display(d)
-                    self._save_d_to_db(d)
+                    added.append(d)
+                    records.append(self._db_record(d))
                     added_count += 1
                     
                     # 记录需要 OCR 的文件（只有 _pending_ocr=True 的才需要）
                     # 如果有百度API Key 或 私有OCR地址，就添加到待识别列表
                     private_ocr_url = QSettings("MySoft", "InvoiceMaster").value("private_ocr_url", "")
                     if (ak or private_ocr_url) and d.get("_pending_ocr", True):
-                        files_with_index.append((start_idx + i, f))
+                        files_with_index.append((start_idx + len(added) - 1, f))
                 
                 except Exception as inner_e:
                     logger.error(f"处理单个文件失败 {f}: {str(inner_e)}", exc_info=True)
                     continue
 
+            self.list_model.append(added)
+            get_db().save_many(records)
+            
             # 关闭导入进度对话框
             import_progress.close()
             
@@ -515,14 +639,22 @@ class MainWindow(QMainWindow):
         self.progress_dialog.show()
     
     def _on_ocr_progress(self, current, total, filename):
-        """OCR 进度更新"""
-        if self.progress_dialog:
-            self.progress_dialog.update_progress(current, total, filename)
+        """OCR 进度更新（只记录最新进度，随结果批量刷新）"""
+        self._ocr_progress = (current, total, filename)
+        if not self.ocr_timer.isActive(): self.ocr_timer.start(self.OCR_BATCH_MS)
     
     def _on_ocr_result(self, idx, result):
-        """OCR 单个结果返回"""
+        """OCR 单个结果返回：先缓存，定时批量应用"""
+        self._ocr_results.append((idx, result))
+        if not self.ocr_timer.isActive(): self.ocr_timer.start(self.OCR_BATCH_MS)
+    
+    def _flush_ocr_results(self):
+        """批量应用缓存的 OCR 结果：一次数据库写入、一次列表刷新、一次统计"""
         logger = logging.getLogger(__name__)
-        if idx < len(self.data):
+        results, self._ocr_results = self._ocr_results, []
+        records, rows = [], []
+        for idx, result in results:
+            if idx >= len(self.data): continue
             d = self.data[idx]
             d["_pending_ocr"] = False
             
@@ -533,31 +665,32 @@ class MainWindow(QMainWindow):
                     d["d"] = result["date"]
                 d["ext"] = result
                 logger.info(f"OCR 结果已更新: {d['n']}, 金额: {d.get('a', 0)}")
-                self._save_d_to_db(d)
-
-            
-            # 更新列表项显示
-            item = self.list.item(idx)
-            if item:
-                widget = self.list.itemWidget(item)
-                if widget:
-                    widget.update_display(d)
-            
-            # 更新统计
+                records.append(self._db_record(d))
+            rows.append(idx)
+        
+        if records:
+            get_db().save_many(records)
+        if rows:
+            # 更新列表项显示与统计
+            self.list_model.rows_changed(rows)
             self.calc()
+        
+        progress, self._ocr_progress = self._ocr_progress, None
+        if progress and self.progress_dialog:
+            self.progress_dialog.update_progress(*progress)
     
     def _on_ocr_error(self, idx, error_msg):
-        """OCR 单个错误处理"""
+        """OCR 单个错误处理：与识别结果一起批量刷新（结束待识别状态）"""
         logger = logging.getLogger(__name__)
         if idx < len(self.data):
-            d = self.data[idx]
-            d["_pending_ocr"] = False
-            logger.warning(f"OCR 失败 [{d['n']}]: {error_msg}")
+            logger.warning(f"OCR 失败 [{self.data[idx]['n']}]: {error_msg}")
+            self._on_ocr_result(idx, None)
     
     def _on_ocr_finished(self):
         """OCR 全部完成"""
         logger = logging.getLogger(__name__)
         logger.info(f"异步 OCR 处理完成，共 {len(self.data)} 个发票")
+        self.ocr_timer.stop(); self._flush_ocr_results()
         
         if self.progress_dialog:
             self.progress_dialog.close()
@@ -568,41 +701,19 @@ class MainWindow(QMainWindow):
         self.show_layout_preview()
 
     def calc(self):
-        """计算统计信息（仅计算有效发票，排除清单和非发票凭证）"""
-        total_n = 0
-        total_a = 0.0
-        unrecognized_n = 0  # 未识别数量
-        
-        ignored_types = ["发票清单", "非发票凭证"]
-        
-        for d in self.data:
-            # [修复] 从 ext 中读取 invoice_type（而非 d 直接读取）
-            inv_type = d.get("ext", {}).get("invoice_type", "")
-            # 排除清单和非发票凭证
-            if inv_type in ignored_types or "非发票" in inv_type:
-                continue
-            
-            # 统计未识别发票（金额为0或无日期）
-            amount = d.get("a", 0)
-            date = d.get("d", "")
-            if amount == 0 or not date:
-                unrecognized_n += 1
-            
-            total_n += 1
-            total_a += amount
+        """显示统计信息（仅计算有效发票，排除清单和非发票凭证；汇总数据随增删改增量维护）"""
+        stats = self.list_model.stats
         
         # 显示格式：已识别数量 + 未识别数量
-        if unrecognized_n > 0:
-            self.lbl_inf.setText(f"{total_n} 张发票，{unrecognized_n} 张未识别")
+        if stats.unrecognized > 0:
+            self.lbl_inf.setText(f"{stats.count} 张发票，{stats.unrecognized} 张未识别")
         else:
-            self.lbl_inf.setText(f"{total_n} 张发票")
-        self.lbl_tot.setText(f"¥ {total_a:,.2f}")
-    def clear(self): self.list.clear(); self.data=[]; self.calc(); self.trigger_refresh()
+            self.lbl_inf.setText(f"{stats.count} 张发票")
+        self.lbl_tot.setText(f"¥ {stats.total_amount:,.2f}")
+    def clear(self): self.list_model.clear(); self.calc(); self.trigger_refresh()
     def ctx_menu(self, p): m=QMenu(); a=QAction("删除",self); a.triggered.connect(self.del_sel); m.addAction(a); m.exec(self.list.mapToGlobal(p))
     def del_sel(self):
-        for r in sorted([self.list.row(i) for i in self.list.selectedItems()], reverse=True): 
-            self.list.takeItem(r); 
-            d = self.data.pop(r)
+        for d in self.list_model.remove_rows([self.list_model.source_row(i.row()) for i in self.list.selectionModel().selectedRows()]):
             get_db().delete_invoice(d['p'])
         self.calc(); self.trigger_refresh()
     def xls(self):
@@ -698,16 +809,11 @@ class MainWindow(QMainWindow):
             import_time = datetime.now().strftime("%Y-%m-%d %H:%M")
             
             export_idx = 1
-            for x in self.data:
+            # [V3.5] 导出过滤：清单和非发票凭证不导出到Excel
+            # 这些只是为了管理查看，不应进入财务报表
+            for x in self.data.records(self.data.mask(include_ignored=False)):
                 ext = x.get("ext", {})
                 
-                # [V3.5] 导出过滤：清单和非发票凭证不导出到Excel
-                # 这些只是为了管理查看，不应进入财务报表
-                inv_type = ext.get("invoice_type", "")
-                skipped_types = ["发票清单", "非发票凭证"]
-                if inv_type in skipped_types or "非发票" in inv_type:
-                    continue
-                
                 # 处理金额字段,确保是数值类型
                 try: amount = float(x.get("a", 0) or 0)
                 except: amount = 0
@@ -971,37 +1077,43 @@ class MainWindow(QMainWindow):
             logger.error(f"Excel 导出失败: {str(e)}", exc_info=True)
             QMessageBox.critical(self, "导出失败", f"错误: {str(e)}")
     def run(self):
-        """执行打印操作（异步）"""
+        """执行打印操作：选择打印机时加入打印队列，否则生成 PDF 并打开"""
         if not self.data: 
             return QMessageBox.warning(self, "Tips", "请先添加发票")
         
+        # 准备参数
+        m = self.layout_mode()
+        o = "H" if self.rd_l.isChecked() else "V"
+        paper = self.cb_pap.currentText().replace("纸张: ", "") if "纸张: " in self.cb_pap.currentText() else self.cb_pap.currentText()
+        files = [x["p"] for x in self.data]
+        
+        if self.cb_pr.currentIndex() != 0:
+            # 加入打印队列：排版与打印在后台进行，可继续提交下一批
+            p_name = self.cb_pr.currentText().replace("🖨️ ", "")
+            self.print_queue.submit(files, p_name, m, paper, o, self.chk_cut.isChecked(), self.sp_cpy.value(),
+                                    self.chk_rotate.isChecked(), self._printer_color_mode())
+            return
+        
         self.btn_go.setText("处理中...")
         self.btn_go.setEnabled(False)
         QApplication.processEvents()
         
-        # 准备参数
-        m = "1x1"
-        m = "1x2" if self.b2.isChecked() else m
-        m = "2x2" if self.b4.isChecked() else m
-        o = "H" if self.rd_l.isChecked() else "V"
         out = os.path.expanduser("~/Desktop/Print_Job.pdf")
-        
         if out not in self.temp_files:
             self.temp_files.append(out)
         
-        paper = self.cb_pap.currentText().replace("纸张: ", "") if "纸张: " in self.cb_pap.currentText() else self.cb_pap.currentText()
-        
-        # 保存打印参数供回调使用
-        self._print_params = {
-            "out_path": out,
-            "open_only": self.cb_pr.currentIndex() == 0,
-            "copies": self.sp_cpy.value(),
-            "force_rotate": self.chk_rotate.isChecked()
-        }
+        # 大批量打印分卷设置（0 表示不分卷）
+        s = QSettings("MySoft", "InvoiceMaster")
+        split_pages = int(s.value("print_split_pages", 0) or 0)
+        split_bytes = int(s.value("print_split_mb", 0) or 0) * 1024 * 1024
+        compact = s.value("print_compact", True, type=bool)
+        image_dpi = int(s.value("print_image_dpi", 0) or 0)
+        processes = int(s.value("print_processes", 0) or 0) or (os.cpu_count() or 1)  # 0 表示自动
         
         # 使用异步 PDF 合并
-        files = [x["p"] for x in self.data]
-        self.pdf_worker = PdfWorker(files, m, paper, o, self.chk_cut.isChecked(), out, self)
+        self.pdf_worker = PdfWorker(files, m, paper, o, self.chk_cut.isChecked(), out, self,
+                                    split_pages=split_pages, split_bytes=split_bytes,
+                                    compact=compact, image_dpi=image_dpi, processes=processes)
         self.pdf_worker.progress.connect(self._on_pdf_progress)
         self.pdf_worker.finished.connect(self._on_pdf_merge_finished)
         self.pdf_worker.error.connect(self._on_pdf_error)
@@ -1012,24 +1124,25 @@ class MainWindow(QMainWindow):
         self.btn_go.setText(f"合并 PDF ({current}/{total})...")
         QApplication.processEvents()
     
+    def _open_output(self, out_path):
+        """用系统默认程序打开 PDF"""
+        if platform.system() == "Windows":
+            os.startfile(out_path, "print")
+        elif platform.system() == "Darwin":
+            os.system(f"open '{out_path}'")
+        else:
+            os.system(f"xdg-open '{out_path}'")
+    
     def _on_pdf_merge_finished(self, out_path):
-        """PDF 合并完成，开始打印"""
+        """PDF 合并完成，打开生成的文件"""
+        parts = self.pdf_worker.parts if self.pdf_worker else []
         self.pdf_worker = None
-        params = self._print_params
-        
-        if params["open_only"]:
-            # 仅打开 PDF
-            if platform.system() == "Windows":
-                os.startfile(out_path, "print")
-            elif platform.system() == "Darwin":
-                os.system(f"open '{out_path}'")
-            else:
-                os.system(f"xdg-open '{out_path}'")
-            self.btn_go.setText(" 开始打印")
-            self.btn_go.setEnabled(True)
-        else:
-            # 异步打印
-            self._start_async_print(out_path, params["copies"], params["force_rotate"])
+        for p in parts or [out_path]:
+            if p not in self.temp_files:
+                self.temp_files.append(p)
+            self._open_output(p)
+        self.on_printer_changed(self.cb_pr.currentIndex())
+        self.btn_go.setEnabled(True)
     
     def _on_pdf_error(self, error_msg):
         """PDF 合并错误"""
@@ -1038,28 +1151,29 @@ class MainWindow(QMainWindow):
         self.btn_go.setEnabled(True)
         QMessageBox.critical(self, "Error", error_msg)
     
-    def _start_async_print(self, pdf_path, copies, force_rotate):
-        """启动异步打印"""
-        p_name = self.cb_pr.currentText().replace("🖨️ ", "")
-        self.btn_go.setText(f"正在发送至 {p_name}...")
-        
-        self.print_worker = PrintWorker(pdf_path, self.current_printer, copies, force_rotate, self)
-        self.print_worker.progress.connect(self._on_print_progress)
-        self.print_worker.finished.connect(self._on_print_finished)
-        self.print_worker.start()
+    def _printer_for(self, p_name):
+        """打印队列按任务的打印机名取 QPrinter；当前选中的打印机沿用属性对话框中的设置"""
+        if p_name == self.cb_pr.currentText().replace("🖨️ ", "") and self.cb_pr.currentIndex() != 0:
+            return self.current_printer
+        info = QPrinterInfo.printerInfo(p_name)
+        if info.isNull():
+            raise RuntimeError(f"找不到打印机 {p_name}")
+        return QPrinter(info, QPrinter.PrinterMode.HighResolution)
     
-    def _on_print_progress(self, current, total):
-        """打印进度"""
-        self.btn_go.setText(f"打印中 ({current}/{total})...")
-        QApplication.processEvents()
+    def _update_queue_status(self, *args):
+        """打印队列状态"""
+        n = self.print_queue.pending_count()
+        self.lbl_queue.setText(f"打印队列: {n} 个任务进行中" if n else "打印队列: 空闲")
     
-    def _on_print_finished(self, success, msg):
-        """打印完成"""
-        self.print_worker = None
-        self.btn_go.setText(" 开始打印")
-        self.btn_go.setEnabled(True)
-        
-        if success:
-            QMessageBox.information(self, "完成", "已发送")
-        else:
-            QMessageBox.critical(self, "错误", msg)
+    def _on_queue_progress(self, job_id, stage, current, total):
+        self.lbl_queue.setText(f"任务 #{job_id} {'排版' if stage == 'layout' else '打印'}中 ({current}/{total})")
+    
+    def _on_queue_failed(self, job_id, msg):
+        QMessageBox.critical(self, "错误", f"打印任务 #{job_id} 失败\n{msg}\n可在打印队列中重试")
+    
+    def _on_queue_idle(self):
+        job = next((j for j in reversed(self.print_queue.jobs()) if j["status"] == DONE), None)
+        size_info = ""
+        if job and job.get("size_before") and job.get("size_after"):
+            size_info = f"\n打印文件: {job['size_before']/1048576:.1f} MB → {job['size_after']/1048576:.1f} MB"
+        QMessageBox.information(self, "完成", "打印队列已处理完毕" + size_info)
@@ -1,11 +1,14 @@
 
-import os
+import math
+import hashlib
+import fitz  # PyMuPDF
+from collections import OrderedDict
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                            QScrollArea, QFrame, QPushButton)
-from PyQt6.QtCore import Qt, QPointF, QTimer
-from PyQt6.QtGui import QPixmap, QImage, QColor
-from PyQt6.QtWidgets import QGraphicsDropShadowEffect
+from PyQt6.QtCore import Qt, QPointF, QTimer, QRect, QRectF, pyqtSignal
+from PyQt6.QtGui import QPixmap, QImage, QColor, QPainter
 from src.utils.icons import Icons
+from src.core.workers import TileWorker
 
 class HandScrollArea(QScrollArea):
     def __init__(self, parent_widget):
@@ -44,20 +47,37 @@ class HandScrollArea(QScrollArea):
             event.accept()
         else: super().mouseMoveEvent(event)
 
+class PageCanvas(QWidget):
+    """排版预览画布：页面为固定尺寸的占位，只绘制可见页"""
+    def __init__(self, area):
+        super().__init__()
+        self.area = area
+    def paintEvent(self, event):
+        self.area.paint_pages(QPainter(self), event.rect())
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if event.size().width() != event.oldSize().width(): self.area.on_width_changed()
+
 class AdvancedPreviewArea(QWidget):
+    """排版预览（虚拟化）
+
+    不再为每页创建控件：画布高度按页数与页面尺寸计算，滚动时只为可见页及前后少量预取页
+    请求预览图（pages_needed），收到后缩放到显示宽度并按内存预算做 LRU 缓存，离开视野的页被逐出。
+    """
+    pages_needed = pyqtSignal(list)  # 需要预览图的页序号（可见页在前）
+    MARGIN = 20; SPACING = 30; NUM_HEIGHT = 21  # 页间距、页码行高度
+    PREFETCH = 2  # 可见范围前后预取的页数
+    PIXMAP_BUDGET = 96 * 1024 * 1024  # 已缩放页面的内存预算
+    RENDER_STEPS = 4  # 渲染宽度每翻一倍分几档
+
     def __init__(self):
         super().__init__()
         self.layout = QVBoxLayout(self); self.layout.setContentsMargins(0,0,0,0); self.layout.setSpacing(0)
         self.scroll_area = HandScrollArea(self)
         self.scroll_area.set_interactive(False)
-        self.container = QWidget(); self.container.setStyleSheet("background-color: transparent;")
-        self.scroll_layout = QVBoxLayout(self.container); self.scroll_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop)
-        self.scroll_layout.setSpacing(30); self.scroll_layout.setContentsMargins(20, 20, 20, 20)
+        self.container = PageCanvas(self); self.container.setStyleSheet("background-color: transparent;")
         self.scroll_area.setWidget(self.container)
-        self.placeholder = QLabel("💡 暂无内容 - 请在左侧添加发票")
-        self.placeholder.setStyleSheet("color: #aaa; font-size: 16px; font-weight: bold;")
-        self.placeholder.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.scroll_layout.addWidget(self.placeholder)
+        self.scroll_area.verticalScrollBar().valueChanged.connect(self.request_visible)
         self.control_bar = QFrame(); self.control_bar.setObjectName("PreviewControlBar"); self.control_bar.setFixedHeight(45)
         cb_layout = QHBoxLayout(self.control_bar); cb_layout.setContentsMargins(15, 5, 15, 5)
         self.btn_prev = QPushButton(); self.btn_prev.setIcon(Icons.get("prev")); self.btn_prev.setObjectName("IconBtn"); self.btn_prev.setToolTip("上一页"); self.btn_prev.clicked.connect(self.scroll_prev)
@@ -66,50 +86,150 @@ class AdvancedPreviewArea(QWidget):
         cb_layout.addWidget(self.btn_prev); cb_layout.addWidget(self.lbl_page); cb_layout.addWidget(self.btn_next)
         cb_layout.addStretch()
         self.layout.addWidget(self.scroll_area, 1); self.layout.addWidget(self.control_bar)
-        self.raw_page_images = []; self.scale_factor = 1.0; self.page_widgets = []
+        self.page_count = 0; self.aspect = 842 / 595  # 页面高宽比
+        self._pixmaps = OrderedDict()  # 页序号 -> 已缩放的页面（LRU）
+        self._pixmap_bytes = 0
+        self._stale = set()  # 旧排版或旧宽度的页面：继续显示直到新图送达
+        self._requested = set()  # 已请求、尚未送达的页
         self.control_bar.setVisible(True)
-        self.hq_timer = QTimer(); self.hq_timer.setSingleShot(True); self.hq_timer.timeout.connect(lambda: self.render_pages(True))
-
-    def show_pages(self, page_images):
-        self.raw_page_images = page_images; self.render_pages()
-        self.lbl_page.setText(f"共 {len(page_images)} 页")
-
-    def render_pages(self, high_quality=True):
-        while self.scroll_layout.count():
-            item = self.scroll_layout.takeAt(0)
-            if item.widget(): item.widget().deleteLater()
-        if not self.raw_page_images: self.scroll_layout.addWidget(self.placeholder); return
-        for i, img in enumerate(self.raw_page_images):
-            page_lbl = QLabel(); pix = QPixmap.fromImage(img)
-            view_width = self.scroll_area.viewport().width() - 60
-            if view_width < 300: view_width = 300
-            # 始终使用高质量渲染，避免滚动时模糊
-            scaled_pix = pix.scaledToWidth(view_width, Qt.TransformationMode.SmoothTransformation)
-            page_lbl.setPixmap(scaled_pix)
-            shadow = QGraphicsDropShadowEffect(); shadow.setBlurRadius(25); shadow.setColor(QColor(0,0,0,120)); shadow.setOffset(0, 8)
-            page_lbl.setGraphicsEffect(shadow)
-            page_container = QWidget(); pc_layout = QVBoxLayout(page_container); pc_layout.setContentsMargins(0,0,0,0); pc_layout.setSpacing(5)
-            pc_layout.addWidget(page_lbl, 0, Qt.AlignmentFlag.AlignCenter)
-            num_lbl = QLabel(f"- {i+1} -"); num_lbl.setStyleSheet("color:#888; font-size:11px;"); num_lbl.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            pc_layout.addWidget(num_lbl)
-            self.scroll_layout.addWidget(page_container)
-
-    def trigger_update(self): self.render_pages(False); self.hq_timer.start(500)
-    def scroll_prev(self): self.scroll_area.verticalScrollBar().setValue(max(0, self.scroll_area.verticalScrollBar().value() - 600)); self.trigger_update()
-    def scroll_next(self): sb=self.scroll_area.verticalScrollBar(); sb.setValue(min(sb.maximum(), sb.value() + 600)); self.trigger_update()
+        # 缩放窗口时先拉伸旧图，停止后再按新宽度重新缩放
+        self.hq_timer = QTimer(); self.hq_timer.setSingleShot(True); self.hq_timer.timeout.connect(self.refresh_pages)
+
+    def set_page_count(self, count, aspect=None):
+        """预览开始渲染：按页数准备占位，已有的页先保留旧图，渲染完成后逐页替换"""
+        if aspect: self.aspect = aspect
+        self.page_count = count
+        for i in [i for i in self._pixmaps if i >= count]: self._drop(i)
+        self._stale = set(self._pixmaps); self._requested.clear()
+        self.lbl_page.setText(f"共 {count} 页")
+        self._update_geometry(); self.request_visible()
+
+    def set_page(self, index, img):
+        """某一页的预览图送达：在预取范围内才缩放缓存，否则丢弃（需要时再次请求）"""
+        self._requested.discard(index)
+        if index >= self.page_count: return
+        first, last = self.visible_range()
+        if not (first - self.PREFETCH <= index <= last + self.PREFETCH): return
+        self._drop(index)
+        pix = QPixmap.fromImage(img)
+        if pix.width() != self.device_width():
+            pix = pix.scaledToWidth(self.device_width(), Qt.TransformationMode.SmoothTransformation)
+        pix.setDevicePixelRatio(self.devicePixelRatioF())
+        self._pixmaps[index] = pix; self._pixmap_bytes += self._bytes(pix); self._stale.discard(index)
+        self._evict(first, last)
+        self.container.update(0, self.page_top(index), self.container.width(), self.slot_height())
+
+    def cached_pages(self): return list(self._pixmaps)
+
+    def page_width(self): return max(300, self.scroll_area.viewport().width() - 60)
+    def device_width(self): return int(self.page_width() * self.devicePixelRatioF())
+    def render_width(self):
+        """预览图的渲染宽度（设备像素）：按显示宽度 × 像素比向上取到分档，宽度在档内变化时无需重新渲染"""
+        return int(2 ** (math.ceil(math.log2(self.device_width()) * self.RENDER_STEPS) / self.RENDER_STEPS))
+    def page_height(self): return int(self.page_width() * self.aspect)
+    def slot_height(self): return self.page_height() + self.NUM_HEIGHT + self.SPACING
+    def page_top(self, index): return self.MARGIN + index * self.slot_height()
+
+    def visible_range(self):
+        """视口内的页序号范围 (first, last)"""
+        if not self.page_count: return 0, -1
+        top = self.scroll_area.verticalScrollBar().value() - self.MARGIN
+        bottom = top + self.scroll_area.viewport().height()
+        slot = self.slot_height()
+        return max(0, top // slot), min(self.page_count - 1, bottom // slot)
+
+    def request_visible(self, *args):
+        """请求可见页及预取页中尚无（或为旧图）的预览图"""
+        first, last = self.visible_range()
+        if last < first: return
+        order = list(range(first, last + 1)) + [i for d in range(1, self.PREFETCH + 1) for i in (last + d, first - d)]
+        needed = [i for i in order if 0 <= i < self.page_count and (i not in self._pixmaps or i in self._stale)
+                  and i not in self._requested]
+        if needed:
+            self._requested.update(needed); self.pages_needed.emit(needed)
+
+    def refresh_pages(self):
+        """宽度变化后：宽度不符的页面标记为旧图，按新宽度重新请求"""
+        self._stale |= {i for i, pix in self._pixmaps.items() if pix.width() != self.device_width()}; self._requested.clear()
+        self._update_geometry(); self.request_visible()
+
+    def _update_geometry(self):
+        self.container.setMinimumHeight(2 * self.MARGIN + self.page_count * self.slot_height())
+        self.container.update()
+
+    def _drop(self, index):
+        pix = self._pixmaps.pop(index, None)
+        if pix is not None: self._pixmap_bytes -= self._bytes(pix)
+
+    def _evict(self, first, last):
+        """超出内存预算时逐出最久未用、且不在可见范围内的页面"""
+        for i in list(self._pixmaps):
+            if self._pixmap_bytes <= self.PIXMAP_BUDGET: break
+            if not first <= i <= last: self._drop(i)
+
+    @staticmethod
+    def _bytes(pix): return pix.width() * pix.height() * max(1, pix.depth() // 8)
+
+    def paint_pages(self, painter, rect):
+        if not self.page_count:
+            painter.setPen(QColor("#aaa")); f = painter.font(); f.setPixelSize(16); f.setBold(True); painter.setFont(f)
+            painter.drawText(self.container.rect(), Qt.AlignmentFlag.AlignCenter, "💡 暂无内容 - 请在左侧添加发票")
+            painter.end(); return
+        pw, ph, slot = self.page_width(), self.page_height(), self.slot_height()
+        x = (self.container.width() - pw) // 2
+        first = max(0, (rect.top() - self.MARGIN) // slot); last = min(self.page_count - 1, (rect.bottom() - self.MARGIN) // slot)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        f = painter.font(); f.setPixelSize(11); painter.setFont(f)
+        for i in range(first, last + 1):
+            y = self.page_top(i)
+            for d, a in ((12, 12), (8, 20), (4, 30)):  # 简易投影
+                painter.fillRect(x - d + 4, y - d + 12, pw + 2 * d - 8, ph + 2 * d - 8, QColor(0, 0, 0, a))
+            pix = self._pixmaps.get(i)
+            if pix is None:
+                painter.fillRect(x, y, pw, ph, QColor("#6B6F73"))
+            else:
+                self._pixmaps.move_to_end(i)
+                painter.drawPixmap(QRect(x, y, pw, ph), pix)
+            painter.setPen(QColor("#888"))
+            painter.drawText(QRect(0, y + ph + 5, self.container.width(), self.NUM_HEIGHT - 5), Qt.AlignmentFlag.AlignCenter, f"- {i+1} -")
+        painter.end()
+
+    def trigger_update(self): self.container.update(); self.request_visible()
+    def scroll_prev(self): self.scroll_area.verticalScrollBar().setValue(max(0, self.scroll_area.verticalScrollBar().value() - self.slot_height())); self.trigger_update()
+    def scroll_next(self): sb=self.scroll_area.verticalScrollBar(); sb.setValue(min(sb.maximum(), sb.value() + self.slot_height())); self.trigger_update()
     def zoom_in(self): pass
     def zoom_out(self): pass
-    def resizeEvent(self, e): 
-        if self.raw_page_images: self.render_pages()
-        super().resizeEvent(e)
+    def on_width_changed(self):
+        if self.page_count: self._update_geometry(); self.hq_timer.start(200)
+
+class TileCanvas(QWidget):
+    """单张预览画布"""
+    def __init__(self, viewer):
+        super().__init__()
+        self.viewer = viewer
+    def paintEvent(self, event):
+        self.viewer.paint_page(QPainter(self), event.rect())
 
 class SingleDocViewer(HandScrollArea):
+    """单张发票预览
+
+    缩放时按目标倍率从 PDF 重新渲染可见区域：可见图块交给后台线程渲染，结果按
+    (文档, 缩放档, 图块) 缓存；图块送达前先显示低分辨率的整页占位图。
+    """
+    MARGIN = 20
+    ZOOM_STEPS = 4  # 每放大一倍分几个缩放档；图块按不低于当前倍率的档渲染，缩放档内只做轻微缩小
+    PLACEHOLDER_WIDTH = 800  # 占位图宽度（像素）
+    TILE_BUDGET = 64 * 1024 * 1024  # 图块缓存的内存预算
+
     def __init__(self):
         super().__init__(None) 
         self.set_interactive(True) 
-        self.label = QLabel(""); self.label.setAlignment(Qt.AlignmentFlag.AlignCenter); self.setWidget(self.label)
-        self.current_pixmap = None; self.zoom_level = 1.0
-        self.hq_timer = QTimer(); self.hq_timer.setSingleShot(True); self.hq_timer.timeout.connect(lambda: self.refresh_view(True))
+        self.setWidgetResizable(False)
+        self.canvas = TileCanvas(self); self.setWidget(self.canvas)
+        self.page_size = None; self.placeholder = None; self.doc_id = None; self.zoom_level = 1.0
+        self._tiles = OrderedDict(); self._tile_bytes = 0  # (doc_id, 缩放档, tx, ty) -> (图块, x, y)
+        self._requested = None
+        self.worker = TileWorker(self); self.worker.tile_ready.connect(self._on_tile_ready)
 
     def wheelEvent(self, event):
         if event.modifiers() == Qt.KeyboardModifier.ControlModifier:
@@ -117,26 +237,97 @@ class SingleDocViewer(HandScrollArea):
             else: self.zoom_out()
             event.accept()
         else: super().wheelEvent(event)
-    def zoom_in(self): self.zoom_level *= 1.1; self.refresh_view(False); self.hq_timer.start(500)
-    def zoom_out(self): self.zoom_level /= 1.1; self.refresh_view(False); self.hq_timer.start(500)
-    def set_image(self, img_or_path):
-        if isinstance(img_or_path, QImage): self.current_pixmap = QPixmap.fromImage(img_or_path)
-        elif isinstance(img_or_path, str) and os.path.exists(img_or_path): self.current_pixmap = QPixmap(img_or_path)
+    def zoom_in(self): self.set_zoom(self.zoom_level * 1.1)
+    def zoom_out(self): self.set_zoom(self.zoom_level / 1.1)
+
+    def set_pdf(self, pdf_bytes, rotate=0):
+        """显示单页 PDF；rotate 为显示时的旋转角度（同 show_pdf_page 的 rotate）"""
+        if rotate:
+            with fitz.open("pdf", pdf_bytes) as src:
+                r = src[0].rect
+                with fitz.open() as doc:
+                    pg = doc.new_page(width=r.height, height=r.width); pg.show_pdf_page(pg.rect, src, 0, rotate=rotate)
+                    pdf_bytes = doc.tobytes()
+        self.doc_id = hashlib.md5(pdf_bytes).hexdigest()
+        with fitz.open("pdf", pdf_bytes) as doc:
+            page = doc[0]; self.page_size = (page.rect.width, page.rect.height)
+            z = self.PLACEHOLDER_WIDTH * self.devicePixelRatioF() / page.rect.width
+            pix = page.get_pixmap(matrix=fitz.Matrix(z, z), alpha=False)
+            self.placeholder = QPixmap.fromImage(QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888))
+        self.worker.set_document(self.doc_id, pdf_bytes); self._requested = None
         self.fit_to_window()
-    def show_result(self, img): self.set_image(img)
+
     def fit_to_window(self):
-        if not self.current_pixmap: return
+        if not self.page_size: return
         view_size = self.viewport().size()
-        w_ratio = (view_size.width() - 40) / self.current_pixmap.width()
-        h_ratio = (view_size.height() - 40) / self.current_pixmap.height()
-        self.zoom_level = min(w_ratio, h_ratio)
-        self.refresh_view(True)
-    def refresh_view(self, high_quality=True):
-        if not self.current_pixmap: return
-        target_w = int(self.current_pixmap.width() * self.zoom_level)
-        target_h = int(self.current_pixmap.height() * self.zoom_level)
-        # 始终使用高质量渲染
-        scaled_pix = self.current_pixmap.scaled(target_w, target_h, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        self.label.setPixmap(scaled_pix)
-        shadow = QGraphicsDropShadowEffect(); shadow.setBlurRadius(30); shadow.setColor(QColor(0,0,0,180)); shadow.setOffset(0, 10)
-        self.label.setGraphicsEffect(shadow)
+        w_ratio = (view_size.width() - 2 * self.MARGIN) / self.page_size[0]
+        h_ratio = (view_size.height() - 2 * self.MARGIN) / self.page_size[1]
+        self.set_zoom(min(w_ratio, h_ratio))
+
+    def set_zoom(self, zoom):
+        """缩放并保持视口中心位置不变"""
+        if not self.page_size: return
+        hs, vs = self.horizontalScrollBar(), self.verticalScrollBar()
+        cx = (hs.value() + self.viewport().width() / 2) / max(1, self.canvas.width())
+        cy = (vs.value() + self.viewport().height() / 2) / max(1, self.canvas.height())
+        self.zoom_level = max(0.05, min(zoom, 20.0))
+        self._update_canvas_size()
+        hs.setValue(int(cx * self.canvas.width() - self.viewport().width() / 2))
+        vs.setValue(int(cy * self.canvas.height() - self.viewport().height() / 2))
+        self.canvas.update()
+
+    def _update_canvas_size(self):
+        w, h = self.page_size
+        self.canvas.resize(max(self.viewport().width(), int(w * self.zoom_level) + 2 * self.MARGIN),
+                           max(self.viewport().height(), int(h * self.zoom_level) + 2 * self.MARGIN))
+
+    def resizeEvent(self, e):
+        super().resizeEvent(e)
+        if self.page_size: self._update_canvas_size()
+
+    def zoom_bucket(self):
+        """不低于当前倍率 × 像素比的缩放档（图块按设备像素渲染）"""
+        zoom = self.zoom_level * self.devicePixelRatioF()
+        return 2 ** (math.ceil(math.log2(zoom) * self.ZOOM_STEPS - 1e-9) / self.ZOOM_STEPS)
+
+    def page_rect(self):
+        w, h = int(self.page_size[0] * self.zoom_level), int(self.page_size[1] * self.zoom_level)
+        return QRect((self.canvas.width() - w) // 2, (self.canvas.height() - h) // 2, w, h)
+
+    def paint_page(self, painter, rect):
+        if not self.page_size: painter.end(); return
+        page = self.page_rect()
+        for d, a in ((14, 12), (9, 24), (5, 36)):  # 简易投影
+            painter.fillRect(page.adjusted(-d + 4, -d + 14, d - 4, d + 2), QColor(0, 0, 0, a))
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawPixmap(page, self.placeholder)
+        # 可见区域对应的图块
+        b = self.zoom_bucket(); k = self.zoom_level / b; T = TileWorker.TILE
+        vis = rect.intersected(page).translated(-page.x(), -page.y())
+        missing = []
+        if not vis.isEmpty():
+            for ty in range(int(vis.top() / k) // T, int(vis.bottom() / k) // T + 1):
+                for tx in range(int(vis.left() / k) // T, int(vis.right() / k) // T + 1):
+                    key = (self.doc_id, b, tx, ty)
+                    tile = self._tiles.get(key)
+                    if tile is None: missing.append(key); continue
+                    self._tiles.move_to_end(key)
+                    img, x, y = tile
+                    painter.drawImage(QRectF(page.x() + x * k, page.y() + y * k, img.width() * k, img.height() * k), img)
+        painter.end()
+        if missing != (self._requested or []):
+            self._requested = missing; self.worker.request(missing)
+
+    def _on_tile_ready(self, key, img, x, y):
+        if key[0] != self.doc_id: return
+        if key in self._tiles: self._tile_bytes -= self._tiles.pop(key)[0].sizeInBytes()
+        self._tiles[key] = (img, x, y); self._tile_bytes += img.sizeInBytes()
+        while self._tile_bytes > self.TILE_BUDGET and len(self._tiles) > 1:
+            _, (old, _, _) = self._tiles.popitem(last=False); self._tile_bytes -= old.sizeInBytes()
+        if key[1] == self.zoom_bucket():
+            k = self.zoom_level / key[1]; page = self.page_rect()
+            self.canvas.update(QRectF(page.x() + x * k, page.y() + y * k, img.width() * k, img.height() * k).toAlignedRect())
+
+    def shutdown(self):
+        """停止图块渲染线程"""
+        self.worker.cancel(); self.worker.wait()
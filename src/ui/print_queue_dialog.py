@@ -0,0 +1,181 @@
+from datetime import datetime
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
+                           QTableWidget, QTableWidgetItem, QHeaderView, QPushButton, QAbstractItemView)
+from PyQt6.QtGui import QColor
+from PyQt6.QtCore import Qt
+from src.core.print_queue import STATUS_NAMES, DONE, FAILED, CANCELLED
+
+STATUS_COLORS = {DONE: "#10B981", FAILED: "#EF4444", CANCELLED: "#94A3B8"}
+
+
+class PrintQueueDialog(QDialog):
+    """打印队列对话框（当前任务与历史记录）"""
+
+    def __init__(self, parent=None, queue=None):
+        super().__init__(parent)
+        self.setWindowTitle("打印队列")
+        self.setMinimumSize(820, 460)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)  # 关闭后断开与队列的信号连接
+        self.queue = queue
+        self._rows = {}  # job_id -> 行号
+
+        self._setup_ui()
+        self._load_jobs()
+        self.queue.job_changed.connect(self._on_job_changed)
+        self.queue.job_progress.connect(self._on_job_progress)
+
+    def _setup_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+
+        # 标题
+        title = QLabel("🖨️ 打印队列")
+        title.setStyleSheet("font-size: 20px; font-weight: bold; color: #1E293B;")
+        layout.addWidget(title)
+
+        self.table = self._create_table(["#", "任务", "打印机", "排版", "状态", "提交时间", "排版耗时", "打印耗时", "说明"])
+        self.table.itemSelectionChanged.connect(self._update_buttons)
+        layout.addWidget(self.table, 1)
+
+        # 按钮
+        btn_layout = QHBoxLayout()
+        self.retry_btn = self._create_button("重试", self._retry)
+        self.cancel_btn = self._create_button("取消", self._cancel)
+        self.remove_btn = self._create_button("删除记录", self._remove)
+        clear_btn = self._create_button("清除已完成", self._clear)
+        for b in (self.retry_btn, self.cancel_btn, self.remove_btn, clear_btn):
+            btn_layout.addWidget(b)
+        btn_layout.addStretch()
+
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.close)
+        close_btn.setStyleSheet("""
+            QPushButton {
+                background: #3B82F6; border: none;
+                border-radius: 8px; padding: 10px 24px;
+                color: white; font-weight: 500;
+            }
+            QPushButton:hover { background: #2563EB; }
+        """)
+        btn_layout.addWidget(close_btn)
+
+        layout.addLayout(btn_layout)
+        self._update_buttons()
+
+    def _create_button(self, text, slot):
+        btn = QPushButton(text)
+        btn.clicked.connect(slot)
+        btn.setStyleSheet("""
+            QPushButton {
+                background: #F1F5F9; border: 1px solid #E2E8F0;
+                border-radius: 8px; padding: 10px 24px;
+                color: #475569; font-weight: 500;
+            }
+            QPushButton:hover { background: #E2E8F0; }
+            QPushButton:disabled { color: #CBD5E1; }
+        """)
+        return btn
+
+    def _create_table(self, headers):
+        """创建任务表格"""
+        table = QTableWidget()
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+
+        header = table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        header.setStretchLastSection(True)
+        header.setStyleSheet("""
+            QHeaderView::section {
+                background-color: #F8FAFC;
+                padding: 8px;
+                border: none;
+                font-weight: 600;
+                color: #475569;
+            }
+        """)
+
+        table.verticalHeader().setVisible(False)
+        table.setShowGrid(False)
+        table.setAlternatingRowColors(True)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        table.setStyleSheet("""
+            QTableWidget { border: none; }
+            QTableWidget::item { padding: 5px; }
+            QTableWidget::item:selected { background-color: #EFF6FF; color: #1E293B; }
+        """)
+
+        return table
+
+    @staticmethod
+    def _duration(start, end):
+        if not start: return "-"
+        if not end: return "进行中"
+        return f"{end - start:.1f} 秒"
+
+    def _load_jobs(self):
+        """加载全部任务（最新的在最上面）"""
+        jobs = list(reversed(self.queue.jobs()))
+        self.table.setRowCount(len(jobs))
+        self._rows = {}
+        for row, job in enumerate(jobs):
+            self._rows[job["id"]] = row
+            self._fill_row(row, job)
+        self._update_buttons()
+
+    def _fill_row(self, row, job):
+        note = job.get("error") or ""
+        if not note and job.get("size_before") and job.get("size_after"):
+            note = f"{job['size_before']/1048576:.1f} MB → {job['size_after']/1048576:.1f} MB"
+        if (job.get("attempts") or 0) > 1:
+            note = f"第 {job['attempts']} 次 {note}".strip()
+        values = [str(job["id"]), job["name"], job["printer"],
+                  f"{job['mode']} {job['paper']} {'横向' if job['orient'] == 'H' else '纵向'} ×{job['copies']}",
+                  STATUS_NAMES.get(job["status"], job["status"]),
+                  datetime.fromtimestamp(job["created_at"]).strftime("%m-%d %H:%M:%S") if job.get("created_at") else "-",
+                  self._duration(job.get("layout_started"), job.get("layout_finished")),
+                  self._duration(job.get("print_started"), job.get("print_finished")), note]
+        for col, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            if col == 0: item.setData(Qt.ItemDataRole.UserRole, job["id"])
+            if col == 4 and job["status"] in STATUS_COLORS: item.setForeground(QColor(STATUS_COLORS[job["status"]]))
+            self.table.setItem(row, col, item)
+
+    def _on_job_changed(self, job_id):
+        job = self.queue.get(job_id)
+        if job and job_id in self._rows:
+            self._fill_row(self._rows[job_id], job)
+            self._update_buttons()
+        else:
+            self._load_jobs()  # 新增或删除的任务
+
+    def _on_job_progress(self, job_id, stage, current, total):
+        row = self._rows.get(job_id)
+        if row is not None:
+            self.table.item(row, 4).setText(f"{'排版' if stage == 'layout' else '打印'} {current}/{total}")
+
+    def _selected_jobs(self):
+        rows = {i.row() for i in self.table.selectedItems()}
+        return [self.queue.get(self.table.item(r, 0).data(Qt.ItemDataRole.UserRole)) for r in sorted(rows)]
+
+    def _update_buttons(self):
+        jobs = [j for j in self._selected_jobs() if j]
+        self.retry_btn.setEnabled(any(j["status"] in (FAILED, CANCELLED) for j in jobs))
+        self.cancel_btn.setEnabled(any(self.queue.can_cancel(j["id"]) for j in jobs))
+        self.remove_btn.setEnabled(any(j["status"] in (DONE, FAILED, CANCELLED) for j in jobs))
+
+    def _retry(self):
+        for job in self._selected_jobs():
+            if job: self.queue.retry(job["id"])
+
+    def _cancel(self):
+        for job in self._selected_jobs():
+            if job: self.queue.cancel(job["id"])
+
+    def _remove(self):
+        self.queue.remove([job["id"] for job in self._selected_jobs() if job])
+
+    def _clear(self):
+        self.queue.clear_history()
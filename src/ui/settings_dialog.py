@@ -1,7 +1,8 @@
 
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, 
                            QWidget, QFrame, QLineEdit, QPushButton, QComboBox, 
-                           QGraphicsDropShadowEffect, QMessageBox)
+                           QGraphicsDropShadowEffect, QMessageBox, QSpinBox,
+                           QCheckBox)
 from PyQt6.QtGui import QColor
 from PyQt6.QtCore import QSettings
 from src.ui.dialogs import ActivationDialog
@@ -304,6 +305,102 @@ class SettingsDlg(QDialog):
         private_ocr_layout.addWidget(self.private_ocr_url)
         
         content_layout.addWidget(private_ocr_card)
+        
+        # 大批量打印卡片
+        print_card = QFrame()
+        print_card.setStyleSheet("""
+            QFrame {
+                background-color: white;
+                border-radius: 12px;
+            }
+        """)
+        
+        print_shadow = QGraphicsDropShadowEffect()
+        print_shadow.setBlurRadius(20)
+        print_shadow.setColor(QColor(0, 0, 0, 30))
+        print_shadow.setOffset(0, 2)
+        print_card.setGraphicsEffect(print_shadow)
+        
+        print_layout = QVBoxLayout(print_card)
+        print_layout.setContentsMargins(20, 20, 20, 20)
+        print_layout.setSpacing(15)
+        
+        print_title = QLabel("🖨️ 打印输出")
+        print_title.setStyleSheet("""
+            font-size: 15px;
+            font-weight: 600;
+            color: #1E293B;
+        """)
+        print_layout.addWidget(print_title)
+        
+        print_hint = QLabel("按页数或大小将打印文件分卷，每个分卷生成后立即送往打印机（0 表示不分卷）")
+        print_hint.setWordWrap(True)
+        print_hint.setStyleSheet("color: #64748B; font-size: 12px;")
+        print_layout.addWidget(print_hint)
+        
+        split_row = QHBoxLayout()
+        self.sp_split_pages = QSpinBox()
+        self.sp_split_pages.setRange(0, 10000)
+        self.sp_split_pages.setSingleStep(50)
+        self.sp_split_pages.setSuffix(" 页")
+        self.sp_split_pages.setValue(int(s.value("print_split_pages", 0) or 0))
+        self.sp_split_mb = QSpinBox()
+        self.sp_split_mb.setRange(0, 2048)
+        self.sp_split_mb.setSingleStep(10)
+        self.sp_split_mb.setSuffix(" MB")
+        self.sp_split_mb.setValue(int(s.value("print_split_mb", 0) or 0))
+        split_row.addWidget(QLabel("每卷页数:"))
+        split_row.addWidget(self.sp_split_pages)
+        split_row.addSpacing(20)
+        split_row.addWidget(QLabel("每卷大小:"))
+        split_row.addWidget(self.sp_split_mb)
+        split_row.addStretch()
+        print_layout.addLayout(split_row)
+        
+        compact_row = QHBoxLayout()
+        self.chk_compact = QCheckBox("压缩打印文件")
+        self.chk_compact.setToolTip("合并重复字体/图片、压缩数据流，减小发送到打印机的文件")
+        self.chk_compact.setChecked(s.value("print_compact", True, type=bool))
+        self.sp_image_dpi = QSpinBox()
+        self.sp_image_dpi.setRange(0, 1200)
+        self.sp_image_dpi.setSingleStep(150)
+        self.sp_image_dpi.setSuffix(" DPI")
+        self.sp_image_dpi.setSpecialValueText("不降采样")
+        self.sp_image_dpi.setValue(int(s.value("print_image_dpi", 0) or 0))
+        self.chk_compact.toggled.connect(self.sp_image_dpi.setEnabled)
+        self.sp_image_dpi.setEnabled(self.chk_compact.isChecked())
+        compact_row.addWidget(self.chk_compact)
+        compact_row.addSpacing(20)
+        compact_row.addWidget(QLabel("图片降采样:"))
+        compact_row.addWidget(self.sp_image_dpi)
+        compact_row.addStretch()
+        print_layout.addLayout(compact_row)
+        
+        proc_row = QHBoxLayout()
+        self.sp_processes = QSpinBox()
+        self.sp_processes.setRange(0, 64)
+        self.sp_processes.setSpecialValueText("自动")
+        self.sp_processes.setToolTip("大批量排版时使用的进程数，1 表示不使用多进程")
+        self.sp_processes.setValue(int(s.value("print_processes", 0) or 0))
+        self.sp_prefetch = QSpinBox()
+        self.sp_prefetch.setRange(1, 16)
+        self.sp_prefetch.setSuffix(" 页")
+        self.sp_prefetch.setToolTip("光栅打印时提前渲染的页数，越大越流畅，占用内存越多")
+        self.sp_prefetch.setValue(int(s.value("print_prefetch", 2) or 2))
+        proc_row.addWidget(QLabel("排版进程数:"))
+        proc_row.addWidget(self.sp_processes)
+        proc_row.addSpacing(20)
+        proc_row.addWidget(QLabel("预渲染:"))
+        proc_row.addWidget(self.sp_prefetch)
+        proc_row.addStretch()
+        print_layout.addLayout(proc_row)
+        
+        self.chk_direct = QCheckBox("直接发送 PDF 到打印机（矢量打印，需 CUPS）")
+        self.chk_direct.setToolTip("打印机支持时由驱动直接处理 PDF，速度快、文件小；不支持时自动改为光栅打印")
+        self.chk_direct.setChecked(s.value("print_direct", True, type=bool))
+        print_layout.addWidget(self.chk_direct)
+        
+        content_layout.addWidget(print_card)
         content_layout.addStretch()
         
         layout.addWidget(content)
@@ -351,4 +448,11 @@ class SettingsDlg(QDialog):
         s.setValue("sk", self.sk.text())
         s.setValue("private_ocr_url", self.private_ocr_url.text().strip().rstrip('/'))
         s.setValue("theme", self.cb_th.currentText())
+        s.setValue("print_split_pages", self.sp_split_pages.value())
+        s.setValue("print_split_mb", self.sp_split_mb.value())
+        s.setValue("print_compact", self.chk_compact.isChecked())
+        s.setValue("print_image_dpi", self.sp_image_dpi.value())
+        s.setValue("print_processes", self.sp_processes.value())
+        s.setValue("print_direct", self.chk_direct.isChecked())
+        s.setValue("print_prefetch", self.sp_prefetch.value())
         self.accept()
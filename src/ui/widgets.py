@@ -1,10 +1,16 @@
 
-from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                           QFrame, QPushButton, QFileDialog, QProgressBar,
-                           QGraphicsDropShadowEffect)
-from PyQt6.QtGui import QColor, QPainter, QBrush, QLinearGradient, QPainterPath
-from PyQt6.QtCore import Qt, pyqtSignal
+from collections import OrderedDict
+import numpy as np
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, 
+                           QFrame, QFileDialog, QProgressBar,
+                           QGraphicsDropShadowEffect, QStyledItemDelegate, QStyleOptionViewItem,
+                           QStyle, QApplication, QToolTip, QListView)
+from PyQt6.QtGui import QColor, QPainter, QBrush, QLinearGradient, QPainterPath, QPixmap, QFont, QFontMetrics, QCursor
+from PyQt6.QtCore import Qt, pyqtSignal, QAbstractListModel, QModelIndex, QSize, QRect, QRectF, QEvent
 from src.utils.icons import Icons
+from src.core.invoice_stats import InvoiceAggregates
+from src.core.invoice_store import InvoiceStore
+from src.core.invoice_search import InvoiceSearchIndex
 from src.utils.constants import APP_NAME, APP_VERSION
 
 # Placeholder UI_CONFIG - mimicking usage
@@ -111,90 +117,287 @@ class DragArea(QWidget):
         fs, _ = QFileDialog.getOpenFileNames(self, "添加发票", "", "发票文件 (*.pdf *.jpg *.png)")
         if fs: self.dropped.emit(fs)
 
-class InvoiceItemWidget(QWidget):
-    def __init__(self, data, parent_item, delete_callback):
-        super().__init__()
-        self.data = data
-        self.parent_item = parent_item
-        self.delete_callback = delete_callback
-        self.setObjectName("ItemRow")
-        
-        layout = QHBoxLayout(self)
-        layout.setContentsMargins(5, 8, 5, 8)
-        layout.setSpacing(10)
-        
-        self.icon_lbl = QLabel()
-        self.icon_lbl.setPixmap(Icons.get("file", "#888").pixmap(32, 32))
-        layout.addWidget(self.icon_lbl)
-        
-        text_layout = QVBoxLayout()
-        text_layout.setSpacing(2)
-        
-        # 标题行（包含文件名和状态标识）
-        title_row = QHBoxLayout()
-        title_row.setSpacing(6)
-        
-        self.lbl_title = QLabel(data['n'])
-        self.lbl_title.setObjectName("ItemTitle")
-        title_row.addWidget(self.lbl_title)
-        
-        # 状态标识
-        self.status_badge = QLabel()
-        self.status_badge.setFixedSize(18, 18)
-        self.status_badge.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.status_badge.hide()
-        title_row.addWidget(self.status_badge)
-        title_row.addStretch()
-        
-        text_layout.addLayout(title_row)
-        
-        self.lbl_detail = QLabel(f"{data['d']} | ¥{data['a']:.2f}")
-        self.lbl_detail.setObjectName("ItemDetail")
-        text_layout.addWidget(self.lbl_detail)
-        
-        layout.addLayout(text_layout)
-        layout.addStretch()
-        
-        self.btn_del = QPushButton()
-        self.btn_del.setObjectName("RowDelBtn")
-        self.btn_del.setIcon(Icons.get("trash", "#d73a49"))
-        self.btn_del.setFixedSize(28, 28)
-        self.btn_del.setToolTip("删除此发票")
-        self.btn_del.clicked.connect(self.on_delete_clicked)
-        layout.addWidget(self.btn_del)
-        
-        self.update_status_badge()
+class InvoiceListModel(QAbstractListModel):
+    """发票列表模型：直接引用发票存储 InvoiceStore，每行不再创建控件，行内容由 InvoiceItemDelegate 绘制
     
-    def on_delete_clicked(self):
-        self.delete_callback(self.parent_item)
+    所有增删改都经过模型，同时同步存储的列、增量维护汇总数据 stats 与筛选索引 search。
+    append / remove_rows / rows_changed 使用存储中的行号；设置筛选后视图只显示匹配的行，
+    视图行号用 source_row() 换算为存储行号。
+    """
+
+    def __init__(self, invoices=None, parent=None):
+        super().__init__(parent)
+        self.invoices = invoices if invoices is not None else InvoiceStore()
+        self.stats = InvoiceAggregates()
+        self.search = InvoiceSearchIndex(self.invoices)
+        for d in self.invoices: self.stats.add(d)
+        self.search.add(self.invoices)
+        self.query = ""; self._visible = None  # 筛选文本，匹配的存储行号（有序，未筛选时为 None）
     
-    def update_display(self, new_data):
-        self.data = new_data
-        self.lbl_title.setText(new_data['n'])
-        self.lbl_detail.setText(f"{new_data['d']} | ¥{new_data['a']:.2f}")
-        self.update_status_badge()
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        return len(self.invoices) if self._visible is None else len(self._visible)
     
-    def update_status_badge(self):
-        """更新状态标识"""
-        has_amount = self.data.get('a', 0) > 0
-        is_manually_edited = self.data.get('manually_edited', False)
-        
-        if not has_amount:
-            self.status_badge.setText("⚠️")
-            self.status_badge.setStyleSheet("background: #FEE2E2; border-radius: 9px; font-size: 12px;")
-            self.status_badge.setToolTip("未识别到金额，请手动修改")
-            self.status_badge.show()
-            # 未识别发票红色背景
-            self.setStyleSheet("QWidget#ItemRow { background: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 rgba(254, 226, 226, 0.5), stop:1 rgba(254, 226, 226, 0.2)); border-left: 3px solid #DC2626; }")
-        elif is_manually_edited:
-            self.status_badge.setText("✓")
-            self.status_badge.setStyleSheet("background: #D1FAE5; border-radius: 9px; font-size: 12px; color: #059669; font-weight: bold;")
-            self.status_badge.setToolTip("已手动修改金额")
-            self.status_badge.show()
-            self.setStyleSheet("QWidget#ItemRow { background: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 rgba(209, 250, 229, 0.3), stop:1 rgba(209, 250, 229, 0.1)); border-left: 3px solid #10B981; }")
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        d = self.invoice(index.row()) if index.isValid() else None
+        if d is None: return None
+        if role == Qt.ItemDataRole.DisplayRole: return d['n']
+        if role == Qt.ItemDataRole.ToolTipRole: return d['p']
+        return None
+    
+    def source_row(self, row):
+        """视图行号 -> 存储行号"""
+        return row if self._visible is None else int(self._visible[row])
+    
+    def invoice(self, row):
+        """视图行对应的发票记录（不经 QVariant 转换，委托绘制时直接读取）"""
+        if not 0 <= row < self.rowCount(): return None
+        return self.invoices[self.source_row(row)]
+    
+    def set_filter(self, text):
+        """按筛选框文本过滤显示的行（空文本显示全部）"""
+        query = text.strip()
+        visible = np.flatnonzero(self.search.mask(query)) if query else None  # 先算好结果，重置期间不会出错
+        self.beginResetModel()
+        self.query, self._visible = query, visible
+        self.endResetModel()
+    
+    def append(self, items):
+        if not items: return
+        first = len(self.invoices)
+        self.invoices.extend(items)  # 字典会被转换为 InvoiceRecord
+        added = self.invoices[first:]
+        for d in added: self.stats.add(d)
+        self.search.add(added)
+        rows = np.arange(first, len(self.invoices)) if self._visible is None else \
+               first + np.flatnonzero(self.search.mask(self.query, first))  # 只判断新追加的行
+        if len(rows):
+            start = self.rowCount()
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            if self._visible is not None: self._visible = np.concatenate([self._visible, rows])
+            self.endInsertRows()
+    
+    def remove_rows(self, rows):
+        """删除若干存储行（连续的行合并为一次删除），返回被删除的发票"""
+        removed = []
+        rows = sorted(set(rows), reverse=True)
+        i = 0
+        while i < len(rows):
+            last = first = rows[i]; i += 1
+            while i < len(rows) and rows[i] == first - 1: first = rows[i]; i += 1
+            if self._visible is None: lo, hi = first, last + 1
+            else: lo, hi = np.searchsorted(self._visible, [first, last + 1])
+            if hi > lo: self.beginRemoveRows(QModelIndex(), int(lo), int(hi) - 1)
+            chunk = self.invoices[first:last + 1]
+            del self.invoices[first:last + 1]
+            for d in chunk: self.stats.remove(d)
+            self.search.remove(chunk)
+            if self._visible is not None:
+                self._visible = np.concatenate([self._visible[:lo], self._visible[hi:] - (last - first + 1)])
+            if hi > lo: self.endRemoveRows()
+            removed[:0] = chunk
+        return removed
+    
+    def clear(self):
+        self.beginResetModel()
+        self.invoices.clear(); self.stats.clear(); self.search.clear()
+        if self._visible is not None: self._visible = self._visible[:0]
+        self.endResetModel()
+    
+    def row_changed(self, row): self.rows_changed([row])
+    
+    def rows_changed(self, rows):
+        """若干存储行的发票内容被修改：更新汇总数据与索引并刷新显示（已显示的行不会因此被筛掉）"""
+        if not rows: return
+        self.invoices.changed(rows)
+        records = [self.invoices[r] for r in rows]
+        for d in records: self.stats.update(d)
+        self.search.update(records)
+        if self._visible is not None:
+            pos = np.searchsorted(self._visible, rows)
+            rows = [int(p) for p, r in zip(pos, rows) if p < len(self._visible) and self._visible[p] == r]
+            if not rows: return
+        self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
+
+class InvoiceItemDelegate(QStyledItemDelegate):
+    """发票行绘制：缩略图、文件名、状态标识、日期金额与删除按钮
+    
+    删除按钮与金额是行内点击区域（由 InvoiceListView 判定后发出 delete_requested / edit_requested），
+    缩略图在行被绘制时才向 ThumbnailService 请求。
+    """
+    delete_requested = pyqtSignal(int)
+    edit_requested = pyqtSignal(int)
+    
+    ROW_HEIGHT = 60
+    ICON = 40
+    DEL_BTN = 28
+    PIXMAP_ITEMS = 256  # 缩放后的缩略图缓存条数
+    COLORS = {"Light": ("#1E293B", "#64748B"), "Dark": ("#F1F5F9", "#94A3B8")}  # 标题, 详情
+    
+    def __init__(self, thumbnails=None, parent=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        self.dark = False
+        self._pixmaps = OrderedDict()  # ((路径, mtime, 大小), 像素比) -> 缩放后的缩略图
+        self._file_icon = Icons.get("file", "#888"); self._trash_icon = Icons.get("trash", "#d73a49")
+    
+    def set_theme(self, mode): self.dark = mode == "Dark"
+    
+    def sizeHint(self, option, index): return QSize(250, self.ROW_HEIGHT)
+    
+    def _rects(self, rect):
+        """行内各区域：缩略图、文字、删除按钮"""
+        r = rect.adjusted(7, 3, -7, -3)
+        icon = QRect(r.left(), r.center().y() - self.ICON // 2 + 1, self.ICON, self.ICON)
+        delete = QRect(r.right() - self.DEL_BTN + 1, r.center().y() - self.DEL_BTN // 2 + 1, self.DEL_BTN, self.DEL_BTN)
+        text = QRect(icon.right() + 11, r.top(), delete.left() - icon.right() - 21, r.height())
+        return icon, text, delete
+    
+    @staticmethod
+    def _detail(d): return f"{d['d']} | ¥{d['a']:.2f}"
+    
+    @staticmethod
+    def _fonts(font):
+        title = QFont(font); title.setPixelSize(13); title.setWeight(QFont.Weight.DemiBold)
+        detail = QFont(font); detail.setPixelSize(12)
+        return title, detail
+    
+    def _amount_rect(self, rect, font, d):
+        """详情行中金额文字所在区域（点击修正金额）"""
+        _, text, _ = self._rects(rect)
+        fm = QFontMetrics(self._fonts(font)[1])
+        amount = f"¥{d['a']:.2f}"
+        x = text.left() + fm.horizontalAdvance(self._detail(d)) - fm.horizontalAdvance(amount)
+        return QRect(x, text.center().y() + 1, fm.horizontalAdvance(amount), fm.height())
+    
+    def hit_test(self, rect, font, pos, d):
+        """行内点击区域：'delete'（删除按钮）、'edit'（金额）或 None"""
+        if self._rects(rect)[2].contains(pos): return "delete"
+        if self._amount_rect(rect, font, d).contains(pos): return "edit"
+        return None
+    
+    def _thumbnail(self, path, dpr):
+        """缩放后的缩略图按文件版本缓存：文件被原地替换后重新向 ThumbnailService 请求"""
+        if not self.thumbnails: return None
+        key = (self.thumbnails.stamp(path), dpr)
+        pix = self._pixmaps.get(key)
+        if pix is not None:
+            self._pixmaps.move_to_end(key); return pix
+        img = self.thumbnails.request(path)
+        if img is None: return None
+        pix = QPixmap.fromImage(img).scaled(int(self.ICON * dpr), int(self.ICON * dpr), Qt.AspectRatioMode.KeepAspectRatio,
+                                            Qt.TransformationMode.SmoothTransformation)
+        pix.setDevicePixelRatio(dpr)
+        self._pixmaps[key] = pix
+        while len(self._pixmaps) > self.PIXMAP_ITEMS: self._pixmaps.popitem(last=False)
+        return pix
+    
+    def paint(self, painter, option, index):
+        d = index.model().invoice(index.row())
+        if d is None: return
+        widget = option.widget
+        style = widget.style() if widget else QApplication.style()
+        opt = QStyleOptionViewItem(option); self.initStyleOption(opt, index); opt.text = ""
+        style.drawPrimitive(QStyle.PrimitiveElement.PE_PanelItemViewItem, opt, painter, widget)  # 选中/悬停背景（来自主题样式表）
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        r = option.rect.adjusted(2, 3, -2, -3)
+        
+        # 未识别（红）/ 手动修改（绿）的行：渐变底色 + 左侧色条
+        unrecognized = d.get('a', 0) <= 0
+        edited = d.get('manually_edited', False)
+        if unrecognized or edited:
+            rgb, bar, alpha = ((254, 226, 226), "#DC2626", (0.5, 0.2)) if unrecognized else ((209, 250, 229), "#10B981", (0.3, 0.1))
+            grad = QLinearGradient(r.left(), 0, r.right(), 0)
+            grad.setColorAt(0, QColor(*rgb, int(255 * alpha[0]))); grad.setColorAt(1, QColor(*rgb, int(255 * alpha[1])))
+            painter.fillRect(r, grad); painter.fillRect(QRect(r.left(), r.top(), 3, r.height()), QColor(bar))
+        
+        icon_rect, text_rect, del_rect = self._rects(option.rect)
+        pix = self._thumbnail(d['p'], widget.devicePixelRatioF() if widget else 1.0)
+        if pix is not None:
+            w, h = int(pix.width() / pix.devicePixelRatio()), int(pix.height() / pix.devicePixelRatio())
+            painter.drawPixmap(icon_rect.left() + (self.ICON - w) // 2, icon_rect.top() + (self.ICON - h) // 2, pix)
         else:
-            self.status_badge.hide()
-            self.setStyleSheet("")
+            self._file_icon.paint(painter, icon_rect.adjusted(4, 4, -4, -4))
+        
+        selected = bool(option.state & QStyle.StateFlag.State_Selected)
+        title_c, detail_c = self.COLORS["Dark" if self.dark else "Light"]
+        if self.dark and selected: title_c = "#FFFFFF"
+        title_f, detail_f = self._fonts(option.font)
+        half = text_rect.height() // 2
+        
+        badge = 18 if unrecognized or edited else 0
+        painter.setFont(title_f); painter.setPen(QColor(title_c))
+        title = QFontMetrics(title_f).elidedText(d['n'], Qt.TextElideMode.ElideMiddle, text_rect.width() - (badge + 6 if badge else 0))
+        title_rect = QRect(text_rect.left(), text_rect.top(), text_rect.width(), half - 1)
+        painter.drawText(title_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignBottom, title)
+        if badge:
+            bx = text_rect.left() + QFontMetrics(title_f).horizontalAdvance(title) + 6
+            b = QRect(bx, title_rect.bottom() - badge + 2, badge, badge)
+            painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(QColor("#FEE2E2" if unrecognized else "#D1FAE5"))
+            painter.drawEllipse(b)
+            badge_f = QFont(option.font); badge_f.setPixelSize(12); badge_f.setBold(not unrecognized)
+            painter.setFont(badge_f); painter.setPen(QColor("#DC2626" if unrecognized else "#059669"))
+            painter.drawText(b, Qt.AlignmentFlag.AlignCenter, "⚠️" if unrecognized else "✓")
+        
+        painter.setFont(detail_f); painter.setPen(QColor(detail_c))
+        painter.drawText(QRect(text_rect.left(), text_rect.top() + half + 1, text_rect.width(), half - 1),
+                         Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, self._detail(d))
+        
+        if option.state & QStyle.StateFlag.State_MouseOver and widget is not None:
+            if del_rect.contains(widget.mapFromGlobal(QCursor.pos())):
+                painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(QColor("#FEE2E2")); painter.drawRoundedRect(QRectF(del_rect), 6, 6)
+        self._trash_icon.paint(painter, del_rect.adjusted(6, 6, -6, -6))
+        painter.restore()
+    
+    def helpEvent(self, event, view, option, index):
+        d = index.model().invoice(index.row())
+        tip = None
+        if d is not None and event.type() == QEvent.Type.ToolTip:
+            hit = self.hit_test(option.rect, option.font, event.pos(), d)
+            if hit == "delete": tip = "删除此发票"
+            elif d.get('a', 0) <= 0: tip = "未识别到金额，请手动修改"
+            elif d.get('manually_edited', False): tip = "已手动修改金额"
+            elif hit == "edit": tip = "点击修正金额"
+        if tip:
+            QToolTip.showText(event.globalPos(), tip, view); return True
+        return super().helpEvent(event, view, option, index)
+
+class InvoiceListView(QListView):
+    """发票列表视图：按下落在委托的行内点击区域时，不选中行、不发出 clicked，松开时发出委托对应的信号"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pressed = None  # (区域, 行)
+    
+    def _hit(self, event):
+        pos = event.position().toPoint()
+        index = self.indexAt(pos); delegate = self.itemDelegate()
+        if event.button() != Qt.MouseButton.LeftButton or not index.isValid() or not isinstance(delegate, InvoiceItemDelegate): return None
+        d = self.model().invoice(index.row())
+        hit = delegate.hit_test(self.visualRect(index), self.font(), pos, d) if d is not None else None
+        return (hit, index.row()) if hit else None
+    
+    def mousePressEvent(self, event):
+        self._pressed = self._hit(event)
+        if self._pressed: event.accept()
+        else: super().mousePressEvent(event)
+    
+    def mouseDoubleClickEvent(self, event):
+        self._pressed = self._hit(event)  # 连续点击删除按钮不触发双击修改
+        if self._pressed: event.accept()
+        else: super().mouseDoubleClickEvent(event)
+    
+    def mouseReleaseEvent(self, event):
+        pressed, self._pressed = self._pressed, None
+        if pressed is None: return super().mouseReleaseEvent(event)
+        event.accept()
+        if self._hit(event) == pressed:
+            delegate = self.itemDelegate()
+            (delegate.delete_requested if pressed[0] == "delete" else delegate.edit_requested).emit(pressed[1])
+    
+    def mouseMoveEvent(self, event):
+        super().mouseMoveEvent(event)
+        self.viewport().update(self.visualRect(self.indexAt(event.position().toPoint())))  # 删除按钮悬停高亮
 
 class DynamicSplashScreen(QWidget):
     finished = pyqtSignal()
@@ -17,6 +17,7 @@ UI_CONFIG = {
     "shadow_blur": 25, 
     "shadow_opacity": 25,
     "is_legacy": False,
+    # 预览渲染倍率上限（实际倍率按显示宽度 × 像素比计算）
     "preview_render_scale": 4.0 if PLATFORM == "mac" else 2.0
 }
 
@@ -5,6 +5,7 @@ import os
 import sys
 import unittest
 import tempfile
+import threading
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -21,8 +22,10 @@ class TestInvoiceDatabase(unittest.TestCase):
     
     def tearDown(self):
         """测试后清理临时文件"""
-        if os.path.exists(self.temp_file.name):
-            os.remove(self.temp_file.name)
+        self.db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.temp_file.name + suffix):
+                os.remove(self.temp_file.name + suffix)
     
     def test_save_and_get_invoice(self):
         """测试保存和获取发票"""
@@ -94,6 +97,66 @@ class TestInvoiceDatabase(unittest.TestCase):
         self.assertEqual(len(results), 1)
         self.assertAlmostEqual(results[0]['amount'], 2000)
     
+    def test_save_many(self):
+        """测试批量保存：新增与更新在同一事务中完成"""
+        self.db.save_invoice({'file_path': '/test/m0.pdf', 'file_name': 'm0.pdf', 'amount': 1})
+        count = self.db.save_many([
+            {'file_path': f'/test/m{i}.pdf', 'file_name': f'm{i}.pdf', 'amount': 10 * i, 'seller': 'S'}
+            for i in range(3)
+        ])
+        self.assertEqual(count, 3)
+        self.assertEqual(self.db.save_many([]), 0)
+        self.assertAlmostEqual(self.db.get_invoice_by_path('/test/m0.pdf')['amount'], 0)
+        self.assertEqual(len(self.db.get_all_invoices()), 3)
+    
+    def test_save_many_chunks(self):
+        """测试批量保存分段提交，批内重复路径以最后一条为准"""
+        self.db.SAVE_CHUNK = 4
+        items = [{'file_path': f'/test/c{i}.pdf', 'amount': i} for i in range(10)]
+        items.append({'file_path': '/test/c3.pdf', 'amount': 33, 'seller': '新销售方'})
+        self.assertEqual(self.db.save_many(items), 11)
+        self.assertEqual(len(self.db.get_all_invoices()), 10)
+        invoice = self.db.get_invoice_by_path('/test/c3.pdf')
+        self.assertEqual((invoice['amount'], invoice['seller']), (33, '新销售方'))
+        self.assertIsNotNone(invoice['updated_at'])
+    
+    def test_full_text_search(self):
+        """测试全文搜索：多字段、多关键词、排序与触发器同步"""
+        self.db.save_many([
+            {'file_path': '/test/f1.pdf', 'seller': '上海云帆科技有限公司', 'item_name': '*信息技术服务*软件开发', 'date': '2024-01-01'},
+            {'file_path': '/test/f2.pdf', 'buyer': '上海云帆科技有限公司', 'remark': '项目A 差旅', 'date': '2024-03-01'},
+            {'file_path': '/test/f3.pdf', 'seller': '杭州滴答出行', 'remark': 'Taxi 差旅', 'number': '24312000000077', 'date': '2024-02-01'},
+        ])
+        paths = lambda text: [r['file_path'] for r in self.db.full_text_search(text)]
+        self.assertEqual(sorted(paths('云帆科技')), ['/test/f1.pdf', '/test/f2.pdf'])
+        self.assertEqual(paths('软件开发'), ['/test/f1.pdf'])
+        self.assertEqual(paths('taxi'), ['/test/f3.pdf'])
+        self.assertEqual(paths('2431200000'), ['/test/f3.pdf'])
+        self.assertEqual(paths('差旅'), ['/test/f2.pdf', '/test/f3.pdf'])  # 短关键词，日期新的在前
+        self.assertEqual(paths('差旅 云帆科技'), ['/test/f2.pdf'])
+        self.assertEqual(paths('"不存在'), [])
+        self.assertEqual(paths('  '), [])
+        
+        self.db.save_invoice({'file_path': '/test/f1.pdf', 'seller': '北京新销售方有限公司'})
+        self.assertEqual(paths('云帆科技'), ['/test/f2.pdf'])
+        self.assertEqual(paths('新销售方'), ['/test/f1.pdf'])
+        self.db.delete_invoice('/test/f2.pdf')
+        self.assertEqual(paths('云帆科技'), [])
+        self.assertEqual(len(self.db.search_invoices(seller='新销售方')), 1)
+        self.assertEqual(len(self.db.search_invoices(buyer='新销售方')), 0)
+    
+    def test_fts_rebuild_existing(self):
+        """测试已有数据库升级时从现有记录重建全文索引"""
+        self.db.save_invoice({'file_path': '/test/old.pdf', 'seller': '旧版本数据公司'})
+        conn = self.db._connect()
+        for name in ('invoices_fts_ai', 'invoices_fts_ad', 'invoices_fts_au'):
+            conn.execute(f'DROP TRIGGER {name}')
+        conn.execute('DROP TABLE invoices_fts')
+        self.db.close()
+        db = InvoiceDatabase(self.temp_file.name)
+        self.assertEqual([r['file_path'] for r in db.full_text_search('旧版本')], ['/test/old.pdf'])
+        db.close()
+    
     def test_delete_invoice(self):
         """测试删除发票"""
         self.db.save_invoice({
@@ -126,6 +189,37 @@ class TestInvoiceDatabase(unittest.TestCase):
         months = [m['month'] for m in by_month]
         self.assertIn('2025-01', months)
         self.assertIn('2025-02', months)
+    
+    def test_connection_reuse(self):
+        """测试同一线程复用连接，数据库为 WAL 模式"""
+        conn = self.db._connect()
+        self.db.save_invoice({'file_path': '/test/c1.pdf'})
+        self.db.get_invoice_by_path('/test/c1.pdf')
+        self.assertIs(self.db._connect(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.db.close()
+        self.assertIsNot(self.db._connect(), conn)
+        self.assertIsNotNone(self.db.get_invoice_by_path('/test/c1.pdf'))
+    
+    def test_concurrent_threads(self):
+        """测试多个线程同时读写"""
+        errors = []
+        
+        def work(t):
+            try:
+                for i in range(50):
+                    self.db.save_invoice({'file_path': f'/test/t{t}_{i}.pdf', 'amount': i})
+                    self.db.get_invoice_by_path(f'/test/t{t}_{i}.pdf')
+                self.db.save_many([{'file_path': f'/test/t{t}_{i}.pdf', 'amount': 1} for i in range(50)])
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=work, args=(t,)) for t in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.db.get_all_invoices()), 200)
+        self.assertEqual(self.db.get_statistics()['total_amount'], 200)
 
 if __name__ == '__main__':
     unittest.main()
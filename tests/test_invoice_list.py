@@ -0,0 +1,153 @@
+"""
+发票列表模型 / 委托单元测试
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import Qt, QEvent, QEventLoop, QPointF, QTimer
+from PyQt6.QtGui import QMouseEvent
+from PyQt6.QtWidgets import QApplication
+from src.core.invoice_store import InvoiceStore
+from src.core.thumbnails import ThumbnailCache, ThumbnailService
+from src.ui.widgets import InvoiceListModel, InvoiceItemDelegate, InvoiceListView
+
+
+def _invoice(i, amount=100.0):
+    return {"p": f"/tmp/inv{i}.pdf", "n": f"inv{i}.pdf", "d": "2024-01-01", "a": amount, "ext": {}}
+
+
+class TestInvoiceList(unittest.TestCase):
+    """InvoiceListModel / InvoiceItemDelegate 测试用例"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+
+    def setUp(self):
+        self.data = InvoiceStore()
+        self.model = InvoiceListModel(self.data)
+
+    def test_model_shares_invoice_list(self):
+        """测试模型直接读写传入的发票存储"""
+        self.model.append([_invoice(i) for i in range(3)])
+        self.assertEqual(self.model.rowCount(), 3)
+        self.assertEqual(len(self.data), 3)
+        index = self.model.index(1)
+        self.assertEqual(index.data(), "inv1.pdf")
+        self.assertIs(self.model.invoice(1), self.data[1])
+        self.model.clear()
+        self.assertEqual((self.model.rowCount(), len(self.data)), (0, 0))
+
+    def test_remove_rows(self):
+        """测试删除不连续的多行，返回按原顺序排列的发票"""
+        self.model.append([_invoice(i) for i in range(6)])
+        removed = []
+        self.model.rowsRemoved.connect(lambda parent, first, last: removed.append((first, last)))
+        gone = self.model.remove_rows([4, 1, 2])
+        self.assertEqual([d["n"] for d in gone], ["inv1.pdf", "inv2.pdf", "inv4.pdf"])
+        self.assertEqual([d["n"] for d in self.data], ["inv0.pdf", "inv3.pdf", "inv5.pdf"])
+        self.assertEqual(removed, [(4, 4), (1, 2)])
+        self.assertEqual(self.model.stats.count, 3)
+
+    def test_stats_follow_edits(self):
+        """测试修改行内容后汇总数据同步更新"""
+        self.model.append([_invoice(i) for i in range(3)])
+        self.data[2]["a"] = 0
+        self.model.rows_changed([2])
+        self.assertEqual((self.model.stats.count, self.model.stats.unrecognized), (3, 1))
+        self.assertAlmostEqual(self.model.stats.total_amount, 200)
+        self.model.clear()
+        self.assertEqual(self.model.stats.count, 0)
+
+    def test_filter(self):
+        """测试筛选后视图行与存储行的换算，以及筛选中增删改"""
+        self.model.append([_invoice(i, amount=100.0 * (i + 1)) for i in range(6)])
+        self.model.set_filter(">250")
+        self.assertEqual(self.model.rowCount(), 4)
+        self.assertEqual(self.model.source_row(0), 2)
+        self.assertIs(self.model.invoice(1), self.data[3])
+        removed = []
+        self.model.rowsRemoved.connect(lambda parent, first, last: removed.append((first, last)))
+        gone = self.model.remove_rows([1, 3, 4])  # 第 1 行未显示
+        self.assertEqual([d["n"] for d in gone], ["inv1.pdf", "inv3.pdf", "inv4.pdf"])
+        self.assertEqual(removed, [(1, 2)])
+        self.assertEqual([self.model.invoice(r)["n"] for r in range(self.model.rowCount())], ["inv2.pdf", "inv5.pdf"])
+        self.model.append([_invoice(6, amount=10), _invoice(7, amount=900)])  # 只显示匹配的新行
+        self.assertEqual([self.model.source_row(r) for r in range(self.model.rowCount())], [1, 2, 4])
+        self.data[1]["a"] = 1
+        self.model.rows_changed([1])  # 已显示的行修改后仍保留
+        self.assertEqual(self.model.rowCount(), 3)
+        self.model.set_filter("2024-13")  # 无效月份不作为日期条件
+        self.assertEqual(self.model.rowCount(), 0)
+        self.model.set_filter("")
+        self.assertEqual(self.model.rowCount(), 5)
+        self.assertEqual(self.model.stats.count, 5)
+
+    def test_delegate_hit_regions(self):
+        """测试删除按钮与金额区域的点击只发出对应信号，不触发行单击和选中"""
+        self.model.append([_invoice(i) for i in range(3)])
+        view = InvoiceListView(); view.resize(280, 300)
+        delegate = InvoiceItemDelegate(parent=view)
+        view.setModel(self.model); view.setItemDelegate(delegate); view.show()
+        deleted, edited, clicked = [], [], []
+        delegate.delete_requested.connect(deleted.append)
+        delegate.edit_requested.connect(edited.append)
+        view.clicked.connect(lambda idx: clicked.append(idx.row()))
+
+        def click(pos):
+            for t in (QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonRelease):
+                QApplication.sendEvent(view.viewport(), QMouseEvent(t, QPointF(pos), QPointF(view.viewport().mapToGlobal(pos)),
+                                                                   Qt.MouseButton.LeftButton, Qt.MouseButton.LeftButton,
+                                                                   Qt.KeyboardModifier.NoModifier))
+
+        rect = view.visualRect(self.model.index(1))
+        _, text, delete = delegate._rects(rect)
+        click(delete.center())
+        click(delegate._amount_rect(rect, view.font(), self.data[1]).center())
+        self.assertEqual((deleted, edited, clicked), ([1], [1], []))
+        click(text.topLeft() + (text.center() - text.topLeft()) / 2)
+        self.assertEqual(clicked, [1])
+        self.assertEqual([i.row() for i in view.selectionModel().selectedRows()], [1])
+        view.close()
+
+    def test_delegate_thumbnail_follows_file(self):
+        """测试文件被原地替换后，委托不再返回缓存的旧缩略图"""
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "inv.pdf")
+
+        def write(width, height):
+            with fitz.open() as doc:
+                doc.new_page(width=width, height=height).insert_text((50, 100), "invoice", fontsize=30)
+                doc.save(path + ".new")
+            os.replace(path + ".new", path)
+
+        service = ThumbnailService(ThumbnailCache(os.path.join(tmp_dir, "thumbs")))
+        delegate = InvoiceItemDelegate(service)
+        loop = QEventLoop()
+        service.thumbnail_ready.connect(lambda p, img: loop.quit())
+
+        def thumbnail():
+            if delegate._thumbnail(path, 1.0) is None:
+                QTimer.singleShot(10000, loop.quit); loop.exec()
+            return delegate._thumbnail(path, 1.0)
+
+        try:
+            write(600, 400)
+            old = thumbnail()
+            write(400, 600)
+            new = thumbnail()
+        finally:
+            service.shutdown(); shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.assertGreater(old.width(), old.height())
+        self.assertLess(new.width(), new.height())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+发票列表筛选单元测试
+"""
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.invoice_store import InvoiceStore
+from src.core.invoice_search import InvoiceSearchIndex, parse_query
+
+
+def _invoice(i, amount=100.0, date="2024-01-15", seller="上海某某科技有限公司", buyer="北京某某贸易有限公司",
+             number=None, tax_id=None):
+    return {"p": f"/tmp/inv{i}.pdf", "a": amount, "d": date,
+            "ext": {"invoice_type": "电子发票(普通发票)", "seller": seller, "buyer": buyer,
+                    "number": number or f"2431200000{i:08d}", "seller_tax_id": tax_id or f"91310000MA1K{i:06d}"}}
+
+
+class TestInvoiceSearch(unittest.TestCase):
+    """parse_query / InvoiceSearchIndex 测试用例"""
+
+    def setUp(self):
+        self.store = InvoiceStore([
+            _invoice(0, 50, "2024-01-15", seller="上海云帆科技有限公司"),
+            _invoice(1, 120, "2024-02-03", seller="杭州滴答餐饮管理有限公司", number="24312000000000777777"),
+            _invoice(2, 480, "2024-03-20", buyer="深圳前海微众银行"),
+            _invoice(3, 1000, "", seller="上海云帆科技有限公司", tax_id="91440300ABCDEF1234"),
+        ])
+        self.index = InvoiceSearchIndex(self.store)
+        self.index.add(self.store)
+
+    def rows(self, text):
+        return self.store.rows(self.index.mask(text)).tolist()
+
+    def test_parse_query(self):
+        """测试筛选文本解析"""
+        self.assertEqual(parse_query("云帆 >100"), (["云帆"], {"min_amount": 100.01}))
+        self.assertEqual(parse_query("<=500")[1], {"max_amount": 500.0})
+        self.assertEqual(parse_query("500~100")[1], {"min_amount": 100.0, "max_amount": 500.0})
+        self.assertEqual(parse_query("2024-02")[1], {"start": "2024-02-01", "end": "2024-02-29"})
+        self.assertEqual(parse_query("2024-1~2024-3")[1], {"start": "2024-01-01", "end": "2024-03-31"})
+        self.assertEqual(parse_query("2024-03-05~")[1], {"start": "2024-03-05"})
+        self.assertEqual(parse_query("  ABC  "), (["abc"], {}))
+
+    def test_invalid_dates(self):
+        """测试月份、日期无效的日期按文字匹配，不作为日期条件"""
+        for text in ("2024-13", "2024-0", "2024-99~", "2024-02-30", "2024-1~2024-13"):
+            self.assertEqual(parse_query(text), ([text], {}), text)
+            self.assertEqual(self.rows(text), [], text)
+        self.assertEqual(parse_query("2024-12~")[1], {"start": "2024-12-01"})
+        self.assertEqual(parse_query("~2024-12")[1], {"end": "2024-12-31"})
+        self.assertEqual(parse_query("2024-02-29")[1], {"start": "2024-02-29", "end": "2024-02-29"})
+
+    def test_name_ngram(self):
+        """测试销售方/购买方名称包含匹配"""
+        self.assertEqual(self.rows("云帆"), [0, 3])
+        self.assertEqual(self.rows("餐"), [1])
+        self.assertEqual(self.rows("微众银行"), [2])
+        self.assertEqual(self.rows("不存在的名称"), [])
+
+    def test_prefix(self):
+        """测试发票号码与税号前缀匹配"""
+        self.assertEqual(self.rows("243120000000007777"), [1])
+        self.assertEqual(self.rows("91440300abc"), [3])
+        self.assertEqual(self.rows("0000777777"), [])  # 只匹配开头
+
+    def test_ranges(self):
+        """测试金额与日期范围，以及多个条件同时满足"""
+        self.assertEqual(self.rows(">100"), [1, 2, 3])
+        self.assertEqual(self.rows("100~500"), [1, 2])
+        self.assertEqual(self.rows("2024-02~2024-03"), [1, 2])
+        self.assertEqual(self.rows("云帆 >100"), [3])
+        self.assertEqual(self.rows("云帆 2024-01"), [0])
+
+    def test_incremental(self):
+        """测试增删改后索引同步"""
+        self.store.append(_invoice(4, seller="广州新客户有限公司"))
+        self.index.add(self.store[4:])
+        self.assertEqual(self.rows("新客户"), [4])
+        rec = self.store[1]
+        rec["ext"] = dict(rec["ext"], number="11110000")
+        self.store.changed([1]); self.index.update([rec])
+        self.assertEqual(self.rows("1111"), [1])
+        self.assertEqual(self.rows("243120000000007777"), [])
+        removed = self.store[0:1]
+        del self.store[0:1]; self.index.remove(removed)
+        self.assertEqual(self.rows("云帆"), [2])
+        self.store.clear(); self.index.clear()
+        self.assertEqual(self.rows("云帆"), [])
+
+    def test_mask_from_row(self):
+        """测试只判断第 first 行起的各行，结果与整体筛选的对应部分一致"""
+        for text in ("云帆", "2431200000", ">100", "2024-02~ 杭州", "9144 >500", ""):
+            full = self.index.mask(text)
+            for first in range(len(self.store) + 1):
+                self.assertEqual(self.index.mask(text, first).tolist(), full[first:].tolist(), (text, first))
+
+    def test_speed_50k(self):
+        """测试 5 万张发票的筛选耗时"""
+        cities, trades = ["上海", "北京", "杭州", "深圳", "成都"], ["科技", "餐饮", "物流", "贸易", "文化"]
+        store = InvoiceStore(_invoice(i, i % 997, f"2024-{i % 12 + 1:02d}-01",
+                                      seller=f"{cities[i % 5]}{trades[i // 5 % 5]}{i % 3000}号有限公司")
+                             for i in range(50000))
+        index = InvoiceSearchIndex(store); index.add(store)
+        index.mask("预热")
+        for text in ("科技", "杭州物流 >500", "2431200000000123", "2024-03~2024-05 100~200"):
+            t = time.perf_counter()
+            n = int(index.mask(text).sum())
+            self.assertLess(time.perf_counter() - t, 0.05, text)
+            self.assertGreater(n, 0, text)
+
+
+if __name__ == '__main__':
+    unittest.main()
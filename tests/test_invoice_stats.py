@@ -0,0 +1,55 @@
+"""
+发票汇总统计单元测试
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.invoice_stats import InvoiceAggregates, to_cents
+
+
+def _invoice(amount, date="2024-03-05", inv_type="电子发票", tax="1.30"):
+    return {"p": "/tmp/x.pdf", "n": "x.pdf", "a": amount, "d": date,
+            "ext": {"invoice_type": inv_type, "tax_amt": tax}}
+
+
+class TestInvoiceAggregates(unittest.TestCase):
+    """InvoiceAggregates 测试用例"""
+
+    def test_add_remove_update(self):
+        """测试增删改后的汇总与分组"""
+        stats = InvoiceAggregates()
+        a, b, c = _invoice(100.10), _invoice(0, date=""), _invoice(50, inv_type="发票清单")
+        for d in (a, b, c): stats.add(d)
+        self.assertEqual((stats.count, stats.unrecognized), (2, 1))
+        self.assertAlmostEqual(stats.total_amount, 100.10)
+        self.assertAlmostEqual(stats.total_tax, 2.60)
+        self.assertEqual(sorted(stats.month_rows()), [("2024-03", 1, 100.10), ("未知", 1, 0.0)])
+
+        # OCR 结果更新了金额、日期与类型
+        b.update({"a": 20.0, "d": "2024-04-01"}); b["ext"] = {"invoice_type": "", "tax_amt": "abc"}
+        stats.update(b)
+        self.assertEqual(stats.unrecognized, 0)
+        self.assertAlmostEqual(stats.total_tax, 1.30)
+        self.assertEqual([r[0] for r in stats.type_rows()], ["电子发票", "未分类"])
+        self.assertEqual([r[0] for r in stats.month_rows()], ["2024-04", "2024-03"])
+
+        stats.remove(a); stats.remove(c)
+        self.assertEqual((stats.count, stats.cents), (1, 2000))
+        self.assertEqual(list(stats.by_type), ["未分类"])
+        stats.remove(b)
+        self.assertEqual((stats.count, stats.cents, stats.by_month), (0, 0, {}))
+
+    def test_cents_do_not_drift(self):
+        stats = InvoiceAggregates()
+        items = [_invoice(0.1) for _ in range(1000)]
+        for d in items: stats.add(d)
+        for d in items[:999]: stats.remove(d)
+        self.assertEqual(stats.cents, 10)
+        self.assertEqual(to_cents("12.345元"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
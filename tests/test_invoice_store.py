@@ -0,0 +1,86 @@
+"""
+发票存储单元测试
+"""
+import os
+import sys
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.invoice_store import InvoiceRecord, InvoiceStore
+
+
+def _invoice(i, amount, day="2024-03-05", inv_type="电子发票", seller="甲公司"):
+    return {"p": f"/票据/发票{i}.pdf", "n": f"发票{i}.pdf", "a": amount, "d": day,
+            "ext": {"invoice_type": inv_type, "number": f"2411{i:04d}", "seller": seller, "buyer": "乙公司",
+                    "tax_amt": "1.30", "amount": amount, "_local_parsed": True}}
+
+
+class TestInvoiceStore(unittest.TestCase):
+    """InvoiceRecord / InvoiceStore 测试用例"""
+
+    def test_record_roundtrip(self):
+        """测试记录按原字典键读写，识别结果原样还原"""
+        d = _invoice(1, 12.34)
+        rec = InvoiceRecord.from_dict(d)
+        for key in ("p", "n", "a", "d", "ext"):
+            self.assertEqual(rec[key], d[key])
+        self.assertEqual(list(rec["ext"]), list(d["ext"]))
+        self.assertEqual((rec.cents, rec.day), (1234, date(2024, 3, 5).toordinal()))
+        self.assertIs(rec.seller, InvoiceRecord.from_dict(_invoice(2, 1)).seller)
+        self.assertEqual(rec.ext_value("number"), "24110001")
+
+        rec["d"] = "2024年3月5日"
+        self.assertEqual((rec.day, rec["d"]), (0, "2024年3月5日"))
+        rec["a"] = "abc"; rec["_pending_ocr"] = True
+        self.assertEqual((rec["a"], rec.get("_pending_ocr"), rec.get("x", 1)), (0, True, 1))
+
+    def test_columns_follow_changes(self):
+        """测试追加、修改、删除后列保持同步"""
+        store = InvoiceStore([_invoice(i, i + 0.5) for i in range(100)])
+        self.assertEqual(len(store), 100)
+        self.assertAlmostEqual(store.sum(), sum(i + 0.5 for i in range(100)))
+        store[3]["a"] = 1000; store.changed([3])
+        del store[10:20]; del store[0]
+        self.assertEqual([r["n"] for r in store[:3]], ["发票1.pdf", "发票2.pdf", "发票3.pdf"])
+        self.assertEqual(list(store.column("cents")[:3]), [150, 250, 100000])
+        self.assertAlmostEqual(store.sum(), sum(r["a"] for r in store))
+        store.clear()
+        self.assertEqual((len(store), store.sum()), (0, 0))
+        with self.assertRaises(IndexError):
+            del store[0]
+        store.extend([_invoice(i, 1) for i in range(3)])
+        with self.assertRaises(IndexError):
+            del store[3]
+        del store[-1]
+        self.assertEqual(len(store), 2)
+
+    def test_non_json_ext_values(self):
+        """测试识别结果中无法序列化为 JSON 的值按字符串保存，不会导致导入失败"""
+        d = _invoice(1, 10)
+        d["ext"].update(tax_amt=Decimal("1.30"), parsed_at=datetime(2024, 3, 5, 8, 30), raw=b"\x01")
+        store = InvoiceStore([d])
+        ext = store[0]["ext"]
+        self.assertEqual((ext["tax_amt"], ext["parsed_at"]), ("1.30", "2024-03-05 08:30:00"))
+        self.assertEqual(ext["seller"], "甲公司")
+
+    def test_filter_sum_group(self):
+        """测试向量化筛选、求和与分组"""
+        store = InvoiceStore([
+            _invoice(0, 100, "2024-01-10"), _invoice(1, 200, "2024-02-01", seller="丙公司"),
+            _invoice(2, 300, "2024-02-20", inv_type="发票清单"), _invoice(3, 50, ""),
+        ])
+        valid = store.mask(include_ignored=False)
+        self.assertEqual(list(store.rows(valid)), [0, 1, 3])
+        self.assertEqual(store.sum(valid), 350)
+        self.assertEqual(list(store.rows(store.mask(min_amount=100, max_amount=200))), [0, 1])
+        self.assertEqual(list(store.rows(store.mask(start="2024-02-01", end=date(2024, 2, 29)))), [1, 2])
+        self.assertEqual(list(store.rows(store.mask(types=["发票清单", "无"]))), [2])
+        self.assertEqual(store.group_by("seller", valid), [("丙公司", 1, 200.0), ("甲公司", 2, 150.0)])
+        self.assertEqual(store.group_by("month"), [("2024-02", 2, 500.0), ("2024-01", 1, 100.0), ("未知", 1, 50.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,10 +5,15 @@ import os
 import sys
 import unittest
 import tempfile
+import shutil
+from unittest import mock
+import fitz
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.core.pdf_engine import PDFEngine
+from src.core.pdf_engine import PDFEngine, SourceDocCache
+from src.core.sheet_packer import pack_sheets
+from src.core.workers import PdfWorker, PreviewWorker, TileWorker
 
 
 class TestPDFEngine(unittest.TestCase):
@@ -52,5 +57,437 @@ class TestPDFEngine(unittest.TestCase):
                     os.remove(out_path)
 
 
+class TestLayout(unittest.TestCase):
+    """网格排版与自动拼版测试用例"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+        # 3 张电子发票大小 + 6 张小票据
+        for i, (w, h) in enumerate([(683, 397)] * 3 + [(227, 425)] * 6):
+            path = os.path.join(self.tmp_dir, f"inv{i}.pdf")
+            with fitz.open() as doc:
+                doc.new_page(width=w, height=h).insert_text((20, 40), f"invoice {i}")
+                doc.save(path)
+            self.files.append(path)
+    
+    def tearDown(self):
+        PDFEngine.sheet_cache.clear()
+        PDFEngine.source_cache.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_arbitrary_grid(self):
+        """测试任意 列x行 网格"""
+        self.assertEqual(PDFEngine.grid_shape("3x2"), (3, 2))
+        self.assertIsNone(PDFEngine.grid_shape("auto"))
+        cells = PDFEngine.layout_cells("3x2", 600, 800)
+        self.assertEqual(len(cells), 6)
+        self.assertEqual(cells[1], (200, 0, 200, 400))
+        self.assertEqual(cells[3], (0, 400, 200, 400))
+        
+        doc = PDFEngine.merge(self.files, mode="3x2")
+        self.assertEqual(len(doc), 2)
+        self.assertIn("invoice 6", doc[1].get_text())
+        doc.close()
+    
+    def test_auto_layout_saves_paper(self):
+        """测试自动拼版：用纸少于 1x2，每张发票各出现一次且互不重叠"""
+        sheets = PDFEngine.plan_sheets(self.files, "auto")
+        self.assertLess(len(sheets), len(PDFEngine.plan_sheets(self.files, "1x2")))
+        self.assertEqual(sorted(f for _, chunk in sheets for f, _ in chunk), sorted(self.files))
+        
+        PW, PH = PDFEngine.SIZES["A4"]
+        for _, chunk in sheets:
+            rects = [fitz.Rect(r) for _, r in chunk]
+            for i, r in enumerate(rects):
+                self.assertTrue(fitz.Rect(0, 0, PW, PH).contains(r))
+                for other in rects[i+1:]:
+                    self.assertTrue((r & other).is_empty)
+        
+        doc = PDFEngine.merge(self.files, mode="auto")
+        self.assertEqual(len(doc), len(sheets))
+        doc.close()
+    
+    def test_auto_layout_deterministic(self):
+        """测试自动拼版结果稳定，预览与打印输出一致"""
+        first = PDFEngine.plan_sheets(self.files, "auto", "A4", "H")
+        PDFEngine.source_cache.clear()
+        self.assertEqual(first, PDFEngine.plan_sheets(self.files, "auto", "A4", "H"))
+    
+    def test_pack_respects_min_scale(self):
+        """测试装箱不小于最小缩放比例，尺寸未知时占满整页"""
+        sheets = pack_sheets([(100, 100)] * 40, 595, 842, margin=20, gap=10, min_scale=0.5)
+        for sheet in sheets:
+            for _, (x0, y0, x1, y1) in sheet:
+                self.assertGreaterEqual(x1 - x0, 50 - 1e-6)
+        self.assertEqual(pack_sheets([None], 595, 842, margin=20, gap=10), [[(0, (20, 20, 575, 822))]])
+
+
+class TestSourceDocCache(unittest.TestCase):
+    """SourceDocCache 测试用例"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir, f"inv{i}.pdf")
+            with fitz.open() as doc:
+                doc.new_page(width=300, height=200).insert_text((50, 100), f"invoice {i}")
+                doc.save(path)
+            self.files.append(path)
+        self.cache = SourceDocCache(max_open=2)
+    
+    def tearDown(self):
+        self.cache.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_reuse_open_document(self):
+        """测试重复获取返回同一文档对象"""
+        doc = self.cache.get(self.files[0])
+        self.assertIs(self.cache.get(self.files[0]), doc)
+    
+    def test_lru_bounds_open_handles(self):
+        """测试超出上限时关闭最久未使用的文档"""
+        first = self.cache.get(self.files[0])
+        self.cache.get(self.files[1])
+        self.cache.get(self.files[2])
+        self.assertEqual(len(self.cache), 2)
+        self.assertTrue(first.is_closed)
+    
+    def test_invalidate_on_mtime_change(self):
+        """测试文件修改后重新打开"""
+        doc = self.cache.get(self.files[0])
+        st = os.stat(self.files[0])
+        os.utime(self.files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertIsNot(self.cache.get(self.files[0]), doc)
+        self.assertTrue(doc.is_closed)
+    
+    def test_merge_with_cache(self):
+        """测试使用缓存合并，图片与 PDF 混排"""
+        img_path = os.path.join(self.tmp_dir, "inv.png")
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 60, 40), False)
+        pix.clear_with(200)
+        pix.save(img_path)
+        
+        files = self.files[:2] + [img_path]
+        doc = PDFEngine.merge(files, mode="2x2", paper="A4", cache=self.cache)
+        try:
+            self.assertEqual(len(doc), 1)
+            text = doc[0].get_text()
+            self.assertIn("invoice 0", text)
+            self.assertIn("invoice 1", text)
+            self.assertTrue(doc[0].get_images(full=True))
+        finally:
+            doc.close()
+
+
+class TestSheetCache(unittest.TestCase):
+    """排版页缓存测试用例"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(5):
+            path = os.path.join(self.tmp_dir, f"inv{i}.pdf")
+            with fitz.open() as doc:
+                doc.new_page(width=300, height=200).insert_text((50, 100), f"invoice {i}")
+                doc.save(path)
+            self.files.append(path)
+        PDFEngine.sheet_cache.clear()
+    
+    def tearDown(self):
+        PDFEngine.sheet_cache.clear()
+        PDFEngine.source_cache.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_only_changed_sheets_recomposed(self):
+        """测试追加发票时只新增变化的页"""
+        doc = PDFEngine.merge(self.files[:4], mode="1x2")
+        self.assertEqual(len(doc), 2)
+        doc.close()
+        self.assertEqual(len(PDFEngine.sheet_cache), 2)
+        
+        doc = PDFEngine.merge(self.files, mode="1x2")
+        self.assertEqual(len(doc), 3)
+        self.assertIn("invoice 4", doc[2].get_text())
+        doc.close()
+        self.assertEqual(len(PDFEngine.sheet_cache), 3)
+    
+    def test_sheet_key_tracks_layout_and_file(self):
+        """测试排版参数或文件变化时页键随之变化"""
+        key = PDFEngine.plan_sheets(self.files[:1], "1x1", "A4", "V", True)[0][0]
+        self.assertEqual(key, PDFEngine.plan_sheets(self.files[:1], "1x1", "A4", "V", True)[0][0])
+        self.assertNotEqual(key, PDFEngine.plan_sheets(self.files[:1], "1x1", "A5", "V", True)[0][0])
+        self.assertNotEqual(key, PDFEngine.plan_sheets(self.files[:1], "1x1", "A4", "H", True)[0][0])
+        
+        st = os.stat(self.files[0])
+        os.utime(self.files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertNotEqual(key, PDFEngine.plan_sheets(self.files[:1], "1x1", "A4", "V", True)[0][0])
+    
+    def test_output_cache(self):
+        """测试同一组页输出到同一路径时判定为可复用"""
+        out_path = os.path.join(self.tmp_dir, "out.pdf")
+        job_key = tuple(k for k, _ in PDFEngine.plan_sheets(self.files, "2x2"))
+        PDFEngine.merge(self.files, mode="2x2", out_path=out_path)
+        self.assertFalse(PDFEngine.sheet_cache.is_output_current(out_path, job_key))
+        
+        PDFEngine.sheet_cache.record_output(out_path, job_key)
+        self.assertTrue(PDFEngine.sheet_cache.is_output_current(out_path, job_key))
+        
+        PDFEngine.merge(self.files[:1], mode="2x2", out_path=out_path)
+        self.assertFalse(PDFEngine.sheet_cache.is_output_current(out_path, job_key))
+
+
+class TestPdfWorkerStreaming(unittest.TestCase):
+    """PdfWorker 流式/分卷输出测试用例"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(5):
+            path = os.path.join(self.tmp_dir, f"inv{i}.pdf")
+            with fitz.open() as doc:
+                doc.new_page(width=300, height=200).insert_text((50, 100), f"invoice {i}")
+                doc.save(path)
+            self.files.append(path)
+        self.out_path = os.path.join(self.tmp_dir, "Print_Job.pdf")
+    
+    def tearDown(self):
+        PDFEngine.sheet_cache.clear()
+        PDFEngine.source_cache.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def test_split_by_pages(self):
+        """测试按页数分卷"""
+        worker = PdfWorker(self.files, "1x1", out_path=self.out_path, split_pages=2)
+        ready = []
+        worker.part_ready.connect(ready.append)
+        worker.run()
+        
+        self.assertEqual(ready, worker.parts)
+        self.assertEqual([os.path.basename(p) for p in worker.parts],
+                         ["Print_Job_001.pdf", "Print_Job_002.pdf", "Print_Job_003.pdf"])
+        counts = []
+        for part in worker.parts:
+            with fitz.open(part) as doc:
+                counts.append(len(doc))
+        self.assertEqual(counts, [2, 2, 1])
+    
+    def test_streaming_single_file(self):
+        """测试流式写盘生成单个文件"""
+        worker = PdfWorker(self.files, "1x1", out_path=self.out_path)
+        worker.STREAM_THRESHOLD = 1
+        worker.FLUSH_PAGES = 2
+        worker.run()
+        
+        self.assertEqual(worker.parts, [])
+        with fitz.open(self.out_path) as doc:
+            self.assertFalse(doc.is_repaired)  # 多次增量写盘后文件结构完整
+            self.assertEqual(len(doc), 5)
+            self.assertIn("invoice 4", doc[4].get_text())
+    
+    def test_streaming_compact(self):
+        """测试流式写盘时逐批压缩：不整体重新打开输出文件，内容完整并记录前后大小"""
+        worker = PdfWorker(self.files, "1x1", out_path=self.out_path, compact=True)
+        worker.STREAM_THRESHOLD = 1
+        worker.FLUSH_PAGES = 2
+        with mock.patch.object(PDFEngine, "compact_file", side_effect=AssertionError("整体压缩")):
+            worker.run()
+        
+        self.assertEqual(len(worker.size_report), 1)
+        path, before, after = worker.size_report[0]
+        self.assertEqual((path, after), (self.out_path, os.path.getsize(self.out_path)))
+        self.assertLess(after, before)
+        with fitz.open(self.out_path) as doc:
+            self.assertFalse(doc.is_repaired)
+            self.assertEqual(len(doc), 5)
+            for i in range(5):
+                self.assertIn(f"invoice {i}", doc[i].get_text())
+    
+    def test_streaming_cancel_removes_partial(self):
+        """测试流式写盘中取消：删除未完成的文件，已完成的分卷保留"""
+        for split_pages in (0, 2):
+            worker = PdfWorker(self.files, "1x1", out_path=self.out_path, split_pages=split_pages, compact=False)
+            worker.STREAM_THRESHOLD = 1
+            worker.FLUSH_PAGES = 1
+            finished = []
+            worker.finished.connect(finished.append)
+            worker.progress.connect(lambda cur, total: cur == 4 and worker.cancel())
+            worker.run()
+            
+            self.assertEqual(finished, [])
+            self.assertFalse(os.path.exists(self.out_path))
+            self.assertEqual(sorted(f for f in os.listdir(self.tmp_dir) if f.startswith("Print_Job")),
+                             [os.path.basename(p) for p in worker.parts])
+            self.assertEqual(len(worker.parts), 1 if split_pages else 0)
+            for p in worker.parts: os.remove(p)
+    
+    def test_parallel_layout(self):
+        """测试多进程并行排版：页序与逐页排版一致，进度到达总数"""
+        worker = PdfWorker(self.files * 6, "1x1", out_path=self.out_path, processes=2, compact=False)
+        worker.PARALLEL_MIN_SHEETS = 4
+        progress = []
+        worker.progress.connect(lambda cur, total: progress.append((cur, total)))
+        worker.run()
+        
+        self.assertEqual(progress[-1], (30, 30))
+        with fitz.open(self.out_path) as doc:
+            self.assertEqual(len(doc), 30)
+            for i in range(30):
+                self.assertIn(f"invoice {i % 5}", doc[i].get_text())
+    
+    def test_parallel_cancel(self):
+        """测试并行排版中取消：排版生成器提前结束时不写出文件、不记录输出、不发出 finished"""
+        worker = PdfWorker(self.files, "1x1", out_path=self.out_path, compact=False)
+        
+        def pages(sheets):  # 与并行排版一致：等待分段时发现取消，直接结束而不再产出页
+            with fitz.open(self.files[0]) as src:
+                yield src, 0
+            worker.cancel()
+        
+        worker._iter_pages = pages
+        finished = []
+        worker.finished.connect(finished.append)
+        worker.run()
+        
+        self.assertEqual(finished, [])
+        self.assertFalse(os.path.exists(self.out_path))
+        self.assertNotIn(self.out_path, PDFEngine.sheet_cache._outputs)
+    
+    def test_output_reuse_follows_settings(self):
+        """测试输出设置相同时复用已生成的文件，压缩等设置改变后重新生成"""
+        def run(**kwargs):
+            worker = PdfWorker(self.files, "1x1", out_path=self.out_path, **kwargs)
+            progress = []
+            worker.progress.connect(lambda cur, total: progress.append(cur))
+            worker.run()
+            return len(progress) > 1  # 复用时只发出一次完成进度
+        
+        self.assertTrue(run(compact=False))
+        self.assertFalse(run(compact=False))
+        self.assertTrue(run(compact=True))
+        self.assertTrue(run(compact=True, image_dpi=72))
+        self.assertFalse(run(compact=True, image_dpi=72))
+    
+    def test_compact_output(self):
+        """测试压缩输出：文件不变大且内容完整，并记录压缩前后大小"""
+        worker = PdfWorker(self.files, "1x1", out_path=self.out_path)
+        worker.run()
+        
+        self.assertEqual(len(worker.size_report), 1)
+        path, before, after = worker.size_report[0]
+        self.assertEqual(path, self.out_path)
+        self.assertLessEqual(after, before)
+        self.assertEqual(os.path.getsize(self.out_path), after)
+        with fitz.open(self.out_path) as doc:
+            self.assertEqual(len(doc), 5)
+            self.assertIn("invoice 2", doc[2].get_text())
+        
+        before, after = PDFEngine.compact_file(self.out_path)
+        self.assertLessEqual(after, before)
+        self.assertFalse(os.path.exists(self.out_path + ".compact"))
+
+
+class TestPreviewWorker(unittest.TestCase):
+    """PreviewWorker 预览渲染测试用例"""
+    
+    @classmethod
+    def setUpClass(cls):
+        from PyQt6.QtGui import QGuiApplication
+        cls.app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir, f"inv{i}.pdf")
+            with fitz.open() as doc:
+                doc.new_page(width=300, height=200).insert_text((50, 100), f"invoice {i}")
+                doc.save(path)
+            self.files.append(path)
+    
+    def tearDown(self):
+        PDFEngine.sheet_cache.clear()
+        PDFEngine.source_cache.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+    
+    def _run(self, worker, until):
+        """同步运行预览线程，收到 until 页后取消"""
+        planned, sheets = [], []
+        worker.planned.connect(lambda gen, keys: planned.append((gen, keys)))
+        worker.sheet_ready.connect(lambda gen, i, img: sheets.append((gen, i, img)) or (i == until and worker.cancel()))
+        worker.run()
+        return planned, sheets
+    
+    def test_requested_sheets_rendered(self):
+        """测试只渲染请求的页并逐页发出，横向排版旋转显示"""
+        worker = PreviewWorker(7, self.files, "1x1", orient="H", scale=1.0)
+        worker.request([2, 0])
+        planned, sheets = self._run(worker, until=0)
+        self.assertEqual(len(planned), 1)
+        gen, keys = planned[0]
+        self.assertEqual((gen, len(keys)), (7, 3))
+        self.assertEqual([(g, i) for g, i, _ in sheets], [(7, 2), (7, 0)])
+        self.assertGreater(sheets[0][2].width(), sheets[0][2].height())
+    
+    def test_new_request_replaces_pending(self):
+        worker = PreviewWorker(1, self.files, "1x1", scale=1.0)
+        worker.request([0, 2])
+        worker.request([1])
+        _, sheets = self._run(worker, until=1)
+        self.assertEqual([i for _, i, _ in sheets], [1])
+    
+    def test_cancelled_emits_nothing(self):
+        worker = PreviewWorker(1, self.files, "1x1", scale=1.0)
+        worker.request([0])
+        worker.cancel()
+        self.assertEqual(self._run(worker, until=0), ([], []))
+
+class TestTileWorker(unittest.TestCase):
+    """TileWorker 分块渲染测试用例"""
+    
+    @classmethod
+    def setUpClass(cls):
+        from PyQt6.QtGui import QGuiApplication
+        cls.app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+    
+    def test_tiles_match_full_render(self):
+        """测试图块拼接结果与整页渲染一致，图块尺寸不随页面大小变化"""
+        from PyQt6.QtGui import QImage, QPainter
+        with fitz.open() as doc:
+            page = doc.new_page(width=595, height=842)
+            page.draw_rect(fitz.Rect(100, 100, 400, 700), color=(1, 0, 0), fill=(0, 0, 1))
+            page.insert_text((120, 300), "invoice", fontsize=40)
+            zoom = 1.5
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            full = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888).copy()
+            
+            canvas = QImage(full.size(), QImage.Format.Format_RGB888)
+            painter = QPainter(canvas)
+            T = TileWorker.TILE
+            for ty in range((full.height() + T - 1) // T):
+                for tx in range((full.width() + T - 1) // T):
+                    img, x, y = TileWorker.render_tile(page, zoom, tx, ty)
+                    self.assertEqual((x, y), (tx * T, ty * T))
+                    self.assertLessEqual(max(img.width(), img.height()), T)
+                    painter.drawImage(x, y, img)
+            painter.end()
+            self.assertEqual(canvas, full)
+    
+    def test_request_renders_in_background(self):
+        with fitz.open() as doc:
+            doc.new_page(width=595, height=842)
+            data = doc.tobytes()
+        worker = TileWorker()
+        ready = []
+        worker.tile_ready.connect(lambda key, img, x, y: ready.append(key))
+        worker.set_document("doc", data)
+        worker.request([("doc", 2.0, 0, 0), ("doc", 2.0, 1, 0), ("other", 2.0, 0, 0)])
+        worker.wait()
+        self.app.processEvents()
+        self.assertEqual(ready, [("doc", 2.0, 0, 0), ("doc", 2.0, 1, 0)])
+        self.assertFalse(worker.isRunning())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,140 @@
+"""
+打印引擎单元测试
+"""
+import os
+import sys
+import unittest
+import shutil
+import tempfile
+import subprocess
+from unittest import mock
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QGuiApplication, QImage
+from PyQt6.QtPrintSupport import QPrinter
+from src.core.print_engine import PrinterEngine
+from src.core.workers import PrintWorker
+
+
+class TestPrinterEngine(unittest.TestCase):
+    """PrinterEngine 测试用例"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+
+    def setUp(self):
+        PrinterEngine._direct_support.clear()
+
+    def test_render_page_fits_paint_rect(self):
+        """测试按打印区域像素尺寸只渲染一次并居中"""
+        with fitz.open() as doc:
+            page = doc.new_page(width=595, height=842)
+            rect = QRect(10, 20, 1190, 1800)
+            img, x, y = PrinterEngine.render_page(page, rect)
+            self.assertEqual(img.width(), 1190)
+            self.assertLessEqual(img.height(), 1800)
+            self.assertEqual(x, 10)
+            self.assertEqual(y, 20 + (1800 - img.height()) // 2)
+
+            img, _, _ = PrinterEngine.render_page(page, rect, force_rotate=True)
+            self.assertGreater(img.width(), img.height())
+
+    def test_render_color_modes(self):
+        """测试灰度与 1 位黑白模式直接输出对应格式的图像"""
+        with fitz.open() as doc:
+            page = doc.new_page(width=595, height=842)
+            page.insert_text((50, 100), "invoice", color=(1, 0, 0))
+            rect = QRect(0, 0, 595, 842)
+            sizes = {}
+            for mode, fmt in [("rgb", QImage.Format.Format_RGB888), ("gray", QImage.Format.Format_Grayscale8),
+                              ("mono", QImage.Format.Format_Mono), ("dither", QImage.Format.Format_Mono)]:
+                img, _, _ = PrinterEngine.render_page(page, rect, color_mode=mode)
+                self.assertEqual(img.format(), fmt)
+                sizes[mode] = img.sizeInBytes()
+            self.assertLess(sizes["gray"] * 2, sizes["rgb"])
+            self.assertLess(sizes["mono"] * 6, sizes["gray"])
+
+    @mock.patch("src.core.print_engine.platform.system", return_value="Linux")
+    @mock.patch("src.core.print_engine.shutil.which", return_value="/usr/bin/lp")
+    @mock.patch("src.core.print_engine.subprocess.run")
+    def test_direct_support_detection(self, run, which, system):
+        """测试 CUPS 队列检测：raw 队列不直接接收 PDF，结果按打印机缓存"""
+        run.return_value = subprocess.CompletedProcess([], 0, "printer-make-and-model='HP LaserJet' copies=1", "")
+        self.assertTrue(PrinterEngine.supports_direct_pdf("office"))
+        run.return_value = subprocess.CompletedProcess([], 0, "printer-make-and-model='Local Raw Printer'", "")
+        self.assertFalse(PrinterEngine.supports_direct_pdf("raw"))
+        self.assertTrue(PrinterEngine.supports_direct_pdf("office"))
+        self.assertEqual(run.call_count, 2)
+
+    @mock.patch("src.core.print_engine.platform.system", return_value="Windows")
+    def test_no_direct_on_windows(self, system):
+        self.assertFalse(PrinterEngine.supports_direct_pdf("office"))
+
+    @mock.patch("src.core.print_engine.os.path.getsize", return_value=1024)
+    @mock.patch("src.core.print_engine.subprocess.run")
+    def test_submit_pdf(self, run, getsize):
+        """测试 lp 提交参数与失败信息"""
+        run.return_value = subprocess.CompletedProcess([], 0, "request id is office-12 (1 file(s))", "")
+        self.assertEqual(PrinterEngine.submit_pdf("/tmp/Print_Job.pdf", "office", 2), (True, "发送成功"))
+        cmd = run.call_args[0][0]
+        self.assertEqual(cmd[:5], ["lp", "-d", "office", "-n", "2"])
+        self.assertEqual(cmd[-1], "/tmp/Print_Job.pdf")
+        self.assertNotIn("print-color-mode=monochrome", cmd)
+        PrinterEngine.submit_pdf("/tmp/Print_Job.pdf", "office", color_mode="gray")
+        self.assertIn("print-color-mode=monochrome", run.call_args[0][0])
+
+        run.return_value = subprocess.CompletedProcess([], 1, "", "lp: The printer or class does not exist.")
+        self.assertEqual(PrinterEngine.submit_pdf("/tmp/Print_Job.pdf", "nope"),
+                         (False, "lp: The printer or class does not exist."))
+
+
+class TestPrintWorker(unittest.TestCase):
+    """PrintWorker 光栅打印测试用例（输出到 PDF 文件代替真实打印机）"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.tmp_dir, "Print_Job.pdf")
+        with fitz.open() as doc:
+            for i in range(5):
+                doc.new_page(width=200, height=280).insert_text((20, 40), f"page {i}")
+            doc.save(self.pdf_path)
+        self.printer = QPrinter(QPrinter.PrinterMode.HighResolution)
+        self.printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
+        self.printer.setOutputFileName(os.path.join(self.tmp_dir, "spool.pdf"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_render_ahead_prints_all_pages_in_order(self):
+        """测试预渲染流水线按顺序输出全部页面"""
+        worker = PrintWorker(self.pdf_path, self.printer, direct=False, prefetch=2)
+        progress, result = [], []
+        worker.progress.connect(lambda cur, total: progress.append(cur))
+        worker.finished.connect(lambda ok, msg: result.append(ok))
+        worker.run()
+
+        self.assertEqual(result, [True])
+        self.assertEqual(progress, [1, 2, 3, 4, 5])
+        with fitz.open(os.path.join(self.tmp_dir, "spool.pdf")) as doc:
+            self.assertEqual(len(doc), 5)
+
+    def test_render_error_reported(self):
+        """测试渲染线程出错时任务失败"""
+        worker = PrintWorker(os.path.join(self.tmp_dir, "missing.pdf"), self.printer, direct=False)
+        result = []
+        worker.finished.connect(lambda ok, msg: result.append(ok))
+        worker.run()
+        self.assertEqual(result, [False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+"""
+打印队列单元测试
+"""
+import os
+import sys
+import unittest
+import shutil
+import tempfile
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QEventLoop, QTimer
+from PyQt6.QtGui import QGuiApplication
+from PyQt6.QtPrintSupport import QPrinter
+from src.core import print_queue
+from src.core.print_queue import PrintQueueStore, PrintQueueManager
+
+
+class TestPrintQueue(unittest.TestCase):
+    """PrintQueueStore / PrintQueueManager 测试用例（输出到 PDF 文件代替真实打印机）"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "queue.db")
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir, f"invoice_{i}.pdf")
+            with fitz.open() as doc:
+                doc.new_page(width=400, height=250).insert_text((20, 40), f"invoice {i}")
+                doc.save(path)
+            self.files.append(path)
+        self.spooled = []  # 每次打印生成的假打印机输出文件
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _printer(self, name):
+        if name == "offline":
+            raise RuntimeError("找不到打印机 offline")
+        printer = QPrinter(QPrinter.PrinterMode.HighResolution)
+        printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
+        path = os.path.join(self.tmp_dir, f"spool_{len(self.spooled)}.pdf")
+        printer.setOutputFileName(path)
+        self.spooled.append(path)
+        return printer
+
+    def _manager(self):
+        return PrintQueueManager(PrintQueueStore(self.db_path), self._printer, os.path.join(self.tmp_dir, "jobs"))
+
+    def _wait_idle(self, manager, timeout=60000):
+        loop = QEventLoop()
+        manager.queue_idle.connect(loop.quit)
+        QTimer.singleShot(timeout, loop.quit)
+        loop.exec()
+
+    def test_store_roundtrip(self):
+        """测试任务字段持久化"""
+        store = PrintQueueStore(self.db_path)
+        job_id = store.add({"name": "批次", "files": self.files, "printer": "office", "mode": "2x2",
+                            "cutline": True, "status": print_queue.QUEUED, "outputs": []})
+        job = PrintQueueStore(self.db_path).get_all()[0]
+        self.assertEqual(job["id"], job_id)
+        self.assertEqual(job["files"], self.files)
+        self.assertIs(job["cutline"], True)
+        store.delete([job_id])
+        self.assertEqual(store.get_all(), [])
+
+    def test_jobs_run_in_order(self):
+        """测试多个任务按提交顺序排版、打印，完成后删除打印文件并记录耗时"""
+        manager = self._manager()
+        first = manager.submit(self.files, "pdf", mode="2x2")
+        second = manager.submit(self.files[:1], "pdf", mode="1x1", copies=2)
+        self._wait_idle(manager)
+
+        jobs = {job["id"]: job for job in manager.jobs()}
+        for job_id in (first, second):
+            job = jobs[job_id]
+            self.assertEqual(job["status"], print_queue.DONE)
+            self.assertLessEqual(job["layout_started"], job["layout_finished"])
+            self.assertLessEqual(job["print_started"], job["print_finished"])
+            self.assertFalse(any(os.path.exists(p) for p in job["outputs"]))
+        self.assertLessEqual(jobs[first]["print_finished"], jobs[second]["print_started"])
+        self.assertEqual(len(self.spooled), 2)
+        self.assertTrue(all(os.path.exists(p) for p in self.spooled))
+
+    def test_failed_job_retry(self):
+        """测试打印机不可用时任务失败，重试后完成，重试次数持久化"""
+        manager = self._manager()
+        failed = []
+        manager.job_failed.connect(lambda job_id, msg: failed.append(job_id))
+        job_id = manager.submit(self.files, "offline")
+        self._wait_idle(manager)
+        self.assertEqual(failed, [job_id])
+        self.assertEqual(manager.get(job_id)["status"], print_queue.FAILED)
+
+        manager.printer_factory = lambda name: self._printer("pdf")
+        self.assertTrue(manager.retry(job_id))
+        self._wait_idle(manager)
+        job = self._manager().get(job_id)
+        self.assertEqual(job["status"], print_queue.DONE)
+        self.assertEqual(job["attempts"], 2)
+        self.assertIsNone(job["error"])
+
+    def test_missing_file_fails_without_layout(self):
+        manager = self._manager()
+        job_id = manager.submit(self.files + [os.path.join(self.tmp_dir, "gone.pdf")], "pdf")
+        self.assertEqual(manager.get(job_id)["status"], print_queue.FAILED)
+        self.assertIsNone(manager.pdf_worker)
+
+    def test_recover_after_restart(self):
+        """测试重启后：排版中的任务重新排队，已开始打印的任务标记失败"""
+        store = PrintQueueStore(self.db_path)
+        layout_id = store.add({"name": "a", "files": self.files, "printer": "pdf", "mode": "1x1",
+                               "status": print_queue.LAYOUT, "outputs": []})
+        printing_id = store.add({"name": "b", "files": self.files, "printer": "pdf", "mode": "1x1",
+                                 "status": print_queue.PRINTING, "outputs": [], "printed": 1})
+        manager = self._manager()
+        self.assertEqual(manager.get(layout_id)["status"], print_queue.QUEUED)
+        self.assertEqual(manager.get(printing_id)["status"], print_queue.FAILED)
+
+        manager.resume()
+        self._wait_idle(manager)
+        self.assertEqual(manager.get(layout_id)["status"], print_queue.DONE)
+        self.assertEqual(manager.clear_history(), 1)
+        self.assertEqual([job["id"] for job in PrintQueueStore(self.db_path).get_all()], [printing_id])
+
+    def test_shutdown_while_printing(self):
+        """测试打印中退出：在页间停止，立即保存最终状态（失败并注明已发送页数），重启后不会被当作中断任务"""
+        files = self.files * 20
+        manager = self._manager()
+        job_id = manager.submit(files, "pdf")
+        loop = QEventLoop()
+        manager.job_progress.connect(lambda i, stage, cur, total: stage == "print" and loop.quit())
+        QTimer.singleShot(60000, loop.quit)
+        loop.exec()
+        manager.shutdown()
+        self.assertIsNone(manager.print_worker)
+
+        job = PrintQueueStore(self.db_path).get_all()[0]
+        self.assertEqual(job["status"], print_queue.FAILED)
+        self.assertRegex(job["error"], r"已发送 \d+/60 页")
+        self.assertEqual(self._manager().get(job_id)["error"], job["error"])
+
+    def test_cancel_queued_job(self):
+        manager = self._manager()
+        first = manager.submit(self.files, "pdf")
+        second = manager.submit(self.files, "pdf")
+        self.assertTrue(manager.cancel(second))
+        self.assertFalse(manager.retry(first))
+        self._wait_idle(manager)
+        self.assertEqual(manager.get(first)["status"], print_queue.DONE)
+        self.assertEqual(manager.get(second)["status"], print_queue.CANCELLED)
+        self.assertEqual(len(self.spooled), 1)
+
+    def test_cancel_layout_ignores_late_signals(self):
+        """测试排版中取消：已排入事件队列的排版信号晚到时被忽略，不影响下一个任务"""
+        manager = self._manager()
+        first = manager.submit(self.files, "pdf")
+        second = manager.submit(self.files, "pdf")
+        self.assertTrue(manager.cancel(first))
+        worker = manager.pdf_worker
+        self.assertIsNotNone(worker)  # 第二个任务已开始排版
+        manager._on_layout_error(first, "late")
+        manager._on_layout_finished(first, os.path.join(self.tmp_dir, "late.pdf"))
+        self.assertIs(manager.pdf_worker, worker)
+        self.assertEqual(manager.get(first)["status"], print_queue.CANCELLED)
+        self._wait_idle(manager)
+        self.assertEqual(manager.get(second)["status"], print_queue.DONE)
+        self.assertEqual(len(self.spooled), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
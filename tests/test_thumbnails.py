@@ -0,0 +1,118 @@
+"""
+缩略图缓存单元测试
+"""
+import os
+import sys
+import time
+import shutil
+import unittest
+import tempfile
+
+import fitz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QEventLoop, QTimer
+from PyQt6.QtGui import QGuiApplication
+from src.core.thumbnails import ThumbnailCache, ThumbnailService
+
+
+class TestThumbnailCache(unittest.TestCase):
+    """ThumbnailCache / ThumbnailService 测试用例"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ThumbnailCache(os.path.join(self.tmp_dir, "thumbs"))
+        self.files = []
+        for i in range(4):
+            path = os.path.join(self.tmp_dir, f"inv{i}.pdf")
+            with fitz.open() as doc:
+                doc.new_page(width=600, height=400).insert_text((50, 100), f"invoice {i}", fontsize=30)
+                doc.save(path)
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_render_once_and_hit_by_content(self):
+        """测试首次渲染后命中磁盘缓存，文件改名后按内容仍命中"""
+        self.assertIsNone(self.cache.get(self.files[0], (80, 80)))
+        img = self.cache.image(self.files[0], (80, 80))
+        self.assertEqual(img.width(), 80)
+        self.assertLess(img.height(), 60)
+
+        moved = os.path.join(self.tmp_dir, "renamed.pdf")
+        shutil.copy(self.files[0], moved)
+        cached = ThumbnailCache(self.cache.cache_dir).get(moved, (80, 80))
+        self.assertIsNotNone(cached)
+        self.assertEqual(cached.size(), img.size())
+        self.assertIsNone(self.cache.get(moved, (40, 40)))
+
+    def test_lru_eviction_under_budget(self):
+        """测试超出字节预算时淘汰最久未用的缩略图"""
+        self.cache.image(self.files[0], (200, 200))
+        size = self.cache._total
+        self.cache.max_bytes = int(size * 2.5)
+        time.sleep(0.01)
+        self.cache.image(self.files[1], (200, 200))
+        time.sleep(0.01)
+        self.cache.get(self.files[0], (200, 200))  # 最近使用
+        time.sleep(0.01)
+        self.cache.image(self.files[2], (200, 200))
+
+        self.assertLessEqual(self.cache._total, self.cache.max_bytes)
+        self.assertIsNone(self.cache.get(self.files[1], (200, 200)))
+        self.assertIsNotNone(self.cache.get(self.files[0], (200, 200)))
+        self.assertIsNotNone(self.cache.get(self.files[2], (200, 200)))
+
+    def test_service_loads_in_background(self):
+        service = ThumbnailService(self.cache, size=(80, 80))
+        ready = []
+        loop = QEventLoop()
+        service.thumbnail_ready.connect(lambda path, img: ready.append(path) or (len(ready) == 2 and loop.quit()))
+        self.assertIsNone(service.request(self.files[0]))
+        self.assertIsNone(service.request(self.files[0]))  # 重复请求不重复提交
+        service.request(os.path.join(self.tmp_dir, "missing.pdf"))
+        QTimer.singleShot(10000, loop.quit)
+        loop.exec()
+        service.shutdown()
+
+        self.assertEqual(sorted(ready), sorted([self.files[0], os.path.join(self.tmp_dir, "missing.pdf")]))
+        self.assertFalse(service.request(self.files[0]).isNull())
+
+
+    def test_hashes_bounded(self):
+        """测试内容哈希表按最近使用淘汰"""
+        self.cache.hash_items = 2
+        for path in self.files:
+            self.cache.content_hash(path)
+        self.assertEqual([stamp[0] for stamp in self.cache._hashes], self.files[2:])
+
+    def test_service_reloads_replaced_file(self):
+        """测试文件被原地替换后重新加载缩略图，而不是返回旧图"""
+        service = ThumbnailService(self.cache, size=(80, 80))
+        loop = QEventLoop()
+        service.thumbnail_ready.connect(lambda path, img: loop.quit())
+
+        def load():
+            QTimer.singleShot(10000, loop.quit)
+            service.request(self.files[0]); loop.exec()
+            return service.request(self.files[0])
+
+        old = load()
+        with fitz.open() as doc:  # 换成竖版页面
+            doc.new_page(width=400, height=600).insert_text((50, 100), "replaced", fontsize=30)
+            doc.save(self.files[0] + ".new")
+        os.replace(self.files[0] + ".new", self.files[0])
+        self.assertIsNone(service.request(self.files[0]))
+        new = load()
+        service.shutdown()
+        self.assertGreater(old.width(), old.height())
+        self.assertLess(new.width(), new.height())
+
+if __name__ == '__main__':
+    unittest.main()